@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: spawn latency of run_cmd_async via /bin/sh vs exec.
+
+Runs a few hundred lavacli-style command lines one after another, once
+through the shell (the previous spawn path) and once with
+create_subprocess_exec, and prints latency statistics per mode.
+
+    python benchmarks/bench_spawn.py [-n 300] [--program /usr/bin/true]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from srt_build.core import run_cmd_async  # noqa: E402
+
+
+def lavacli_argv(program, i):
+    """Command line shaped like a job submission for the i-th split file."""
+    return [program, "jobs", "submit", f"/tmp/srt-build/test-stress-ng-{i}-c2d.yaml"]
+
+
+async def measure(program, count, shell):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        (ret, _) = await run_cmd_async(lavacli_argv(program, i), shell=shell)
+        latencies.append(time.perf_counter() - start)
+        if ret:
+            raise SystemExit(f"{program} failed with exit code {ret}")
+    return latencies
+
+
+def report(name, latencies):
+    ms = sorted(x * 1000 for x in latencies)
+    p95 = ms[int(len(ms) * 0.95) - 1]
+    print(
+        f"{name:6} n={len(ms):4} total={sum(ms) / 1000:7.3f}s "
+        f"mean={statistics.mean(ms):7.3f}ms median={statistics.median(ms):7.3f}ms "
+        f"p95={p95:7.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=300)
+    parser.add_argument(
+        "--program",
+        default=shutil.which("true"),
+        help="executable standing in for lavacli; use a full path so the "
+        "shell cannot treat it as a builtin (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # warm up page cache and the event loop child watcher
+    loop.run_until_complete(measure(args.program, 5, False))
+
+    report("shell", loop.run_until_complete(measure(args.program, args.count, True)))
+    report("exec", loop.run_until_complete(measure(args.program, args.count, False)))
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
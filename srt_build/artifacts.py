@@ -0,0 +1,262 @@
+"""Content-addressed store of built kernels and a ledger of uploads.
+
+A build is identified by the git tree of the kernel source (plus a hash
+of uncommitted changes), the hash of the resolved .config and the
+toolchain. Its outputs (image, dtb and the files named by the install
+commands, .config and the kernel release, plus a tarball of the
+installed modules) are kept as blobs
+named by their sha256 under <cache-path>/artifacts, so identical files
+of different builds are stored once. build_tree restores a stored build
+instead of compiling it again.
+
+The upload ledger remembers the sha256 of every file an install command
+has copied. An install whose files all have the recorded hashes for the
+same command is skipped.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+from logging import debug, warning
+
+from .core import run_cmd
+from .helpers import install_files
+
+MODULES_TAR = "modules.tar"
+
+# restored with every build: later make steps and kexec --wait read them
+KERNEL_FILES = (".config", "include/config/kernel.release")
+
+_ledger_lock = threading.Lock()
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def tree_state():
+    """Return (tree hash, hash of uncommitted changes), or None outside git."""
+    (ret, tree) = run_cmd(["git", "rev-parse", "HEAD^{tree}"], capture=True)
+    if ret:
+        return None
+    (ret, diff) = run_cmd(["git", "diff", "HEAD", "--binary"], capture=True)
+    if ret:
+        return None
+    return (tree.strip(), hashlib.sha256(diff.encode("utf-8")).hexdigest())
+
+
+def build_key(ctx):
+    """Key of the build of ctx.build_path/.config, or None if unknown."""
+    state = tree_state()
+    config = os.path.join(ctx.build_path, ".config")
+    if state is None or not os.path.exists(config):
+        return None
+    data = {
+        "tree": state[0],
+        "changes": state[1],
+        "config": sha256_file(config),
+        "toolchain": [ctx.CROSS_COMPILE, ctx.ARCH, ctx.CC],
+        "target": [ctx.target, ctx.loadaddr, ctx.dtb, ctx.dtb_cmd],
+        "mods": bool(getattr(ctx.args, "mods", False)),
+    }
+    encoded = json.dumps(data, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def build_outputs(ctx):
+    """Files of a build worth storing: outputs and KERNEL_FILES."""
+    names = [n for n in (ctx.image, ctx.dtb, *KERNEL_FILES) if n]
+    for dest in ctx.install or {}:
+        c = ctx.copy()
+        c.args.dest = dest
+        names += install_files(c)
+    files = []
+    for name in names:
+        if name not in files and os.path.isfile(os.path.join(ctx.build_path, name)):
+            files.append(name)
+    return files
+
+
+class ArtifactStore:
+    """Blobs by sha256 and build entries mapping output names to blobs."""
+
+    def __init__(self, path, max_entries=50):
+        self.path = path
+        self.max_entries = max_entries
+
+    def _blob(self, digest):
+        return os.path.join(self.path, "blobs", digest[:2], digest)
+
+    def _entry(self, key):
+        return os.path.join(self.path, "builds", key + ".json")
+
+    def _add_blob(self, src):
+        digest = sha256_file(src)
+        blob = self._blob(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp = f"{blob}.{os.getpid()}.{threading.get_ident()}.tmp"
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, blob)
+        return digest
+
+    def put(self, key, ctx):
+        """Store the outputs of the build in ctx.build_path under key."""
+        entry = {"files": {}, "modules": None}
+        try:
+            for name in build_outputs(ctx):
+                entry["files"][name] = self._add_blob(
+                    os.path.join(ctx.build_path, name)
+                )
+            mods = os.path.join(ctx.build_path, "mods")
+            if getattr(ctx.args, "mods", False) and os.path.isdir(mods):
+                tar = os.path.join(ctx.build_path, MODULES_TAR)
+                with tarfile.open(tar, "w") as t:
+                    t.add(mods, arcname="mods")
+                entry["modules"] = self._add_blob(tar)
+                os.unlink(tar)
+            os.makedirs(os.path.dirname(self._entry(key)), exist_ok=True)
+            with open(self._entry(key), "w") as f:
+                json.dump(entry, f)
+        except OSError as exc:
+            warning(f"Unable to store build {key[:12]}: {exc}")
+            return
+        debug(f"artifacts: stored {key[:12]} {sorted(entry['files'])}")
+        self.prune()
+
+    def restore(self, key, ctx):
+        """Copy the outputs stored under key to ctx.build_path.
+
+        Returns False if key is not stored (or a blob is missing). Files
+        which already have the stored content are left alone.
+        """
+        try:
+            with open(self._entry(key), "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return False
+        blobs = list(entry["files"].values())
+        if entry.get("modules"):
+            blobs.append(entry["modules"])
+        if not all(name in entry["files"] for name in KERNEL_FILES):
+            # stored without the kernel tree state, build again
+            return False
+        if not all(os.path.exists(self._blob(d)) for d in blobs):
+            return False
+        try:
+            for name, digest in entry["files"].items():
+                dst = os.path.join(ctx.build_path, name)
+                if os.path.isfile(dst) and sha256_file(dst) == digest:
+                    continue
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copyfile(self._blob(digest), dst)
+            if entry.get("modules"):
+                shutil.rmtree(os.path.join(ctx.build_path, "mods"), ignore_errors=True)
+                with tarfile.open(self._blob(entry["modules"]), "r") as t:
+                    # extraction filters exist since Python 3.11.4
+                    if hasattr(tarfile, "tar_filter"):
+                        t.extractall(ctx.build_path, filter="tar")
+                    else:
+                        t.extractall(ctx.build_path)
+        except (OSError, tarfile.TarError) as exc:
+            warning(f"Unable to restore build {key[:12]}: {exc}")
+            return False
+        # keep recently used builds when pruning
+        os.utime(self._entry(key))
+        return True
+
+    def prune(self):
+        """Drop the least recently used builds beyond max_entries."""
+        builds = os.path.join(self.path, "builds")
+        try:
+            entries = sorted(
+                (os.path.join(builds, f) for f in os.listdir(builds)),
+                key=os.path.getmtime,
+            )
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+        for path in entries[: len(entries) - self.max_entries]:
+            os.unlink(path)
+        used = set()
+        for path in entries[len(entries) - self.max_entries :]:
+            try:
+                with open(path, "r") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            used.update(entry["files"].values())
+            used.add(entry.get("modules"))
+        for root, _, files in os.walk(os.path.join(self.path, "blobs")):
+            for name in files:
+                if name not in used and not name.endswith(".tmp"):
+                    os.unlink(os.path.join(root, name))
+
+
+class UploadLedger:
+    """sha256 of the files each install command has uploaded."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            debug(f"Ignoring upload ledger {self.path}: {exc}")
+            return {}
+
+    @staticmethod
+    def _key(cmd):
+        return hashlib.sha256(cmd.encode("utf-8")).hexdigest()
+
+    def uploaded(self, cmd, hashes):
+        """True if cmd has uploaded exactly these {file: sha256} already."""
+        with _ledger_lock:
+            record = self._load().get(self._key(cmd))
+        return bool(hashes) and record is not None and record["files"] == hashes
+
+    def record(self, cmd, hashes):
+        with _ledger_lock:
+            ledger = self._load()
+            ledger[self._key(cmd)] = {"files": hashes, "time": time.time()}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp, "w") as f:
+                    json.dump(ledger, f)
+                os.replace(tmp, self.path)
+            except OSError as exc:
+                warning(f"Unable to write upload ledger {self.path}: {exc}")
+
+
+def install_hashes(ctx, cwd):
+    """{file: sha256} of the files the install command of ctx copies."""
+    hashes = {}
+    for name in install_files(ctx):
+        path = os.path.join(cwd, name)
+        if os.path.isfile(path):
+            hashes[name] = sha256_file(path)
+    return hashes
+
+
+def get_store(ctx):
+    return ArtifactStore(
+        os.path.join(ctx.artifact_path, "store"), ctx.artifact_max_builds or 50
+    )
+
+
+def get_ledger(ctx):
+    return UploadLedger(os.path.join(ctx.artifact_path, "uploads.json"))
@@ -0,0 +1,107 @@
+"""Kernel build as a small task graph.
+
+The image, dtbs and modules are independent make goals, so they are
+built by one make invocation; make schedules them together and walks
+the tree once. The steps that consume the outputs (dtb_cmd and
+modules_install) depend only on that build and run concurrently once it
+has finished.
+"""
+
+import collections
+from logging import error
+
+from .core import bounded_gather, run_cmd_checked_async, run_until_complete
+from .helpers import run_make_async
+from .parallelism import make_args
+from .trace import span
+
+# action is a coroutine function called without arguments, returning an
+# exit code
+Task = collections.namedtuple("Task", "name action deps error")
+
+
+def plan(ctx):
+    """Return the tasks building ctx (image, dtbs and optionally modules)."""
+    goals = [ctx.target]
+    if ctx.dtb:
+        goals.append("dtbs")
+    if ctx.args.mods:
+        goals.append("modules")
+    build = [*make_args(ctx), *goals]
+    if ctx.target == "uImage":
+        build.append("LOADADDR={}".format(ctx.loadaddr))
+
+    async def make(args):
+        return (await run_make_async(ctx, args))[0]
+
+    async def dtb_cmd():
+        return (
+            await run_cmd_checked_async(ctx.dtb_cmd, cwd=ctx.build_path, shell=True)
+        )[0]
+
+    tasks = [Task("build", lambda: make(build), (), "build failed")]
+    if ctx.dtb_cmd:
+        tasks.append(Task("dtb_cmd", dtb_cmd, ("build",), "dtb_cmd failed"))
+    if ctx.args.mods:
+        tasks.append(
+            Task(
+                "modules_install",
+                lambda: make(["modules_install"]),
+                ("build",),
+                "module_install failed",
+            )
+        )
+    return tasks
+
+
+async def _run(task):
+    with span(task.name, "build") as args:
+        ret = await task.action()
+        args["ret"] = ret
+    return ret
+
+
+def _ready(pending, done):
+    """Remove and return the pending tasks whose deps are all done."""
+    ready = [t for t in pending.values() if all(dep in done for dep in t.deps)]
+    for t in ready:
+        del pending[t.name]
+    return ready
+
+
+def _check(tasks):
+    names = {t.name for t in tasks}
+    for t in tasks:
+        for dep in t.deps:
+            if dep not in names:
+                raise ValueError(f"task {t.name} depends on unknown task {dep}")
+
+
+async def _execute(tasks):
+    pending = {t.name: t for t in tasks}
+    done = set()
+    while pending:
+        ready = _ready(pending, done)
+        if not ready:
+            raise ValueError(f"dependency cycle in {sorted(pending)}")
+        rets = await bounded_gather(_run, ready, limit=len(ready))
+        failed = [(t, ret) for t, ret in zip(ready, rets) if ret]
+        for t, _ in failed:
+            error(t.error)
+        if failed:
+            return failed[0][1]
+        done.update(t.name for t in ready)
+    return 0
+
+
+def execute(tasks):
+    """Run tasks once their deps are done, independent ones at once.
+
+    The tasks run as coroutines on the current thread's event loop, so
+    Ctrl-C cancels them like any other command. Tasks whose deps are
+    done are started together and waited for; after a failure no further
+    task is started. Returns the exit code of the first failing task,
+    else 0.
+    """
+    _check(tasks)
+    return run_until_complete(_execute(tasks))
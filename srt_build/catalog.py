@@ -0,0 +1,172 @@
+"""Index of the job templates in jobs/<flavor>/<suite>/*.jinja2.
+
+Listing tests or filtering them by job name only needs the ``job_name``
+and the test definitions of a template, which can be read from its
+syntax tree without rendering it. The extracted entries are cached in a
+JSON file and refreshed when a template's mtime or size changes.
+"""
+
+import json
+import os
+from logging import debug, warning
+
+import jinja2
+from jinja2 import nodes
+
+from .config import yaml_load
+
+CATALOG_VERSION = 1
+
+# Stands in for {{ expressions }} when reading the tests block as YAML
+_PLACEHOLDER = "__expr__"
+
+
+def _tests_block_yaml(block):
+    """Text of a template block with every expression replaced."""
+    parts = []
+    for output in block.find_all(nodes.Output):
+        for node in output.nodes:
+            if isinstance(node, nodes.TemplateData):
+                parts.append(node.data)
+            else:
+                parts.append(_PLACEHOLDER)
+    return "".join(parts)
+
+
+def scan_template(path):
+    """Extract job name, test definitions and their parameters of a template.
+
+    Returns a dict with ``job_name`` (falls back to the file name),
+    ``definitions`` (test definition names) and ``parameters`` (parameter
+    names per definition).
+    """
+    entry = {
+        "job_name": os.path.basename(path).replace(".jinja2", ""),
+        "definitions": [],
+        "parameters": {},
+    }
+    try:
+        with open(path, "r") as f:
+            tree = jinja2.Environment().parse(f.read())
+    except (OSError, jinja2.TemplateSyntaxError) as exc:
+        warning(f"Unable to parse template {path}: {exc}")
+        return entry
+
+    for assign in tree.find_all(nodes.Assign):
+        target, value = assign.target, assign.node
+        if (
+            isinstance(target, nodes.Name)
+            and target.name == "job_name"
+            and isinstance(value, nodes.Const)
+        ):
+            entry["job_name"] = str(value.value)
+            break
+
+    for block in tree.find_all(nodes.Block):
+        if block.name != "tests":
+            continue
+        try:
+            tests = yaml_load(_tests_block_yaml(block)) or {}
+            definitions = tests.get("definitions") or []
+        except Exception as exc:
+            debug(f"Unable to read test definitions of {path}: {exc}")
+            break
+        for d in definitions:
+            if not isinstance(d, dict) or "name" not in d:
+                continue
+            name = str(d["name"])
+            entry["definitions"].append(name)
+            entry["parameters"][name] = sorted(d.get("parameters") or {})
+        break
+
+    return entry
+
+
+class Catalog:
+    """Template index backed by a JSON cache file.
+
+    Entries are keyed by template path and carry the mtime and size they
+    were scanned at. Call save() to write back refreshed entries.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.dirty = False
+        if cache_file:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            debug(f"Ignoring template catalog {self.cache_file}: {exc}")
+            return
+        if data.get("version") == CATALOG_VERSION:
+            self.entries = data.get("templates", {})
+
+    def save(self):
+        """Write the cache file if entries changed."""
+        if not self.cache_file or not self.dirty:
+            return
+        data = {"version": CATALOG_VERSION, "templates": self.entries}
+        tmp = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp, self.cache_file)
+            self.dirty = False
+        except OSError as exc:
+            warning(f"Unable to write template catalog {self.cache_file}: {exc}")
+
+    def template(self, path):
+        """Return the (possibly cached) catalog entry of a template."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        entry = self.entries.get(path)
+        if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry
+        entry = scan_template(path)
+        entry["file"] = os.path.basename(path)
+        entry["mtime"] = st.st_mtime_ns
+        entry["size"] = st.st_size
+        self.entries[path] = entry
+        self.dirty = True
+        return entry
+
+    def suite(self, testpath):
+        """Return the entries of all templates in testpath, sorted by file."""
+        try:
+            files = sorted(f for f in os.listdir(testpath) if f.endswith(".jinja2"))
+        except OSError:
+            return []
+        entries = []
+        for file in files:
+            try:
+                entries.append(self.template(os.path.join(testpath, file)))
+            except OSError as exc:
+                debug(f"Skipping template {file}: {exc}")
+        return entries
+
+    def find(self, testpath, job_name):
+        """Return the paths of the templates in testpath named job_name."""
+        return [
+            os.path.join(testpath, e["file"])
+            for e in self.suite(testpath)
+            if e["job_name"] == job_name
+        ]
+
+
+_catalogs = {}
+
+
+def get_catalog(ctx):
+    """Return the catalog cached in the context's cache directory."""
+    path = ctx.catalog_path
+    if path not in _catalogs:
+        _catalogs[path] = Catalog(path)
+    return _catalogs[path]
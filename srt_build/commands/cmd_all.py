@@ -2,7 +2,7 @@
 
 from .cmd_config import cmd_config
 from .cmd_build import cmd_build
-from .cmd_kexec import cmd_kexec
+from .cmd_kexec import add_wait_arguments, cmd_kexec
 
 
 def add_parser(subparser):
@@ -14,14 +14,15 @@ def add_parser(subparser):
     apsg.add_argument("--append", default="")
     apsg.add_argument("--flavor", default="")
     apsg.add_argument("--rootfs", default="")
+    add_wait_arguments(apsg)
     apsg.set_defaults(func=cmd_all)
     return apsg
 
 
-def cmd_all(ctx, kernel_config):
+def cmd_all(ctx, kernel_config, system_config=None):
     """Run config, build, and kexec commands in sequence."""
     cmd_config(ctx, kernel_config)
-    c = cmd_build(ctx)
+    c = cmd_build(ctx, kernel_config)
     if c:
-        return
-    cmd_kexec(ctx)
+        return c
+    return cmd_kexec(ctx, system_config)
@@ -1,9 +1,9 @@
 """Build command - build kernel and modules."""
 
-import multiprocessing
 from logging import error
-from ..core import run_cmd
-from ..helpers import run_make
+from .. import artifacts, buildplan, compiler_cache
+from ..helpers import build_pool
+from .cmd_config import cmd_config
 
 
 def add_parser(subparser):
@@ -12,32 +12,68 @@ def add_parser(subparser):
     bpsr.add_argument("machine", help="Target machine")
     bpsr.set_defaults(func=cmd_build)
     bpsr.add_argument("--mods", default=False, action="store_true")
+    bpsr.add_argument(
+        "--flavors",
+        default="",
+        help="Comma separated flavors to build, each in <builddir>/<flavor> "
+        "(implies --flavor-builddirs)",
+    )
     return bpsr
 
 
-def cmd_build(ctx):
-    """Build kernel, dtbs, and optionally modules."""
-    cmd = ["-j" + str(multiprocessing.cpu_count()), ctx.target]
-    if ctx.target == "uImage":
-        cmd.append("LOADADDR={}".format(ctx.loadaddr))
-    (ret, _) = run_make(ctx, cmd)
-    if ret:
-        error("build failed")
-        return ret
-    if ctx.dtb:
-        (ret, _) = run_make(ctx, ["-j" + str(multiprocessing.cpu_count()), "dtbs"])
-        if ret:
-            return ret
-    if ctx.dtb_cmd:
-        (ret, _) = run_cmd(ctx.dtb_cmd.split(), cwd=ctx.build_path)
+def cmd_build(ctx, kernel_config=None):
+    """Build kernel, dtbs, and optionally modules.
+
+    With a compiler_cache, its hit rate is printed afterwards.
+    """
+    flavors = [f for f in (getattr(ctx.args, "flavors", "") or "").split(",") if f]
+    with compiler_cache.report(ctx.compiler_cache):
+        if flavors:
+            return build_flavors(ctx, flavors, kernel_config or {})
+        return build_tree(ctx)
+
+
+def build_flavors(ctx, flavors, kernel_config):
+    """Build the given flavors, up to --parallel-builds at once.
 
-    if ctx.args.mods:
-        cmd = ["-j" + str(multiprocessing.cpu_count()), "modules"]
-        (ret, _) = run_make(ctx, cmd)
+    Every flavor is configured and built in its own tree, as with
+    --flavor-builddirs: in one shared tree the last flavor's .config
+    would be built for all of them.
+    """
+    ctx = ctx.copy()
+    ctx.args.flavor_builddirs = True
+    ctxs = [ctx.for_flavor(fl) for fl in flavors]
+    for fl, c in zip(flavors, ctxs):
+        ret = cmd_config(c, kernel_config)
         if ret:
-            error("modules")
+            error(f"config of flavor {fl} failed")
             return ret
-        (ret, _) = run_make(ctx, ["modules_install"])
+    parallel = min(max(1, getattr(ctx.args, "parallel_builds", 1) or 1), len(ctxs))
+    if parallel == 1:
+        rets = [build_tree(c) for c in ctxs]
+    else:
+        with build_pool(parallel, ctx.jobs) as pool:
+            rets = list(pool.map(build_tree, ctxs))
+    for fl, ret in zip(flavors, rets):
         if ret:
-            error("module_install failed")
+            error(f"build of flavor {fl} failed")
+            return ret
+    return 0
+
+
+def build_tree(ctx):
+    """Build kernel, dtbs, and optionally modules in ctx.build_path.
+
+    See buildplan for how the make invocations are combined. A build of
+    the same source tree, .config and toolchain found in the artifact
+    store is restored instead.
+    """
+    store = artifacts.get_store(ctx) if ctx.artifact_path else None
+    key = artifacts.build_key(ctx) if store else None
+    if key and store.restore(key, ctx):
+        print(f"Restored build {key[:12]} from artifact store")
+        return 0
+    ret = buildplan.execute(buildplan.plan(ctx))
+    if not ret and key:
+        store.put(key, ctx)
     return ret
@@ -1,10 +1,19 @@
 """Config command - configure kernel build."""
 
 import os
+from logging import error
 from shutil import copyfile
-from ..core import run_cmd
-from ..helpers import run_make
+from ..helpers import resolve_config_fragments, run_make
 from ..config import bcolors
+from ..kconfig import (
+    ConfigCache,
+    cache_key,
+    kernel_version,
+    merge,
+    parse_config,
+    requested_mismatches,
+    write_config,
+)
 
 
 def add_parser(subparser):
@@ -14,6 +23,11 @@ def add_parser(subparser):
     bcpsr.add_argument("--config")
     bcpsr.add_argument("--config-base", default="")
     bcpsr.add_argument("--flavor", default="")
+    bcpsr.add_argument(
+        "--no-config-cache",
+        action="store_true",
+        help="Always run kconfig instead of restoring a cached resolved config",
+    )
     bcpsr.add_argument(
         "--list", action="store_true", help="List available configurations and flavors"
     )
@@ -101,53 +115,78 @@ def _list_configs(ctx, kernel_config):
     _print_table(["Base Config", "Flavor", "Fragments"], krows)
 
 
+def _report_mismatches(cfgs, config):
+    """Print the symbols the fragments request but .config does not have."""
+    mismatches = requested_mismatches(cfgs, config)
+    if not mismatches:
+        return
+    print(
+        f"{bcolors.WARNING}Requested config symbols not set in "
+        f"{config}:{bcolors.ENDC}"
+    )
+    rows = [
+        [symbol, requested, actual or "-", os.path.basename(fragment)]
+        for symbol, requested, actual, fragment in mismatches
+    ]
+    _print_table(["Symbol", "Requested", "Actual", "Fragment"], rows)
+
+
+def merge_fragments(ctx, cfgs):
+    """Apply all fragments to .config in memory and run olddefconfig once.
+
+    Returns the exit code of olddefconfig.
+    """
+    config = ctx.build_path + "/.config"
+    write_config(config, merge(parse_config(config), cfgs))
+    (ret, _) = run_make(ctx, ["olddefconfig"])
+    if ret:
+        error("olddefconfig failed")
+        return ret
+    _report_mismatches(cfgs, config)
+    return 0
+
+
 def cmd_config(ctx, kernel_config):
-    """Configure kernel build based on machine and flavor settings."""
+    """Configure kernel build based on machine and flavor settings.
+
+    A resolved config cached for the same defconfig (or --config),
+    fragments, kernel version and toolchain is restored without running
+    kconfig, unless --no-config-cache.
+    """
     if getattr(ctx.args, "list", False):
         _list_configs(ctx, kernel_config)
         return
-    if not getattr(ctx.args, "config", None):
-        run_make(ctx, [ctx.defconfig])
+    config = ctx.build_path + "/.config"
+    config_file = getattr(ctx.args, "config", None)
+    # with --config only the machine config and --config-base are added
+    cfgs = resolve_config_fragments(ctx, kernel_config, with_flavor=not config_file)
+
+    cache = None
+    if not getattr(ctx.args, "no_config_cache", False):
+        cache = ConfigCache(ctx.kconfig_cache_path)
+        key = cache_key(
+            ctx.defconfig,
+            config_file,
+            cfgs,
+            kernel_version(),
+            (ctx.ARCH, ctx.CROSS_COMPILE, ctx.CC),
+        )
+        if cache.restore(key, config):
+            print(f"Restored resolved config {key[:12]} from cache")
+            _report_mismatches(cfgs, config)
+            return 0
+
+    if not config_file:
+        (ret, _) = run_make(ctx, [ctx.defconfig])
+        if ret:
+            error("defconfig failed")
+            return ret
         # run_make(ctx, ['kvmconfig'])
-
-        cfgs = [ctx.config_path + "/" + ctx.config]
-        config_base = getattr(ctx.args, "config_base", "")
-        for c in kernel_config.get(config_base, []):
-            cfgs += [ctx.config_path + "/" + c]
-        flavor = getattr(ctx.args, "flavor", "")
-        if flavor:
-            for c in kernel_config.get(flavor, []):
-                cfgs += [ctx.config_path + "/" + c]
-
-        for cfg in cfgs:
-            run_cmd(
-                [
-                    "scripts/kconfig/merge_config.sh",
-                    "-m",
-                    "-O",
-                    ctx.build_path,
-                    ctx.build_path + "/.config",
-                    cfg,
-                ]
-            )
-            run_make(ctx, ["olddefconfig"])
     else:
         # use provided config as base
-        copyfile(ctx.args.config, ctx.build_path + "/.config")
-        # add machine config
-        cfgs = [ctx.config_path + "/" + ctx.config]
-        config_base = getattr(ctx.args, "config_base", "")
-        for c in kernel_config.get(config_base, []):
-            cfgs += [ctx.config_path + "/" + c]
-        for cfg in cfgs:
-            run_cmd(
-                [
-                    "scripts/kconfig/merge_config.sh",
-                    "-m",
-                    "-O",
-                    ctx.build_path,
-                    ctx.build_path + "/.config",
-                    cfg,
-                ]
-            )
-            run_make(ctx, ["olddefconfig"])
+        os.makedirs(ctx.build_path, exist_ok=True)
+        copyfile(config_file, config)
+    ret = merge_fragments(ctx, cfgs)
+    if not ret and cache:
+        cache.store(key, config)
+    return ret
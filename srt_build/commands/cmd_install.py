@@ -1,6 +1,8 @@
 """Install command - install kernel to destination."""
 
+from .. import artifacts, install, modules
 from ..core import run_cmd
+from ..ssh import wrap_shell
 
 
 def add_parser(subparser):
@@ -9,18 +11,77 @@ def add_parser(subparser):
     ipsg.add_argument("machine", help="Target machine")
     ipsg.add_argument("--dest")
     ipsg.add_argument("--postfix")
+    ipsg.add_argument(
+        "--mods",
+        default=False,
+        action="store_true",
+        help="Also deploy the installed modules",
+    )
+    ipsg.add_argument(
+        "--force",
+        action="store_true",
+        help="Upload even if the destination has the same files",
+    )
     ipsg.set_defaults(func=cmd_install)
     return ipsg
 
 
 def cmd_install(ctx):
-    """Install kernel to specified destination."""
+    """Install kernel to specified destination.
+
+    Install specs made of file transfers are uploaded by install.upload,
+    which skips files whose destination has the same content. Other
+    install commands are run by the shell and skipped if they uploaded
+    the same files before (see artifacts.UploadLedger) and these are
+    still at their destination. --force uploads
+    in any case. With --mods the installed modules are streamed to the
+    machine's modules destination (see modules.py).
+    """
     dest = "default"
     if ctx.args.dest:
         dest = ctx.args.dest
     postfix = ""
     if ctx.args.postfix:
         postfix = ctx.args.postfix
+    force = getattr(ctx.args, "force", False)
+    # install_path: build outputs staged by the lava --pipeline mode
+    cwd = ctx.install_path or ctx.build_path
+    ret = _install(ctx, dest, postfix, cwd, force)
+    if not ret and getattr(ctx.args, "mods", False) and dest in (ctx.modules or {}):
+        ret = modules.deploy(ctx, ctx.modules[dest].format(postfix), cwd)
+    return ret
+
+
+def _install(ctx, dest, postfix, cwd, force):
+    transfers = install.parse_spec(ctx.install[dest], postfix)
+    if transfers is not None:
+        return install.upload(
+            transfers,
+            cwd,
+            compress_min=ctx.install_compress_min,
+            force=force,
+        )
+
     cmd = ctx.install[dest]
     cmd = cmd.format(postfix)
-    run_cmd(cmd.split(), cwd=ctx.build_path)
+    ledger = artifacts.get_ledger(ctx) if ctx.artifact_path else None
+    hashes = {}
+    if ledger:
+        hashes = artifacts.install_hashes(ctx, cwd)
+        if not force and ledger.uploaded(cmd, hashes) and _installed(cmd, hashes, cwd):
+            print(f"{', '.join(hashes)} already installed to {dest}, skipping")
+            return 0
+    (ret, _) = run_cmd(wrap_shell(cmd), cwd=cwd, shell=True)
+    if not ret and ledger:
+        ledger.record(cmd, hashes)
+    return ret
+
+
+def _installed(cmd, hashes, cwd):
+    """True if the files cmd copies still have the same content there.
+
+    A reboot may have cleared /tmp or the board may have been reflashed
+    since the ledger recorded the upload.
+    """
+    transfers = install.command_transfers(cmd, hashes)
+    return transfers is not None and not install.pending(transfers, cwd)
@@ -1,6 +1,6 @@
 """Jobs cancel command - cancel LAVA jobs."""
 
-from subprocess import run
+from ..lava import get_lava
 from ..helpers import ensure_lavacli_available, get_job_list, get_jobs
 
 
@@ -26,8 +26,11 @@ def cmd_jobs_cancel(ctx, system_config):
     else:
         id = int(ctx.args.id)
 
-    ensure_lavacli_available()
+    ensure_lavacli_available(system_config)
 
-    for j in get_jobs(ctx.args.machine, id, system_config, batch=True):
+    jobs = get_jobs(ctx.args.machine, id, system_config, batch=True)
+    outputs = get_lava(system_config).cancel_all(jobs)
+    for j, (_, res) in zip(jobs, outputs):
         print(j)
-        run(["lavacli", "jobs", "cancel", str(j)])
+        if res.strip():
+            print(res.rstrip())
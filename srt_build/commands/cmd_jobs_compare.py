@@ -21,7 +21,7 @@ def cmd_jobs_compare(ctx, system_config, rt_suites, suites):
         print("Usage: jobs compare <machine> <id1> <id2>")
         return
 
-    ensure_lavacli_available()
+    ensure_lavacli_available(system_config)
 
     try:
         id1 = int(ctx.args.id1)
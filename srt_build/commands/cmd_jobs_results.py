@@ -4,7 +4,7 @@ import re
 from ..config import bcolors
 from ..helpers import ensure_lavacli_available, get_job_list, get_jobs
 from ..results import get_job_context, job_result_print
-from ..core import run_cmd
+from ..lava import get_lava
 
 
 def add_parser(subparser):
@@ -43,9 +43,10 @@ def cmd_jobs_results(ctx, system_config, rt_suites, suites):
         id = int(ctx.args.id)
         batch = ctx.args.batch
 
-    ensure_lavacli_available()
+    ensure_lavacli_available(system_config)
+    lava = get_lava(system_config)
 
-    metadata, job_ctx = get_job_context(id, ctx)
+    metadata, job_ctx = get_job_context(id, ctx, system_config)
     if not metadata or not job_ctx:
         print(
             f"{bcolors.WARNING}Cannot display results for job {id}. "
@@ -54,7 +55,7 @@ def cmd_jobs_results(ctx, system_config, rt_suites, suites):
         return
 
     if ctx.args.raw:
-        (_, res) = run_cmd(["lavacli", "jobs", "logs", str(id)])
+        (_, res) = lava.logs_one(id)
         version = re.compile(r".*Linux version ([-0-9a-zA-Z\.]+)")
         m = version.search(res, re.MULTILINE)
         if m:
@@ -62,7 +63,7 @@ def cmd_jobs_results(ctx, system_config, rt_suites, suites):
         else:
             metadata["version"] = ""
 
-        (_, res) = run_cmd(["lavacli", "results", "--yaml", str(id)])
+        (_, res) = lava.results_all([id])[0]
 
         if ctx.args.host and metadata["host"] != ctx.args.host:
             return
@@ -83,8 +84,9 @@ def cmd_jobs_results(ctx, system_config, rt_suites, suites):
         )
         return
 
-    for j in get_jobs(ctx.args.machine, id, system_config, batch):
-        (_, res) = run_cmd(["lavacli", "results", "--yaml", str(j)])
+    jobs = get_jobs(ctx.args.machine, id, system_config, batch)
+    outputs = lava.results_all(jobs)
+    for j, (_, res) in zip(jobs, outputs):
         job_result_print(
             j,
             job_ctx,
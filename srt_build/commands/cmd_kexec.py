@@ -1,7 +1,37 @@
 """Kexec command - install and kexec kernel on remote machine."""
 
 import os
-from ..core import run_cmd
+import shlex
+import statistics
+import time
+from logging import error, warning
+from ..core import run_cmd, run_cmd_async, run_until_complete
+from ..database import get_boot_times_from_db, save_boot_time_to_db
+from ..ssh import ssh_cmd
+from .cmd_install import cmd_install
+
+# Polls must not go through the shared connection: its master still
+# talks to the kernel that was just replaced.
+POLL_SSH_OPTIONS = [
+    "-o",
+    "ControlPath=none",
+    "-o",
+    "BatchMode=yes",
+    "-o",
+    "ConnectTimeout=5",
+]
+
+# Notice within seconds that the kexec'd kernel dropped the connection.
+KEXEC_SSH_OPTIONS = [
+    "-o",
+    "ControlPath=none",
+    "-o",
+    "ServerAliveInterval=2",
+    "-o",
+    "ServerAliveCountMax=3",
+]
+
+BOOT_ID = "cat /proc/sys/kernel/random/boot_id; uname -r"
 
 
 def add_parser(subparser):
@@ -10,15 +40,81 @@ def add_parser(subparser):
     kpsg.add_argument("machine", help="Target machine")
     kpsg.add_argument("--append", default="")
     kpsg.add_argument("--rootfs", default="")
+    add_wait_arguments(kpsg)
     kpsg.set_defaults(func=cmd_kexec)
     return kpsg
 
 
-def cmd_kexec(ctx):
-    """Install kernel and kexec on remote machine via SSH."""
-    run_cmd(ctx.install["default"].split(), cwd=ctx.build_path)
+def add_wait_arguments(parser):
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="Wait until the new kernel is up and record the boot time",
+    )
+    parser.add_argument(
+        "--wait-timeout",
+        type=int,
+        default=300,
+        help="Seconds to wait for the new kernel (default: 300)",
+    )
+
+
+def built_release(ctx):
+    """Kernel release of the build in ctx.build_path, or None."""
+    path = os.path.join(ctx.build_path, "include", "config", "kernel.release")
+    try:
+        with open(path, "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _boot_state(argv):
+    """(boot id, kernel release) reported by the host, or None."""
+    (ret, output) = run_until_complete(run_cmd_async(argv, capture=True))
+    fields = output.split()
+    if ret or len(fields) != 2:
+        return None
+    return (fields[0], fields[1])
+
+
+def wait_for_kernel(host, old_boot_id, timeout, delay=0.25, max_delay=1.0):
+    """Poll host over ssh, with backoff, until a new kernel answers.
+
+    A kernel counts as new once its boot id differs from old_boot_id.
+    Returns (kernel release, time.monotonic() it answered at), or None
+    after timeout seconds. max_delay bounds how late the answer time
+    can be: a failed poll usually takes ConnectTimeout anyway.
+    """
+    deadline = time.monotonic() + timeout
+    argv = ["ssh", *POLL_SSH_OPTIONS, host, BOOT_ID]
+    while True:
+        state = _boot_state(argv)
+        if state and state[0] != old_boot_id:
+            return (state[1], time.monotonic())
+        if time.monotonic() + delay > deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
 
-    ssh_kexec = ["ssh", ctx.hostname]
+
+def _report_boot_time(ctx, release, seconds, system_config):
+    flavor = getattr(ctx.args, "flavor", None)
+    previous = get_boot_times_from_db(ctx.args.machine, release, system_config)
+    save_boot_time_to_db(ctx.args.machine, release, flavor, seconds, system_config)
+    line = f"{ctx.hostname} is up with {release} after {seconds:.1f}s"
+    if previous:
+        median = statistics.median(p[2] for p in previous)
+        line += f" (median of last {len(previous)}: {median:.1f}s)"
+    print(line)
+
+
+def kexec_cmd(ctx, wait=False):
+    """argv of the ssh call running kexec on ctx.hostname."""
+    if wait:
+        ssh_kexec = ["ssh", *KEXEC_SSH_OPTIONS, ctx.hostname]
+    else:
+        ssh_kexec = ssh_cmd(ctx.hostname)
     if ctx.kexec:
         ssh_kexec += ctx.kexec
     else:
@@ -29,10 +125,63 @@ def cmd_kexec(ctx):
         rootfs = ctx.args.rootfs
     cmdline = ctx.cmdline.format(rootfs=rootfs)
 
-    ssh_kexec += ['--append=\\"' + cmdline + " " + ctx.args.append + '\\"']
+    # ssh hands the arguments to the remote shell, quote for that one
+    ssh_kexec += ["--append=" + shlex.quote(cmdline + " " + ctx.args.append)]
 
     if ctx.dtb:
         ssh_kexec += ["--dtb=" + "/tmp/" + os.path.basename(ctx.dtb)]
     ssh_kexec += ["/tmp/" + os.path.basename(ctx.image)]
+    return ssh_kexec
+
+
+def _kexec_and_wait(ctx, system_config):
+    release = built_release(ctx)
+    if release is None:
+        warning(f"No kernel.release in {ctx.build_path}, not checking uname -r")
+    old = _boot_state(ssh_cmd(ctx.hostname, BOOT_ID))
+    if old is None:
+        # without it the old kernel would pass for the new one
+        error(f"Unable to read the boot id of {ctx.hostname}, not kexecing")
+        return 1
+    start = time.monotonic()
+    # ssh exits with 255 when the new kernel takes over the connection
+    (ret, output) = run_until_complete(
+        run_cmd_async(kexec_cmd(ctx, wait=True), capture=True, stderr=True)
+    )
+    if ret not in (0, 255):
+        error(f"kexec on {ctx.hostname} failed (exit code {ret}): {output.strip()}")
+        return ret
+    result = wait_for_kernel(ctx.hostname, old[0], ctx.args.wait_timeout)
+    if result is None:
+        error(f"{ctx.hostname} did not come up within {ctx.args.wait_timeout}s")
+        return 1
+    running, ready = result
+    if release and running != release:
+        error(f"{ctx.hostname} runs {running}, expected {release}")
+        return 1
+    if system_config:
+        _report_boot_time(ctx, running, ready - start, system_config)
+    else:
+        print(f"{ctx.hostname} is up with {running} after {ready - start:.1f}s")
+    return 0
+
+
+def cmd_kexec(ctx, system_config=None):
+    """Install kernel and kexec on remote machine via SSH.
+
+    With --wait, poll the machine until the new kernel answers, check it
+    runs the kernel release just built and record the time from kexec
+    until then in the boot_times table.
+    """
+    install_ctx = ctx.copy()
+    install_ctx.args.dest = "default"
+    install_ctx.args.postfix = ""
+    ret = cmd_install(install_ctx)
+    if ret:
+        error(f"Install to {ctx.hostname} failed, not kexecing")
+        return ret
 
-    run_cmd(ssh_kexec)
+    if getattr(ctx.args, "wait", False):
+        return _kexec_and_wait(ctx, system_config)
+    run_cmd(kexec_cmd(ctx))
+    return 0
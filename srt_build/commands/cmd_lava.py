@@ -1,8 +1,14 @@
 """Lava command - run LAVA tests with different kernel flavors."""
 
 import os
+import shutil
 import tempfile
+from logging import error
+from concurrent.futures import ThreadPoolExecutor
 from shutil import copytree
+from .. import fingerprint, modules
+from ..catalog import get_catalog, scan_template
+from ..manifest import RunManifest, run_signature
 from ..helpers import (
     ensure_lavacli_available,
     get_flavors,
@@ -13,10 +19,14 @@ from ..helpers import (
     process_test_files,
     save_job_ids,
     generate_job,
+    stage_install,
+    build_pool,
 )
 from .cmd_config import cmd_config
-from .cmd_build import cmd_build
+from .cmd_build import build_tree
 from .cmd_install import cmd_install
+from ..core import thread_event_loop
+from ..trace import span
 
 
 def add_parser(subparser):
@@ -24,12 +34,38 @@ def add_parser(subparser):
     lpsg = subparser.add_parser("lava")
     lpsg.add_argument("machine", nargs="?", help="Target machine")
     lpsg.add_argument("--skip-build", default=False, action="store_true")
+    lpsg.add_argument(
+        "--force-build",
+        default=False,
+        action="store_true",
+        help="Configure and build even if the build fingerprint is unchanged",
+    )
     lpsg.add_argument("--mods", default=False, action="store_true")
     lpsg.add_argument("--duration", default=None)
     lpsg.add_argument("--config-base", default="")
     lpsg.add_argument("--tests")
     lpsg.add_argument("--flavors")
     lpsg.add_argument("--testsuites", default="smoke")
+    lpsg.add_argument(
+        "--render-workers",
+        type=int,
+        default=None,
+        help="Processes rendering job templates (default: number of CPUs)",
+    )
+    lpsg.add_argument(
+        "--resume",
+        default=False,
+        action="store_true",
+        help="Continue the last interrupted run: skip built flavors and "
+        "submitted jobs",
+    )
+    lpsg.add_argument(
+        "--pipeline",
+        default=False,
+        action="store_true",
+        help="Build the next flavor while the previous one is installed "
+        "and its jobs are submitted",
+    )
     lpsg.add_argument(
         "--list-tests",
         default=False,
@@ -46,51 +82,53 @@ def add_parser(subparser):
     return lpsg
 
 
-def build_flavor(ctx, fl, kernel_config):
-    """Build a specific flavor if not skipped."""
-    if not ctx.args.skip_build:
-        ctx.args.flavor = fl
-        cmd_config(ctx, kernel_config)
-        cmd_build(ctx)
-        cmd_install(ctx)
+def build_flavor(ctx, fl, kernel_config, install=True):
+    """Build a specific flavor if not skipped.
+
+    Config and build are skipped if the build tree already holds a build
+    with the same fingerprint (see fingerprint.py), unless --force-build.
+    Returns the exit code of the first step that failed, else 0.
+    """
+    if ctx.args.skip_build:
+        return 0
+    ctx.args.flavor = fl
+    fp = fingerprint.compute(ctx, kernel_config)
+    if not ctx.args.force_build and fingerprint.is_current(ctx, fp):
+        print(f"Flavor {fl} unchanged, reusing build in {ctx.build_path}")
+    else:
+        fingerprint.invalidate(ctx)
+        with span("config", "build", flavor=fl):
+            ret = cmd_config(ctx, kernel_config)
+        if not ret:
+            with span("build", "build", flavor=fl):
+                ret = build_tree(ctx)
+        if ret:
+            error(f"Build of flavor {fl} failed, skipping its install and jobs")
+            return ret
+        fingerprint.save(ctx, fp)
+    if install:
+        with span("install", "build", flavor=fl):
+            ret = cmd_install(ctx)
+        if ret:
+            error(f"Install of flavor {fl} failed, skipping its jobs")
+        return ret
+    return 0
 
 
 def extract_test_name(test_path, test_file):
     """Extract test name from template file."""
-    try:
-        with open(test_path, "r") as f:
-            content = f.read()
-            for line in content.split("\n"):
-                if "job_name" in line and "=" in line:
-                    # Extract the value after '='
-                    parts = line.split("=", 1)
-                    if len(parts) == 2:
-                        value = parts[1].strip()
-                        # Remove Jinja2 closing tag if present
-                        if "%}" in value:
-                            value = value.split("%}")[0].strip()
-                        # Remove quotes (both single and double)
-                        value = value.strip("'\"")
-                        return value
-    except Exception:
-        pass
+    if os.path.exists(test_path):
+        return scan_template(test_path)["job_name"]
     # Fallback to filename
     return test_file.replace(".jinja2", "")
 
 
-def list_tests_for_suite(item_path, testsuite):
+def list_tests_for_suite(catalog, item_path, testsuite):
     """List all tests in a test suite."""
     print(f"  Test Suite: {testsuite}")
 
-    try:
-        test_files = sorted([f for f in os.listdir(item_path) if f.endswith(".jinja2")])
-    except OSError:
-        return
-
-    for test_file in test_files:
-        test_path = os.path.join(item_path, test_file)
-        name = extract_test_name(test_path, test_file)
-        print(f"    - {name}")
+    for entry in catalog.suite(item_path):
+        print(f"    - {entry['job_name']}")
 
 
 def list_available_tests(ctx):
@@ -101,6 +139,8 @@ def list_available_tests(ctx):
     if ctx.args.flavors:
         flavors = ctx.args.flavors.split(",")
 
+    catalog = get_catalog(ctx)
+
     print("\nAvailable Test Suites and Tests:")
     print("=" * 80)
 
@@ -126,7 +166,9 @@ def list_available_tests(ctx):
             if ctx.args.testsuites and ctx.args.testsuites != item:
                 continue
 
-            list_tests_for_suite(item_path, item)
+            list_tests_for_suite(catalog, item_path, item)
+
+    catalog.save()
 
     print("\n" + "=" * 80)
     print("\nUsage examples:")
@@ -162,10 +204,12 @@ def show_generated_jobs(ctx):
     try:
         job_ctx = load_job_ctx(ctx.job_path + "/boards/" + ctx.hostname + ".yaml")
         job_ctx["tags"] = [ctx.hostname]
+        modules.set_job_vars(job_ctx, "", False)
     except Exception as e:
         print(f"\nError loading job context: {e}")
         return
 
+    catalog = get_catalog(ctx)
     total_jobs = 0
 
     for flavor in flavors:
@@ -180,38 +224,25 @@ def show_generated_jobs(ctx):
         print(f"\n{flavor.upper()} Flavor - {ctx.args.testsuites}:")
         print("-" * 80)
 
-        try:
-            test_files = sorted(
-                [f for f in os.listdir(testpath) if f.endswith(".jinja2")]
-            )
-        except OSError as e:
-            print(f"Error reading test directory: {e}")
-            continue
-
-        for test_file in test_files:
-            test_path = os.path.join(testpath, test_file)
-            test_name = extract_test_name(test_path, test_file)
+        for entry in catalog.suite(testpath):
+            test_name = entry["job_name"]
+            test_file = entry["file"]
 
             # Filter by specific test if requested
-            if ctx.args.tests:
-                # Load and parse to get actual job_name
-                try:
-                    job_yaml = generate_job(ctx.job_path, test_path, job_ctx)
-                    import yaml
-
-                    job_data = yaml.safe_load(job_yaml)
-                    if job_data.get("job_name") != ctx.args.tests:
-                        continue
-                except Exception:
-                    if test_name != ctx.args.tests:
-                        continue
+            if ctx.args.tests and test_name != ctx.args.tests:
+                continue
 
             print(f"\n--- Job: {test_name} ---")
             print(f"Template: {test_file}")
 
             try:
                 # Generate the job
-                job_yaml = generate_job(ctx.job_path, test_path, job_ctx)
+                job_yaml = generate_job(
+                    ctx.job_path,
+                    os.path.join(testpath, test_file),
+                    job_ctx,
+                    ctx.template_cache_path,
+                )
                 print("\nGenerated Job Definition:")
                 print("-" * 40)
                 print(job_yaml)
@@ -221,11 +252,142 @@ def show_generated_jobs(ctx):
                 print(f"Error generating job: {e}")
                 continue
 
+    catalog.save()
+
     print("\n" + "=" * 80)
     print(f"Total jobs generated: {total_jobs}")
     print()
 
 
+def run_flavor(ctx, fl, system_config, kernel_config, duration, jobs, manifest):
+    """Build one flavor and submit its test jobs."""
+    prepare_build_for_flavor(ctx, fl)
+    if manifest.is_built(ctx.args.postfix):
+        print(f"Flavor {fl} already built and installed ({ctx.args.postfix})")
+    else:
+        if build_flavor(ctx, fl, kernel_config):
+            return
+        if not ctx.args.skip_build:
+            manifest.mark_built(ctx.args.postfix)
+
+    submit_flavor(ctx, fl, system_config, duration, jobs, manifest)
+
+
+def submit_flavor(ctx, fl, system_config, duration, jobs, manifest):
+    """Render and submit the test jobs of a built and installed flavor."""
+    with tempfile.TemporaryDirectory() as td:
+        job_ctx = load_job_ctx(ctx.job_path + "/boards/" + ctx.hostname + ".yaml")
+        job_ctx["kernel_url"] += ctx.args.postfix
+        job_ctx["tags"] = [ctx.hostname]
+        modules.set_job_vars(job_ctx, ctx.args.postfix, ctx.args.mods)
+
+        testpath = get_testpath(ctx, fl)
+        process_test_files(
+            ctx, td, job_ctx, testpath, duration, jobs, system_config, manifest
+        )
+        manifest.finish()
+
+        copytree(td, system_config["jobfiles-path"], dirs_exist_ok=True)
+
+
+def install_and_submit_flavor(ctx, fl, system_config, duration, jobs, manifest):
+    """Second pipeline stage: install the staged build, submit its jobs."""
+    with span(f"publish {fl}", "lava"):
+        if ctx.install_path:
+            with span("install", "build", flavor=fl):
+                ret = cmd_install(ctx)
+            shutil.rmtree(ctx.install_path, ignore_errors=True)
+            if ret:
+                error(f"Install of flavor {fl} failed, skipping its jobs")
+                return
+            manifest.mark_built(ctx.args.postfix)
+        submit_flavor(ctx, fl, system_config, duration, jobs, manifest)
+
+
+def run_pipelined(ctx, flavors, system_config, kernel_config, duration, jobs, manifest):
+    """Build flavor N+1 while flavor N is installed and its jobs submitted.
+
+    Builds run one after the other in this thread. Each built flavor's
+    install files are staged under its postfix and handed to a single
+    worker thread that installs them and submits the jobs, in flavor
+    order, so the upload and submission latency hides behind the next
+    compile.
+    """
+    pending = []
+    with ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="publish", initializer=thread_event_loop
+    ) as publisher:
+        try:
+            for fl in flavors:
+                fl_manifest = manifest.flavor(fl)
+                with span(f"build {fl}", "lava"):
+                    fl_ctx = ctx.for_flavor(fl)
+                    prepare_build_for_flavor(fl_ctx, fl)
+                    stage_ctx = fl_ctx.copy()
+                    if fl_manifest.is_built(fl_ctx.args.postfix):
+                        print(
+                            f"Flavor {fl} already built and installed "
+                            f"({fl_ctx.args.postfix})"
+                        )
+                    elif not ctx.args.skip_build:
+                        if build_flavor(fl_ctx, fl, kernel_config, install=False):
+                            continue
+                        stage_install(stage_ctx)
+                pending.append(
+                    publisher.submit(
+                        install_and_submit_flavor,
+                        stage_ctx,
+                        fl,
+                        system_config,
+                        duration,
+                        jobs,
+                        fl_manifest,
+                    )
+                )
+            for future in pending:
+                future.result()
+        except BaseException:
+            publisher.shutdown(wait=True, cancel_futures=True)
+            raise
+
+
+def run_parallel(ctx, flavors, system_config, kernel_config, duration, jobs, manifest):
+    """Build up to --parallel-builds flavors at once, each in its own tree.
+
+    The builds share one make jobserver. Flavors are installed and their
+    jobs submitted in order, each as soon as its build is done, while the
+    remaining flavors keep building.
+    """
+    parallel = min(ctx.args.parallel_builds, len(flavors))
+    with build_pool(parallel, ctx.jobs) as pool:
+        builds = []
+        for fl in flavors:
+            fl_ctx = ctx.for_flavor(fl)
+            fl_manifest = manifest.flavor(fl)
+            prepare_build_for_flavor(fl_ctx, fl)
+            future = None
+            if fl_manifest.is_built(fl_ctx.args.postfix):
+                print(
+                    f"Flavor {fl} already built and installed ({fl_ctx.args.postfix})"
+                )
+            elif not ctx.args.skip_build:
+                future = pool.submit(build_flavor, fl_ctx, fl, kernel_config, False)
+            builds.append((fl, fl_ctx, fl_manifest, future))
+
+        for fl, fl_ctx, fl_manifest, future in builds:
+            with span(f"flavor {fl}", "lava"):
+                if future is not None:
+                    if future.result():
+                        continue
+                    with span("install", "build", flavor=fl):
+                        ret = cmd_install(fl_ctx)
+                    if ret:
+                        error(f"Install of flavor {fl} failed, skipping its jobs")
+                        continue
+                    fl_manifest.mark_built(fl_ctx.args.postfix)
+                submit_flavor(fl_ctx, fl, system_config, duration, jobs, fl_manifest)
+
+
 def cmd_lava(ctx, system_config, kernel_config):
     """Run LAVA tests with kernel builds for different flavors."""
     # Handle --list-tests flag
@@ -244,7 +406,7 @@ def cmd_lava(ctx, system_config, kernel_config):
         print("Use --list-tests to see available tests")
         return
 
-    ensure_lavacli_available()
+    ensure_lavacli_available(system_config)
     ctx.args.config = ""
 
     flavors = get_flavors(ctx)
@@ -253,19 +415,33 @@ def cmd_lava(ctx, system_config, kernel_config):
         duration = convert_to_seconds(ctx.args.duration)
 
     jobs = []
+    manifest = RunManifest.start(
+        ctx.args.machine,
+        run_signature(flavors, ctx.args, duration),
+        system_config,
+        resume=getattr(ctx.args, "resume", False),
+    )
 
-    for fl in flavors:
-        prepare_build_for_flavor(ctx, fl)
-        build_flavor(ctx, fl, kernel_config)
-
-        with tempfile.TemporaryDirectory() as td:
-            job_ctx = load_job_ctx(ctx.job_path + "/boards/" + ctx.hostname + ".yaml")
-            job_ctx["kernel_url"] += ctx.args.postfix
-            job_ctx["tags"] = [ctx.hostname]
-
-            testpath = get_testpath(ctx, fl)
-            process_test_files(ctx, td, job_ctx, testpath, duration, jobs)
-
-            copytree(td, system_config["jobfiles-path"], dirs_exist_ok=True)
-
+    if (getattr(ctx.args, "parallel_builds", 1) or 1) > 1:
+        run_parallel(
+            ctx, flavors, system_config, kernel_config, duration, jobs, manifest
+        )
+    elif getattr(ctx.args, "pipeline", False):
+        run_pipelined(
+            ctx, flavors, system_config, kernel_config, duration, jobs, manifest
+        )
+    else:
+        for fl in flavors:
+            with span(f"flavor {fl}", "lava"):
+                run_flavor(
+                    ctx.for_flavor(fl),
+                    fl,
+                    system_config,
+                    kernel_config,
+                    duration,
+                    jobs,
+                    manifest.flavor(fl),
+                )
+
+    manifest.finish(flavors)
     save_job_ids(ctx, jobs, system_config)
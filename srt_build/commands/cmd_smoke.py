@@ -2,7 +2,7 @@
 
 import os
 import tempfile
-from ..config import bcolors
+from ..config import bcolors, yaml_load
 from ..helpers import (
     ensure_lavacli_available,
     convert_to_seconds,
@@ -10,9 +10,12 @@ from ..helpers import (
     generate_job,
     generate_split_files,
     save_job_ids,
+    collect_submissions,
 )
-from ..core import run_cmd
+from .. import modules
+from ..lava import get_submitter
 from .cmd_install import cmd_install
+from ..trace import span
 
 
 def add_parser(subparser):
@@ -39,24 +42,27 @@ def cmd_smoke(ctx, system_config):
         )
         return
 
-    ensure_lavacli_available()
+    ensure_lavacli_available(system_config)
     duration = convert_to_seconds(ctx.args.duration)
 
     jobs = []
 
     ctx.args.dest = "lava"
     ctx.args.postfix = ""
-    cmd_install(ctx)
+    with span("install", "build"):
+        cmd_install(ctx)
 
     with tempfile.TemporaryDirectory() as td:
         job_ctx = load_job_ctx(ctx.job_path + "/boards/" + ctx.hostname + ".yaml")
         job_ctx["tags"] = [ctx.hostname]
+        modules.set_job_vars(job_ctx, "", False)
         testname = "job-smoke-tests"
         filename = ctx.job_path + "/" + testname + ".jinja2"
-        job = generate_job(ctx.job_path, filename, job_ctx)
+        job = generate_job(ctx.job_path, filename, job_ctx, ctx.template_cache_path)
+        job = yaml_load(job)
         files = generate_split_files(td, job, ctx.hostname, duration)
-        for j in files:
-            (_, res) = run_cmd(["lavacli", "jobs", "submit", j])
-            jobs.append(str(res).strip())
+        with span("submit", "lava", count=len(files)):
+            submitted = get_submitter(system_config).submit_all(files)
+        collect_submissions(ctx, submitted, jobs, system_config)
 
     save_job_ids(ctx, jobs, system_config)
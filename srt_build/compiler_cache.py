@@ -0,0 +1,137 @@
+"""Compiler cache (ccache or sccache) for kernel builds.
+
+Enabled per machine in machine_config::
+
+    compiler_cache: ccache        # or sccache
+
+    compiler_cache:
+      tool: ccache
+      dir: ~/.cache/srt-build/compiler/bbb   # default
+      max-size: 20G
+
+run_make then passes ``CC="<tool> <compiler>"``. Only CC is wrapped:
+CROSS_COMPILE is also the prefix of ld, objcopy etc., which must not go
+through the cache. The hit/miss counters are read before and after a
+build to report the hit rate of that build.
+"""
+
+import contextlib
+import json
+import os
+import shutil
+from logging import debug, warning
+
+from .core import run_cmd
+
+TOOLS = ("ccache", "sccache")
+
+
+class CompilerCache:
+    """A compiler cache tool with its own cache directory."""
+
+    def __init__(self, tool, cache_dir, max_size=None):
+        if tool not in TOOLS:
+            raise ValueError(f"unknown compiler cache {tool!r}")
+        self.tool = tool
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def compiler(self, ctx):
+        """The CC make variable: the machine's compiler behind the cache."""
+        cc = ctx.CC or f"{ctx.CROSS_COMPILE or ''}gcc"
+        return f"{self.tool} {cc}"
+
+    def env(self, base=None):
+        """Environment pointing the tool at this cache."""
+        env = dict(os.environ if base is None else base)
+        if self.tool == "ccache":
+            env["CCACHE_DIR"] = self.cache_dir
+            # source paths relative to the kernel tree hit across trees
+            env.setdefault("CCACHE_BASEDIR", os.getcwd())
+            if self.max_size:
+                env["CCACHE_MAXSIZE"] = str(self.max_size)
+        else:
+            env["SCCACHE_DIR"] = self.cache_dir
+            if self.max_size:
+                env["SCCACHE_CACHE_SIZE"] = str(self.max_size)
+        return env
+
+    def stats(self):
+        """Return (hits, misses) counted by the tool so far, or None."""
+        if self.tool == "ccache":
+            cmd = ["ccache", "--print-stats"]
+        else:
+            cmd = ["sccache", "--show-stats", "--stats-format=json"]
+        try:
+            (ret, output) = run_cmd(cmd, capture=True, env=self.env())
+        except OSError as exc:
+            debug(f"{self.tool} stats unavailable: {exc}")
+            return None
+        if ret:
+            return None
+        try:
+            if self.tool == "ccache":
+                return parse_ccache_stats(output)
+            return parse_sccache_stats(output)
+        except (ValueError, KeyError, TypeError) as exc:
+            debug(f"Unable to parse {self.tool} stats: {exc}")
+            return None
+
+
+def parse_ccache_stats(output):
+    """(hits, misses) of ``ccache --print-stats`` (ccache 4.x)."""
+    counters = {}
+    for line in output.splitlines():
+        key, _, value = line.partition("\t")
+        if value.strip().isdigit():
+            counters[key] = int(value)
+    if "cache_miss" not in counters:
+        raise ValueError("no cache_miss counter")
+    hits = counters.get("direct_cache_hit", 0)
+    hits += counters.get("preprocessed_cache_hit", 0)
+    return (hits, counters["cache_miss"])
+
+
+def parse_sccache_stats(output):
+    """(hits, misses) of ``sccache --show-stats --stats-format=json``."""
+    stats = json.loads(output)["stats"]
+    hits = sum(stats["cache_hits"]["counts"].values())
+    misses = sum(stats["cache_misses"]["counts"].values())
+    return (hits, misses)
+
+
+def from_config(config, default_dir):
+    """Return the CompilerCache of a machine's compiler_cache entry, or None."""
+    if not config:
+        return None
+    if isinstance(config, str):
+        config = {"tool": config}
+    tool = config.get("tool", "ccache")
+    if tool not in TOOLS:
+        warning(f"Unknown compiler_cache {tool!r}, building without cache")
+        return None
+    if shutil.which(tool) is None:
+        warning(f"compiler_cache {tool} not found in PATH, building without cache")
+        return None
+    cache_dir = os.path.expanduser(config.get("dir") or default_dir)
+    return CompilerCache(tool, cache_dir, config.get("max-size"))
+
+
+def format_stats(tool, before, after):
+    hits = after[0] - before[0]
+    misses = after[1] - before[1]
+    total = hits + misses
+    rate = 100.0 * hits / total if total else 0.0
+    return f"{tool}: {hits} hits, {misses} misses ({rate:.1f}% hit rate)"
+
+
+@contextlib.contextmanager
+def report(cache):
+    """Print the hits and misses of the compiles done in the with block."""
+    before = cache.stats() if cache else None
+    yield
+    if before is None:
+        return
+    after = cache.stats()
+    if after is not None:
+        print(format_stats(cache.tool, before, after))
@@ -17,6 +17,22 @@ class bcolors:
     UNDERLINE = "\033[4m"
 
 
+# libyaml based loader/dumper are several times faster; PyYAML built
+# without libyaml only provides the pure Python ones.
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+def yaml_load(stream):
+    """Parse YAML like yaml.safe_load, with the C loader if available."""
+    return yaml.load(stream, Loader=YamlLoader)
+
+
+def yaml_dump(data, stream=None, **kwargs):
+    """Serialize like yaml.safe_dump, with the C dumper if available."""
+    return yaml.dump(data, stream, Dumper=YamlDumper, **kwargs)
+
+
 # Default system configuration
 system_config = {
     "base-build-path": os.path.expanduser("~/.cache/srt-build/build"),
@@ -24,6 +40,8 @@ system_config = {
     "jobfiles-path": os.path.expanduser("~/.cache/srt-build/jobs"),
     "result-path": os.path.expanduser("~/.cache/srt-build/results"),
     "database-path": os.path.expanduser("~/.cache/srt-build/jobs.db"),
+    "cache-path": os.path.expanduser("~/.cache/srt-build"),
+    "max-concurrent-cmds": 8,
 }
 
 kernel_config = {}
@@ -48,7 +66,7 @@ def load_config():
             if os.path.exists(path):
                 with open(path, "r") as f:
                     try:
-                        loaded_cfg = yaml.safe_load(f) or {}
+                        loaded_cfg = yaml_load(f) or {}
                         break
                     except yaml.YAMLError as exc:
                         warning("failed to parse %s: %s", path, exc)
@@ -5,11 +5,25 @@ from logging import warning, debug, error
 import asyncio
 import signal
 import atexit
+import codecs
+import collections
+import gzip
 import os
+import shlex
 import sys
+from . import trace
 from .config import bcolors
 from .database import init_database
 
+# Upper bound of commands run_cmds() keeps in flight; see setup().
+_concurrency = 8
+
+# Output lines kept in memory for commands whose output is not captured.
+TAIL_LINES = 200
+
+# Bytes read from a subprocess pipe at a time.
+READ_CHUNK = 64 * 1024
+
 
 def check_kernel_source_directory():
     """Check if current directory is a Linux kernel source tree."""
@@ -40,76 +54,254 @@ def check_kernel_source_directory():
 
 
 class LogOutput:
-    """Capture stdout and stderr from async subprocess."""
-
-    def __init__(self):
-        self.stdout = []
-        self.stderr = []
-
-    async def log_stdout(self, line):
-        debug(line.rstrip())
-        self.stdout.append(line)
-
-    async def log_stderr(self, line):
-        error(line.rstrip())
-        self.stderr.append(line)
+    """Capture stdout and stderr from async subprocess.
+
+    With ``capture`` every line is kept. Otherwise only the last ``tail``
+    lines of each stream are kept for error reporting, so memory stays
+    flat for commands like a kernel build. If ``logfile`` is given, the
+    complete output of both streams is streamed to it gzip-compressed.
+    """
+
+    def __init__(self, capture=True, tail=TAIL_LINES, logfile=None):
+        if capture:
+            self.stdout = []
+            self.stderr = []
+        else:
+            self.stdout = collections.deque(maxlen=tail)
+            self.stderr = collections.deque(maxlen=tail)
+        self.logfile = logfile
+        self._log = None
+        if logfile:
+            os.makedirs(os.path.dirname(logfile) or ".", exist_ok=True)
+            self._log = gzip.open(logfile, "wt", encoding="utf-8")  # noqa: SIM115
+
+    async def log_stdout(self, lines):
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            for line in lines:
+                debug(line.rstrip())
+        self.stdout.extend(lines)
+        if self._log:
+            self._log.write("".join(lines))
+
+    async def log_stderr(self, lines):
+        for line in lines:
+            error(line.rstrip())
+        self.stderr.extend(lines)
+        if self._log:
+            self._log.write("".join(lines))
+
+    def close(self):
+        if self._log:
+            self._log.close()
+            self._log = None
 
 
 async def _read_stream(stream, callback):
-    """Read lines from stream and pass to callback."""
+    """Read stream in chunks and pass batches of decoded lines to callback.
+
+    Invalid UTF-8 is replaced rather than dropping the line, and lines of
+    any length are passed on since the StreamReader line limit does not
+    apply to read().
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
     while True:
-        line = await stream.readline()
-        try:
-            line = line.decode("utf-8")
-        except UnicodeDecodeError as err:
-            warning("Could not decode line from stream: %s", err)
-            continue
-
-        if line:
-            await callback(line)
-        else:
+        chunk = await stream.read(READ_CHUNK)
+        parts = (pending + decoder.decode(chunk, final=not chunk)).split("\n")
+        pending = parts.pop()
+        if parts:
+            await callback([part + "\n" for part in parts])
+        if not chunk:
             break
+    if pending:
+        await callback([pending])
+
+
+async def _spawn(cmd, cwd, shell, env=None, pass_fds=()):
+    """Start cmd directly from its argv, or via /bin/sh if shell is set."""
+    kwargs = {
+        "cwd": cwd,
+        "env": env,
+        "pass_fds": pass_fds,
+        "stdout": asyncio.subprocess.PIPE,
+        "stderr": asyncio.subprocess.PIPE,
+    }
+    if shell:
+        cmdstr = cmd if isinstance(cmd, str) else " ".join(cmd)
+        debug("$ %s", cmdstr)
+        return await asyncio.create_subprocess_shell(cmdstr, **kwargs)
+    debug("$ %s", shlex.join(cmd))
+    return await asyncio.create_subprocess_exec(*cmd, **kwargs)
+
+
+async def run_cmd_async(
+    cmd,
+    cwd=None,
+    capture=False,
+    logfile=None,
+    shell=False,
+    stderr=False,
+    env=None,
+    pass_fds=(),
+):
+    """Run command asynchronously and return (exit code, stdout).
+
+    ``cmd`` is an argv list executed without a shell. Only strings from
+    the machine configuration that rely on shell syntax (e.g. the
+    ``install`` commands chained with ``;``) are run with ``shell=True``.
+
+    Only callers passing ``capture=True`` get the complete stdout; all
+    others get the last TAIL_LINES lines. ``logfile`` receives the full
+    stdout and stderr, gzip-compressed. With ``stderr`` the returned
+    output is stdout followed by stderr, e.g. to inspect error messages;
+    with ``stderr="failed"`` only if the command failed, so warnings do
+    not end up in the output of a successful run.
+    ``env`` replaces the environment and the file descriptors in
+    ``pass_fds`` are inherited, e.g. by make from a jobserver.
+    """
+    logo = LogOutput(capture=capture, logfile=logfile)
+    try:
+        process = await _spawn(cmd, cwd, shell, env, pass_fds)
+
+        await asyncio.wait(
+            [
+                asyncio.create_task(_read_stream(process.stdout, logo.log_stdout)),
+                asyncio.create_task(_read_stream(process.stderr, logo.log_stderr)),
+            ]
+        )
+        ret = await process.wait()
+    finally:
+        logo.close()
+
+    if stderr == "failed" and not ret:
+        stderr = False
+    if stderr:
+        return (ret, "".join(logo.stdout) + "".join(logo.stderr))
+    return (ret, "".join(logo.stdout))
 
 
-async def run_cmd_async(cmd, cwd=None):
-    """Run command asynchronously and capture output."""
-    cmdstr = " ".join(cmd)
-    debug("$ %s", cmdstr)
+def concurrency():
+    """Default number of commands run concurrently (max-concurrent-cmds)."""
+    return _concurrency
 
-    logo = LogOutput()
 
-    process = await asyncio.create_subprocess_shell(
-        cmdstr, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=cwd
-    )
+def thread_event_loop():
+    """Give a worker thread its own event loop, e.g. as pool initializer.
 
-    await asyncio.wait(
-        [
-            asyncio.create_task(_read_stream(process.stdout, logo.log_stdout)),
-            asyncio.create_task(_read_stream(process.stderr, logo.log_stderr)),
-        ]
-    )
-    ret = await process.wait()
+    run_cmd() and the LAVA backends run on the current thread's loop.
+    """
+    asyncio.set_event_loop(asyncio.new_event_loop())
 
-    return (ret, "".join(logo.stdout))
 
-
-def run_cmd(cmd, cwd=None):
-    """Run command and return exit code and output."""
-    debug(cmd)
+def run_until_complete(coro):
+    """Run a coroutine on the current event loop and return its result."""
     try:
         loop = asyncio.get_event_loop()
-        (ret, output) = loop.run_until_complete(run_cmd_async(cmd, cwd=cwd))
+        return loop.run_until_complete(coro)
     except (KeyboardInterrupt, asyncio.CancelledError):
         # Re-raise to let top-level handler deal with it gracefully
         raise KeyboardInterrupt() from None
-    except Exception as exc:
-        error(f"Exception while running command {cmd}: {exc}")
-        return (1, str(exc))
+
+
+async def run_cmd_checked_async(
+    cmd,
+    cwd=None,
+    capture=False,
+    logfile=None,
+    shell=False,
+    stderr=False,
+    env=None,
+    pass_fds=(),
+):
+    """Run command asynchronously, logging failures instead of raising."""
+    debug(cmd)
+    cmdstr = cmd if isinstance(cmd, str) else shlex.join(cmd)
+    name = os.path.basename(cmdstr.split(maxsplit=1)[0]) if cmdstr else "cmd"
+    with trace.span(name, "cmd", cmd=cmdstr) as span_args:
+        try:
+            (ret, output) = await run_cmd_async(
+                cmd,
+                cwd=cwd,
+                capture=capture,
+                logfile=logfile,
+                shell=shell,
+                stderr=stderr,
+                env=env,
+                pass_fds=pass_fds,
+            )
+        except Exception as exc:
+            error(f"Exception while running command {cmd}: {exc}")
+            span_args["error"] = exc
+            return (1, str(exc))
+        span_args["ret"] = ret
     if ret:
         error(f"Command failed: {cmd} (exit code {ret})")
+        if logfile:
+            error(f"Full output in {logfile}")
     return (ret, output)
 
 
+def run_cmd(
+    cmd, cwd=None, capture=False, logfile=None, shell=False, env=None, pass_fds=()
+):
+    """Run command and return exit code and output.
+
+    The output is complete only with ``capture=True``; otherwise it is
+    the tail of stdout (see run_cmd_async).
+    """
+    return run_until_complete(
+        run_cmd_checked_async(
+            cmd,
+            cwd=cwd,
+            capture=capture,
+            logfile=logfile,
+            shell=shell,
+            env=env,
+            pass_fds=pass_fds,
+        )
+    )
+
+
+async def bounded_gather(func, items, limit=None):
+    """Await func(item) for all items, at most ``limit`` at a time.
+
+    Results are returned in the same order as ``items``. The default
+    limit is taken from system_config "max-concurrent-cmds".
+    """
+    limit = max(1, limit or _concurrency)
+    sem = asyncio.Semaphore(limit)
+    lanes = list(range(limit))
+
+    async def _bounded(item):
+        async with sem:
+            lane = lanes.pop()
+            token = trace.set_lane(lane)
+            try:
+                return await func(item)
+            finally:
+                trace.reset_lane(token)
+                lanes.append(lane)
+
+    return await asyncio.gather(*(_bounded(item) for item in items))
+
+
+def run_cmds(cmds, cwd=None, limit=None, capture=False, shell=False):
+    """Run commands concurrently and return [(exit code, output), ...].
+
+    At most ``limit`` commands run at the same time (default taken from
+    system_config "max-concurrent-cmds"). Results are returned in the
+    same order as ``cmds``.
+    """
+    cmds = list(cmds)
+    if not cmds:
+        return []
+
+    async def _run(cmd):
+        return await run_cmd_checked_async(cmd, cwd=cwd, capture=capture, shell=shell)
+
+    return run_until_complete(bounded_gather(_run, cmds, limit))
+
+
 def interruption():
     """Cancel all async tasks on interruption without noisy output."""
     for task in asyncio.all_tasks():
@@ -165,6 +357,9 @@ def setup(system_config):
         loop.add_signal_handler(sig, interruption)
     atexit.register(_atexit_handler)
 
+    global _concurrency
+    _concurrency = int(system_config.get("max-concurrent-cmds", _concurrency))
+
     # Ensure cache directories exist
     os.makedirs(system_config["base-build-path"], exist_ok=True)
     os.makedirs(system_config["jobfiles-path"], exist_ok=True)
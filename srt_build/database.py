@@ -2,8 +2,9 @@
 
 import sqlite3
 import os
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from logging import debug, error
+from .trace import traced
 
 
 def get_db_path(system_config):
@@ -12,12 +13,17 @@ def get_db_path(system_config):
     return system_config.get("database-path", default_path)
 
 
+@traced(cat="db")
 def init_database(system_config):
     """Initialize the SQLite database with required tables.
 
     Schema:
     - test_suites: Each row represents a test suite run with primary job ID
     - jobs: Individual job IDs associated with each test suite
+    - failed_submissions: Job files the LAVA server did not accept
+    - lava_runs, lava_run_flavors, lava_run_jobs: Manifest of a lava
+      command run (built flavors, planned and submitted jobs) for --resume
+    - boot_times: Time from kexec until the new kernel answered (kexec --wait)
     """
     db_path = get_db_path(system_config)
 
@@ -48,6 +54,68 @@ def init_database(system_config):
         )
     """)
 
+    # Create failed_submissions table to keep jobs that were not submitted
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS failed_submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            machine TEXT NOT NULL,
+            job_file TEXT NOT NULL,
+            error TEXT,
+            attempts INTEGER NOT NULL,
+            definition TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Create lava run manifest tables, updated while a run progresses
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lava_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            machine TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lava_run_flavors (
+            run_id INTEGER NOT NULL,
+            flavor TEXT NOT NULL,
+            postfix TEXT,
+            built INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (run_id, flavor),
+            FOREIGN KEY (run_id) REFERENCES lava_runs(id)
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lava_run_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            flavor TEXT NOT NULL,
+            template TEXT NOT NULL,
+            split TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'planned',
+            job_ids TEXT,
+            error TEXT,
+            UNIQUE (run_id, flavor, template, split),
+            FOREIGN KEY (run_id) REFERENCES lava_runs(id)
+        )
+    """)
+
+    # Create boot_times table, one row per kexec --wait
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS boot_times (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            machine TEXT NOT NULL,
+            kernel_release TEXT NOT NULL,
+            flavor TEXT,
+            seconds REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
     # Create index for faster lookups
     cursor.execute("""
         CREATE INDEX IF NOT EXISTS idx_machine
@@ -64,6 +132,7 @@ def init_database(system_config):
     debug(f"Database initialized at {db_path}")
 
 
+@traced(cat="db")
 def save_job_ids_to_db(
     machine: str,
     jobs: List[int],
@@ -113,6 +182,86 @@ def save_job_ids_to_db(
         conn.close()
 
 
+@traced(cat="db")
+def save_failed_submissions_to_db(
+    machine: str,
+    failures: List[Tuple[str, str, int]],
+    system_config
+):
+    """Record job files whose submission failed.
+
+    Args:
+        machine: Target machine name
+        failures: List of (job file, error message, attempts)
+        system_config: System configuration dictionary
+    """
+    if not failures:
+        return
+
+    db_path = get_db_path(system_config)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        for job_file, err, attempts in failures:
+            # The job files live in a temporary directory, keep the content
+            try:
+                with open(job_file, "r") as f:
+                    definition = f.read()
+            except OSError:
+                definition = None
+            cursor.execute("""
+                INSERT INTO failed_submissions
+                    (machine, job_file, error, attempts, definition)
+                VALUES (?, ?, ?, ?, ?)
+            """, (machine, os.path.basename(job_file), err, attempts,
+                  definition))
+
+        conn.commit()
+        debug(f"Saved {len(failures)} failed submissions for machine {machine}")
+    except Exception as exc:
+        error(f"Error saving failed submissions to database: {exc}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+@traced(cat="db")
+def get_failed_submissions_from_db(
+    machine: str,
+    system_config
+) -> List[Tuple[str, str, int]]:
+    """Get the failed submissions recorded for a machine.
+
+    Returns:
+        List of (job file, error message, attempts), oldest first
+    """
+    db_path = get_db_path(system_config)
+
+    if not os.path.exists(db_path):
+        debug(f"Database not found at {db_path}")
+        return []
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("""
+            SELECT job_file, error, attempts FROM failed_submissions
+            WHERE machine = ?
+            ORDER BY id
+        """, (machine,))
+
+        return [tuple(row) for row in cursor.fetchall()]
+
+    except Exception as exc:
+        error(f"Error reading failed submissions from database: {exc}")
+        return []
+    finally:
+        conn.close()
+
+
+@traced(cat="db")
 def get_jobs_from_db(
     machine: str,
     job_id: int,
@@ -176,6 +325,7 @@ def get_jobs_from_db(
         conn.close()
 
 
+@traced(cat="db")
 def get_job_list_from_db(machine: str, system_config) -> List[int]:
     """Get all test suite IDs for a machine.
 
@@ -210,3 +360,188 @@ def get_job_list_from_db(machine: str, system_config) -> List[int]:
         return []
     finally:
         conn.close()
+
+
+def _execute(system_config, sql, params=()):
+    """Run one statement in its own transaction, return the cursor."""
+    conn = sqlite3.connect(get_db_path(system_config))
+    try:
+        with conn:
+            return conn.execute(sql, params)
+    finally:
+        conn.close()
+
+
+@traced(cat="db")
+def create_lava_run(machine: str, signature: str, system_config) -> int:
+    """Start a new lava run manifest and return its id.
+
+    Args:
+        machine: Target machine name
+        signature: Flavors, test suites etc. the run was started with
+        system_config: System configuration dictionary
+    """
+    cursor = _execute(system_config, """
+        INSERT INTO lava_runs (machine, signature)
+        VALUES (?, ?)
+    """, (machine, signature))
+    return cursor.lastrowid
+
+
+@traced(cat="db")
+def find_lava_run(machine: str, signature: str, system_config) -> Optional[int]:
+    """Return the id of the latest unfinished run with signature, or None."""
+    conn = sqlite3.connect(get_db_path(system_config))
+    try:
+        row = conn.execute("""
+            SELECT id FROM lava_runs
+            WHERE machine = ? AND signature = ? AND completed = 0
+            ORDER BY id DESC
+            LIMIT 1
+        """, (machine, signature)).fetchone()
+        return row[0] if row else None
+    except Exception as exc:
+        error(f"Error reading lava runs from database: {exc}")
+        return None
+    finally:
+        conn.close()
+
+
+@traced(cat="db")
+def complete_lava_run(run_id: int, system_config):
+    """Mark a lava run as finished, it is not resumed anymore."""
+    _execute(system_config, """
+        UPDATE lava_runs SET completed = 1 WHERE id = ?
+    """, (run_id,))
+
+
+@traced(cat="db")
+def get_lava_run_flavor(
+    run_id: int,
+    flavor: str,
+    system_config
+) -> Optional[Tuple[str, bool]]:
+    """Return (postfix, built) recorded for a flavor of a run, or None."""
+    conn = sqlite3.connect(get_db_path(system_config))
+    try:
+        row = conn.execute("""
+            SELECT postfix, built FROM lava_run_flavors
+            WHERE run_id = ? AND flavor = ?
+        """, (run_id, flavor)).fetchone()
+        return (row[0], bool(row[1])) if row else None
+    finally:
+        conn.close()
+
+
+@traced(cat="db")
+def set_lava_run_flavor(
+    run_id: int,
+    flavor: str,
+    postfix: str,
+    built: bool,
+    system_config
+):
+    """Record the kernel postfix and build state of a flavor of a run."""
+    _execute(system_config, """
+        INSERT OR REPLACE INTO lava_run_flavors (run_id, flavor, postfix, built)
+        VALUES (?, ?, ?, ?)
+    """, (run_id, flavor, postfix, int(built)))
+
+
+@traced(cat="db")
+def plan_lava_run_jobs(
+    run_id: int,
+    flavor: str,
+    template: str,
+    splits: List[str],
+    system_config
+):
+    """Record the split job files of a template before they are submitted."""
+    conn = sqlite3.connect(get_db_path(system_config))
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO lava_run_jobs
+                    (run_id, flavor, template, split)
+                VALUES (?, ?, ?, ?)
+            """, [(run_id, flavor, template, split) for split in splits])
+    finally:
+        conn.close()
+
+
+@traced(cat="db")
+def update_lava_run_job(
+    run_id: int,
+    flavor: str,
+    template: str,
+    split: str,
+    state: str,
+    job_ids: List[int],
+    system_config,
+    err: Optional[str] = None
+):
+    """Record the submission state ('submitted' or 'failed') of a split."""
+    _execute(system_config, """
+        UPDATE lava_run_jobs SET state = ?, job_ids = ?, error = ?
+        WHERE run_id = ? AND flavor = ? AND template = ? AND split = ?
+    """, (state, " ".join(str(i) for i in job_ids), err,
+          run_id, flavor, template, split))
+
+
+@traced(cat="db")
+def get_lava_run_jobs(
+    run_id: int,
+    flavor: str,
+    system_config
+) -> Dict[Tuple[str, str], Tuple[str, List[int]]]:
+    """Return {(template, split): (state, job ids)} of a flavor of a run."""
+    conn = sqlite3.connect(get_db_path(system_config))
+    try:
+        rows = conn.execute("""
+            SELECT template, split, state, job_ids FROM lava_run_jobs
+            WHERE run_id = ? AND flavor = ?
+            ORDER BY id
+        """, (run_id, flavor)).fetchall()
+        return {
+            (template, split): (state, [int(i) for i in (job_ids or "").split()])
+            for template, split, state, job_ids in rows
+        }
+    finally:
+        conn.close()
+
+
+@traced(cat="db")
+def save_boot_time_to_db(
+    machine: str,
+    kernel_release: str,
+    flavor: Optional[str],
+    seconds: float,
+    system_config
+):
+    """Record the time from kexec until the new kernel was ready."""
+    _execute(system_config, """
+        INSERT INTO boot_times (machine, kernel_release, flavor, seconds)
+        VALUES (?, ?, ?, ?)
+    """, (machine, kernel_release, flavor or None, seconds))
+
+
+@traced(cat="db")
+def get_boot_times_from_db(
+    machine: str,
+    kernel_release: Optional[str],
+    system_config,
+    limit: int = 10
+) -> List[Tuple[str, str, float, str]]:
+    """Return the latest (kernel release, flavor, seconds, created_at) of a
+    machine, newest first, optionally only those of kernel_release."""
+    conn = sqlite3.connect(get_db_path(system_config))
+    try:
+        rows = conn.execute("""
+            SELECT kernel_release, flavor, seconds, created_at FROM boot_times
+            WHERE machine = ? AND (? IS NULL OR kernel_release = ?)
+            ORDER BY id DESC
+            LIMIT ?
+        """, (machine, kernel_release, kernel_release, limit)).fetchall()
+        return [tuple(r) for r in rows]
+    finally:
+        conn.close()
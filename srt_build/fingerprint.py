@@ -0,0 +1,126 @@
+"""Build fingerprints to skip config and build of an unchanged flavor.
+
+A fingerprint hashes everything a build depends on: the git HEAD and
+uncommitted changes of the kernel tree, the defconfig and the resolved
+config fragments (with their content), the toolchain variables and the
+build options. After a successful build it is stored in the build dir
+together with a hash of the resulting .config and the size and mtime
+of the installed outputs. If all of them still match, the existing
+image is reused.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+from logging import debug, warning
+
+from .core import run_cmd
+from .helpers import install_files, resolve_config_fragments
+
+FINGERPRINT_FILE = ".srt-build-fingerprint"
+KERNEL_RELEASE = os.path.join("include", "config", "kernel.release")
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def source_state():
+    """Return (HEAD, hash of uncommitted changes), or None outside git."""
+    (ret, head) = run_cmd(["git", "rev-parse", "HEAD"], capture=True)
+    if ret:
+        return None
+    (ret, diff) = run_cmd(["git", "diff", "HEAD", "--binary"], capture=True)
+    if ret:
+        return None
+    return (head.strip(), hashlib.sha256(diff.encode("utf-8")).hexdigest())
+
+
+def compute(ctx, kernel_config):
+    """Fingerprint of the inputs of a config+build of ctx, or None."""
+    state = source_state()
+    if state is None:
+        return None
+    config_file = getattr(ctx.args, "config", None)
+    fragments = resolve_config_fragments(
+        ctx, kernel_config, with_flavor=not config_file
+    )
+    data = {
+        "head": state[0],
+        "changes": state[1],
+        "config": _sha256_file(config_file) if config_file else None,
+        "defconfig": ctx.defconfig,
+        "fragments": [[os.path.basename(f), _sha256_file(f)] for f in fragments],
+        "toolchain": [ctx.CROSS_COMPILE, ctx.ARCH, ctx.CC],
+        "target": [ctx.target, ctx.loadaddr, ctx.dtb, ctx.dtb_cmd],
+        "mods": bool(getattr(ctx.args, "mods", False)),
+    }
+    encoded = json.dumps(data, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _path(ctx):
+    return os.path.join(ctx.build_path, FINGERPRINT_FILE)
+
+
+def _outputs(ctx):
+    outputs = {}
+    for name in install_files(ctx):
+        st = os.stat(os.path.join(ctx.build_path, name))
+        outputs[name] = [st.st_size, st.st_mtime_ns]
+    return outputs
+
+
+def is_current(ctx, fingerprint):
+    """True if ctx.build_path holds a build of exactly this fingerprint."""
+    if not fingerprint:
+        return False
+    try:
+        with open(_path(ctx), "r") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if record.get("inputs") != fingerprint:
+        debug("fingerprint: build inputs changed")
+        return False
+    if record.get("config") != _sha256_file(os.path.join(ctx.build_path, ".config")):
+        debug("fingerprint: .config changed")
+        return False
+    if not os.path.isfile(os.path.join(ctx.build_path, KERNEL_RELEASE)):
+        debug("fingerprint: kernel.release missing")
+        return False
+    outputs = record.get("outputs")
+    if not outputs or outputs != _outputs(ctx):
+        debug("fingerprint: build outputs changed or missing")
+        return False
+    return True
+
+
+def save(ctx, fingerprint):
+    """Record fingerprint for the build just completed in ctx.build_path."""
+    if not fingerprint:
+        return
+    record = {
+        "inputs": fingerprint,
+        "config": _sha256_file(os.path.join(ctx.build_path, ".config")),
+        "outputs": _outputs(ctx),
+    }
+    try:
+        with open(_path(ctx), "w") as f:
+            json.dump(record, f)
+    except OSError as exc:
+        warning(f"Unable to save build fingerprint: {exc}")
+
+
+def invalidate(ctx):
+    """Forget the fingerprint, e.g. before a build that may fail."""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(_path(ctx))
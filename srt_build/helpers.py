@@ -1,28 +1,49 @@
 """Helper utilities for LAVA job management and kernel builds."""
 
+import asyncio
+import contextlib
+import copy
+import functools
 import os
 import re
+import shlex
 import sys
 import shutil
+import time
 import yaml
 import jinja2
 import multiprocessing
 from logging import error, debug
-from .core import run_cmd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .config import bcolors, yaml_load, yaml_dump
+from .core import (
+    run_cmd,
+    run_cmd_checked_async,
+    run_until_complete,
+    thread_event_loop,
+)
+from . import compiler_cache, jobserver, parallelism
+from .catalog import get_catalog
+from .trace import span, traced
+from .lava import SubmitResult, get_submitter, use_rpc
 from .database import (
     save_job_ids_to_db,
+    save_failed_submissions_to_db,
     get_jobs_from_db,
     get_job_list_from_db,
 )
 
 
-def ensure_lavacli_available():
+def ensure_lavacli_available(system_config=None):
     """
     Verify that 'lavacli' is available in PATH.
 
     Exit with error if not found.
-    Required for LAVA-related commands.
+    Required for LAVA-related commands unless system_config selects the
+    in-process XML-RPC backend ("lava-backend: xmlrpc").
     """
+    if system_config and use_rpc(system_config):
+        return
     if shutil.which("lavacli") is None:
         from logging import warning
 
@@ -52,6 +73,48 @@ class Context:
             self.__dict__["build_path"] = (
                 system_config["base-build-path"] + "/" + self.hostname
             )
+        # --flavor-builddirs: every flavor gets its own O= tree
+        if getattr(args, "flavor_builddirs", False) and getattr(args, "flavor", ""):
+            self.__dict__["build_path"] = os.path.join(
+                self.__dict__["build_path"], args.flavor
+            )
+        cache_path = os.path.expanduser(
+            system_config.get("cache-path", "~/.cache/srt-build")
+        )
+        # Compiled job templates (see get_job_env)
+        self.__dict__["template_cache_path"] = os.path.join(cache_path, "templates")
+        # Job names and test definitions of the templates (see catalog)
+        self.__dict__["catalog_path"] = os.path.join(cache_path, "catalog.json")
+        # make -j/-l of builds (see parallelism)
+        self.__dict__["jobs"] = parallelism.build_jobs(mc, system_config)
+        self.__dict__["load_average"] = parallelism.load_average(mc, system_config)
+        # ccache/sccache wrapping CC in run_make, if the machine has one
+        self.__dict__["compiler_cache"] = compiler_cache.from_config(
+            mc.get("compiler_cache"),
+            os.path.join(cache_path, "compiler", self.hostname),
+        )
+        # Stored builds and the upload ledger (see artifacts), unless disabled
+        self.__dict__["artifact_path"] = None
+        if system_config.get("artifact-store", True):
+            self.__dict__["artifact_path"] = os.path.join(cache_path, "artifacts")
+        self.__dict__["artifact_max_builds"] = system_config.get("artifact-max-builds")
+        # ssh ControlMaster sockets (see ssh) and scp compression of uploads
+        self.__dict__["ssh_control_path"] = os.path.join(cache_path, "ssh")
+        self.__dict__["install_compress_min"] = system_config.get(
+            "install-compress-min"
+        )
+        # compression of streamed modules if the destination does not say
+        self.__dict__["modules_compression"] = system_config.get("modules-compression")
+        # Resolved kernel configs (see kconfig.ConfigCache)
+        self.__dict__["kconfig_cache_path"] = os.path.join(cache_path, "kconfig")
+        # Build outputs of a flavor while it is installed (see stage_install)
+        self.__dict__["stage_path"] = os.path.join(
+            system_config["base-build-path"], "stage", self.hostname
+        )
+        # Compressed command logs (see run_make)
+        self.__dict__["log_path"] = os.path.join(
+            system_config["base-build-path"], "logs", self.hostname
+        )
         # Resolve config_path with priority:
         # 1. repository root ./configs
         # 2. package sibling ../configs
@@ -90,17 +153,94 @@ class Context:
             return None
         return self.__dict__[name]
 
+    def copy(self):
+        """Return a copy whose args can be changed independently."""
+        ctx = Context.__new__(Context)
+        ctx.__dict__.update(self.__dict__)
+        ctx.__dict__["args"] = copy.copy(self.args)
+        return ctx
+
+    def for_flavor(self, flavor):
+        """Return a copy for building flavor.
+
+        With --flavor-builddirs the copy builds in <build_path>/<flavor>.
+        """
+        ctx = self.copy()
+        ctx.args.flavor = flavor
+        if getattr(self.args, "flavor_builddirs", False):
+            ctx.__dict__["build_path"] = os.path.join(self.build_path, flavor)
+        return ctx
+
+
+def make_logfile(ctx, cmd):
+    """Return a fresh log file path for a make invocation."""
+    targets = [c for c in cmd if not c.startswith("-") and "=" not in c]
+    name = "-".join(targets) or "all"
+    flavor = getattr(ctx.args, "flavor", "")
+    if flavor:
+        name = f"{flavor}-{name}"
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(ctx.log_path, f"{stamp}-make-{name}.log.gz")
+
 
 def run_make(ctx, cmd):
-    """Run make command with proper environment for cross-compilation."""
+    """Run make command with proper environment for cross-compilation.
+
+    See run_make_async.
+    """
+    return run_until_complete(run_make_async(ctx, cmd))
+
+
+async def run_make_async(ctx, cmd):
+    """Run make command with proper environment for cross-compilation.
+
+    The full output goes to a compressed log under ctx.log_path; only the
+    tail is kept in memory. While a jobserver is active (parallel flavor
+    builds) make takes its job slots from it instead of ``-jN``. With a
+    compiler_cache, CC is wrapped by ccache or sccache.
+    """
+    env = None
+    pass_fds = ()
+    js = jobserver.current()
+    if js:
+        cmd = [c for c in cmd if not c.startswith("-j")]
+        env = js.env()
+        pass_fds = js.fds
+    cache = getattr(ctx, "compiler_cache", None)
+    if cache:
+        env = cache.env(env)
     ipath = ctx.build_path + "/mods"
-    makecmd = ["INSTALL_MOD_PATH=" + ipath, "make", "O=" + ctx.build_path]
+    makecmd = ["make", "O=" + ctx.build_path, "INSTALL_MOD_PATH=" + ipath]
     if ctx.CROSS_COMPILE:
         makecmd += ["CROSS_COMPILE=" + ctx.CROSS_COMPILE]
         makecmd += ["ARCH=" + ctx.ARCH]
-    if ctx.CC:
+    if cache:
+        makecmd += ["CC=" + cache.compiler(ctx)]
+    elif ctx.CC:
         makecmd += ["CC=" + ctx.CC]
-    return run_cmd(makecmd + cmd)
+    logfile = make_logfile(ctx, cmd)
+    with span("make", "build", targets=" ".join(cmd), log=logfile):
+        return await run_cmd_checked_async(
+            makecmd + cmd, logfile=logfile, env=env, pass_fds=pass_fds
+        )
+
+
+@contextlib.contextmanager
+def build_pool(parallel, slots=None):
+    """Thread pool building up to ``parallel`` flavors at once.
+
+    All makes started from the pool share one jobserver, so together
+    they run no more than ``slots`` jobs (default: see parallelism).
+    """
+    with (
+        jobserver.Jobserver(slots, clients=parallel),
+        ThreadPoolExecutor(
+            max_workers=parallel,
+            thread_name_prefix="build",
+            initializer=thread_event_loop,
+        ) as pool,
+    ):
+        yield pool
 
 
 def convert_to_seconds(string):
@@ -135,7 +275,7 @@ def load_job_ctx(filename):
                 continue
             with open(path, "r") as stream:
                 try:
-                    job_ctx = yaml.safe_load(stream) or {}
+                    job_ctx = yaml_load(stream) or {}
                     return job_ctx
                 except yaml.YAMLError as exc:
                     error(f"YAML parse error in job ctx {path}: {exc}")
@@ -148,15 +288,43 @@ def load_job_ctx(filename):
     return job_ctx
 
 
-def generate_job(job_path, filename, job_ctx):
+@functools.lru_cache(maxsize=None)
+def get_job_env(job_path, cache_dir=None):
+    """Return the shared Jinja2 environment for templates under job_path.
+
+    Compiled templates stay in memory for the lifetime of the process and
+    are reloaded when the template file's mtime changes. With cache_dir
+    the compiled bytecode is also kept on disk across runs.
+    """
+    bytecode_cache = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader([job_path]),
+        trim_blocks=True,
+        autoescape=False,
+        auto_reload=True,
+        bytecode_cache=bytecode_cache,
+    )
+
+
+@traced(cat="jobs")
+def generate_job(job_path, filename, job_ctx, cache_dir=None):
     """Generate job file from Jinja2 template."""
-    with open(filename, "r") as details:
-        data = details.read()
-    string_loader = jinja2.DictLoader({filename: data})
-    type_loader = jinja2.FileSystemLoader([job_path])
-    loader = jinja2.ChoiceLoader([string_loader, type_loader])
-    env = jinja2.Environment(loader=loader, trim_blocks=True, autoescape=False)
-    job_template = env.get_template(filename)
+    name = os.path.relpath(os.path.abspath(filename), os.path.abspath(job_path))
+    if name.startswith(os.pardir):
+        # Template outside job_path, compile it on its own
+        with open(filename, "r") as details:
+            data = details.read()
+        string_loader = jinja2.DictLoader({filename: data})
+        type_loader = jinja2.FileSystemLoader([job_path])
+        loader = jinja2.ChoiceLoader([string_loader, type_loader])
+        env = jinja2.Environment(loader=loader, trim_blocks=True, autoescape=False)
+        job_template = env.get_template(filename)
+    else:
+        env = get_job_env(job_path, cache_dir)
+        job_template = env.get_template(name.replace(os.sep, "/"))
 
     return job_template.render(**job_ctx)
 
@@ -218,11 +386,15 @@ def _bump_job_timeouts(job, duration):
         pass
 
 
-def generate_split_files(td, job, devicename, duration):
-    """Split job into multiple files, one per test definition."""
-    split_files = []
+@traced(cat="jobs")
+def generate_split_files(td, job, devicename, duration, stem=None):
+    """Split job into multiple files, one per test definition.
 
-    job = yaml.safe_load(job)
+    job is the parsed job definition; it is modified in place. The file
+    names start with stem (the template name) if given: templates of a
+    suite share test names and their files are all written to td.
+    """
+    split_files = []
 
     idx = _find_test_index(job)
     tests = job["actions"][idx]["test"]["definitions"]
@@ -244,9 +416,10 @@ def generate_split_files(td, job, devicename, duration):
 
         job["actions"][idx] = action
 
-        filename = f'{td}/test-{t["name"]}-{devicename}.yaml'
+        name = f'{stem}-{t["name"]}' if stem else t["name"]
+        filename = f"{td}/test-{name}-{devicename}.yaml"
         with open(filename, "w") as f:
-            yaml.dump(job, f, default_flow_style=False)
+            yaml_dump(job, f, default_flow_style=False)
         split_files.append(filename)
 
     return split_files
@@ -264,11 +437,75 @@ def prepare_build_for_flavor(ctx, fl):
     """Prepare build settings for specific flavor."""
     ctx.args.dest = "lava"
     ctx.args.postfix = "-" + fl
-    (res, ref) = run_cmd(["git", "describe"])
+    (res, ref) = run_cmd(["git", "describe"], capture=True)
     if not res:
         ctx.args.postfix += "-" + ref.strip()
 
 
+def install_files(ctx):
+    """Return the build outputs (relative to build_path) ctx installs.
+
+    These are the sources of the machine's install spec for ctx.args.dest
+    (or the arguments of its install command) that exist in the build
+    tree.
+    """
+    spec = ctx.install[getattr(ctx.args, "dest", None) or "default"]
+    if isinstance(spec, str):
+        tokens = shlex.split(spec.replace(";", " "))
+    else:
+        tokens = [entry["src"] for entry in spec]
+    files = []
+    for token in tokens:
+        if os.path.isabs(token) or token in files:
+            continue
+        if os.path.exists(os.path.join(ctx.build_path, token)):
+            files.append(token)
+    return files
+
+
+def resolve_config_fragments(ctx, kernel_config, with_flavor=True):
+    """Return the config fragments merged into .config, in merge order.
+
+    That is the machine config, the fragments of --config-base and, if
+    with_flavor, those of ctx.args.flavor from kernel_config.
+    """
+    cfgs = [ctx.config_path + "/" + ctx.config]
+    config_base = getattr(ctx.args, "config_base", "")
+    for c in kernel_config.get(config_base, []):
+        cfgs += [ctx.config_path + "/" + c]
+    flavor = getattr(ctx.args, "flavor", "")
+    if with_flavor and flavor:
+        for c in kernel_config.get(flavor, []):
+            cfgs += [ctx.config_path + "/" + c]
+    return cfgs
+
+
+def stage_install(ctx):
+    """Copy the build outputs the install command uses to a staging dir.
+
+    The staging dir is named after ctx.args.postfix, so the next flavor
+    can be built while this one is still being installed. With --mods
+    the installed modules are staged as well. Sets
+    ctx.install_path (the directory cmd_install runs in) and returns it.
+    """
+    stage = ctx.stage_path + ctx.args.postfix
+    shutil.rmtree(stage, ignore_errors=True)
+    for token in install_files(ctx):
+        src = os.path.join(ctx.build_path, token)
+        dst = os.path.join(stage, token)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True)
+        else:
+            shutil.copy2(src, dst)
+    mods = os.path.join(ctx.build_path, "mods")
+    if getattr(ctx.args, "mods", False) and os.path.isdir(mods):
+        shutil.copytree(mods, os.path.join(stage, "mods"), symlinks=True)
+    os.makedirs(stage, exist_ok=True)
+    ctx.install_path = stage
+    return stage
+
+
 def get_testpath(ctx, fl):
     """Get path to test suite for flavor."""
     testpath = ctx.job_path + "/" + fl
@@ -277,23 +514,130 @@ def get_testpath(ctx, fl):
     return testpath
 
 
-def process_test_files(ctx, td, job_ctx, testpath, duration, jobs):
-    """Process all test template files in testpath."""
-    for file in sorted(os.listdir(testpath)):
-        if not file.endswith(".jinja2"):
-            continue
+def render_test_file(
+    job_path, filename, job_ctx, cache_dir, td, hostname, duration, tests
+):
+    """Render one template and split it into job files.
 
-        filename = testpath + "/" + file
-        job = generate_job(ctx.job_path, filename, job_ctx)
+    Returns the split file names, or [] if the job does not match the
+    ``tests`` filter. Runs in a worker process of process_test_files.
+    """
+    job = yaml_load(generate_job(job_path, filename, job_ctx, cache_dir))
+    if tests and job["job_name"] != tests:
+        return []
 
-        j = yaml.safe_load(job)
-        if ctx.args.tests and j["job_name"] != ctx.args.tests:
-            continue
+    stem = os.path.basename(filename).removesuffix(".jinja2")
+    return generate_split_files(td, job, hostname, duration, stem)
+
+
+def _render_executor(workers):
+    """Executor for render_test_file: processes, or one thread if workers <= 1."""
+    if workers <= 1:
+        return ThreadPoolExecutor(max_workers=1)
+    # forkserver: the parent has threads (event loop, XML-RPC pool)
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+    )
 
-        files = generate_split_files(td, job, ctx.hostname, duration)
-        for j in files:
-            (_, res) = run_cmd(["lavacli", "jobs", "submit", j])
-            jobs.append(str(res).strip())
+
+async def _render_and_submit(
+    ctx, td, job_ctx, templates, duration, submitter, workers, manifest=None
+):
+    """Render templates on a pool and submit each one as soon as it is split.
+
+    Job files the manifest lists as submitted are not submitted again.
+    Returns the SubmitResults grouped per template, in template order.
+    """
+    loop = asyncio.get_running_loop()
+    done = manifest.submitted() if manifest else {}
+
+    async def submit(template, path):
+        key = (os.path.basename(template), os.path.basename(path))
+        if key in done:
+            return SubmitResult(path, done[key], None, 0)
+        res = await submitter.submit(path)
+        if manifest:
+            manifest.record(template, res)
+        return res
+
+    async def render_then_submit(template, render):
+        files = await render
+        if manifest:
+            manifest.plan(template, files)
+        return await asyncio.gather(*(submit(template, f) for f in files))
+
+    with _render_executor(workers) as executor:
+        renders = [
+            loop.run_in_executor(
+                executor,
+                render_test_file,
+                ctx.job_path,
+                filename,
+                job_ctx,
+                ctx.template_cache_path,
+                td,
+                ctx.hostname,
+                duration,
+                ctx.args.tests,
+            )
+            for filename in templates
+        ]
+        return await asyncio.gather(
+            *(render_then_submit(t, r) for t, r in zip(templates, renders))
+        )
+
+
+@traced(cat="jobs")
+def process_test_files(
+    ctx, td, job_ctx, testpath, duration, jobs, system_config, manifest=None
+):
+    """Process all test template files in testpath.
+
+    Rendering and splitting run on ``--render-workers`` processes while
+    the job files that are already split get submitted. With --tests only
+    the templates the catalog lists under that job name are rendered.
+    The submission state of every job file is kept in manifest (a
+    FlavorManifest), if given.
+    """
+    catalog = get_catalog(ctx)
+    entries = catalog.suite(testpath)
+    catalog.save()
+    if ctx.args.tests:
+        entries = [e for e in entries if e["job_name"] == ctx.args.tests]
+    templates = [testpath + "/" + e["file"] for e in entries]
+    if not templates:
+        return
+
+    workers = getattr(ctx.args, "render_workers", None) or os.cpu_count() or 1
+    workers = min(workers, len(templates))
+    submitter = get_submitter(system_config)
+    with span("render+submit", "lava", templates=len(templates), workers=workers):
+        submitted = run_until_complete(
+            _render_and_submit(
+                ctx, td, job_ctx, templates, duration, submitter, workers, manifest
+            )
+        )
+    collect_submissions(
+        ctx, [r for results in submitted for r in results], jobs, system_config
+    )
+
+
+def collect_submissions(ctx, results, jobs, system_config):
+    """Append the job ids of SubmitResults to jobs and record failures."""
+    failures = []
+    for res in results:
+        if res.error:
+            failures.append((res.path, res.error, res.attempts))
+        jobs.extend(str(job_id) for job_id in res.job_ids)
+
+    if failures:
+        save_failed_submissions_to_db(ctx.args.machine, failures, system_config)
+        print(
+            f"{bcolors.FAIL}{len(failures)} job(s) could not be submitted:"
+            f"{bcolors.ENDC}"
+        )
+        for path, err, attempts in failures:
+            print(f"  {os.path.basename(path)}: {err} ({attempts} attempts)")
 
 
 def save_job_ids(ctx, jobs, system_config):
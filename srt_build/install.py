@@ -0,0 +1,202 @@
+"""Upload of build outputs described by the machine's install spec.
+
+An install entry in machine_config is either a list of transfers::
+
+    install:
+      lava:
+        - src: arch/arm/boot/zImage
+          dest: root@lava:/srv/www/htdocs/artifacts/bbb/bbb-image{}
+        - src: arch/arm/boot/dts/ti/omap/am335x-boneblack.dtb
+          dest: root@lava:/srv/www/htdocs/artifacts/bbb/
+
+or a shell command. Commands made of plain ``scp <files> <dest>`` parts
+separated by ``;`` are read as transfers as well; anything else is run
+by the shell as before.
+
+Transfers to a host share one SSH connection (see ssh.py). The sha256
+of the remote copies is read with a single ssh call first, which also
+opens that connection, and files whose remote copy matches are skipped.
+The remaining files are copied concurrently, with compression (scp -C)
+if they are larger than system_config install-compress-min.
+"""
+
+import collections
+import hashlib
+import os
+import re
+import shlex
+from logging import error
+
+from .core import run_cmd, run_cmds
+from .ssh import scp_cmd, ssh_cmd
+
+# host is None for a local destination
+Transfer = collections.namedtuple("Transfer", "src host path")
+
+DEFAULT_COMPRESS_MIN = 8 << 20
+
+# options of cp and scp which do not change where files end up
+_COPY_FLAGS = {"-C", "-p", "-q", "-v", "-f"}
+
+
+def parse_dest(dest):
+    """Split an scp destination into (host, path); host None if local."""
+    head, sep, tail = dest.partition(":")
+    if not sep or "/" in head or not head:
+        return (None, dest)
+    return (head, tail)
+
+
+def _transfer(src, dest):
+    host, path = parse_dest(dest)
+    return Transfer(src, host, path)
+
+
+def parse_scp_command(cmd):
+    """Transfers of a ``scp a b ; scp c d`` command, or None if it is more."""
+    transfers = []
+    for part in cmd.split(";"):
+        try:
+            argv = shlex.split(part)
+        except ValueError:
+            return None
+        if not argv:
+            continue
+        if argv[0] != "scp" or len(argv) < 3:
+            return None
+        *srcs, dest = argv[1:]
+        if any(a.startswith("-") or parse_dest(a)[0] for a in srcs):
+            return None
+        transfers += [_transfer(src, dest) for src in srcs]
+    return transfers or None
+
+
+def parse_spec(spec, postfix=""):
+    """Transfers of an install spec, or None for a shell command."""
+    if isinstance(spec, str):
+        return parse_scp_command(spec.format(postfix))
+    return [_transfer(e["src"], e["dest"].format(postfix)) for e in spec]
+
+
+def command_transfers(cmd, files):
+    """Transfers of files by a ``cp``/``scp`` shell command, or None.
+
+    None if a part of cmd is anything else or some of files are not
+    copied by it: where they went is unknown then.
+    """
+    transfers = []
+    for part in re.split(r";|&&", cmd):
+        try:
+            argv = shlex.split(part)
+        except ValueError:
+            return None
+        if not argv:
+            continue
+        if argv[0] not in ("cp", "scp") or len(argv) < 3:
+            return None
+        if any(a.startswith("-") and a not in _COPY_FLAGS for a in argv[1:]):
+            return None
+        *srcs, dest = [a for a in argv[1:] if not a.startswith("-")]
+        if argv[0] == "cp":
+            transfers += [Transfer(src, None, dest) for src in srcs if src in files]
+        else:
+            transfers += [_transfer(src, dest) for src in srcs if src in files]
+    if {t.src for t in transfers} != set(files):
+        return None
+    return transfers
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _remote_hash_script(transfers):
+    """Shell script printing "<index> <sha256>" of the existing remote copies."""
+    lines = []
+    for i, t in enumerate(transfers):
+        base = shlex.quote(os.path.basename(t.src))
+        lines.append(
+            f"f={shlex.quote(t.path)}; "
+            f'[ -d "$f" ] && f="$f"/{base}; '
+            f'h=$(sha256sum "$f" 2>/dev/null) && echo "{i} ${{h%% *}}"'
+        )
+    lines.append("true")
+    return "; ".join(lines)
+
+
+def remote_hashes(host, transfers):
+    """{index: sha256} of the copies of transfers existing on host."""
+    script = _remote_hash_script(transfers)
+    (ret, output) = run_cmd(ssh_cmd(host, script), capture=True)
+    if ret:
+        return {}
+    hashes = {}
+    for line in output.splitlines():
+        index, _, digest = line.partition(" ")
+        if index.isdigit() and digest:
+            hashes[int(index)] = digest.strip()
+    return hashes
+
+
+def _local_hash(t, cwd):
+    path = os.path.join(cwd, t.path)
+    if os.path.isdir(path):
+        path = os.path.join(path, os.path.basename(t.src))
+    try:
+        return _sha256_file(path) if os.path.isfile(path) else None
+    except OSError:
+        return None
+
+
+def pending(transfers, cwd, force=False):
+    """The transfers whose destination does not have the same content."""
+    if force:
+        return list(transfers)
+    local = {t.src: _sha256_file(os.path.join(cwd, t.src)) for t in transfers}
+    todo = []
+    by_host = collections.defaultdict(list)
+    for t in transfers:
+        by_host[t.host].append(t)
+    for host, group in by_host.items():
+        if host is None:
+            existing = {i: _local_hash(t, cwd) for i, t in enumerate(group)}
+        else:
+            existing = remote_hashes(host, group)
+        for i, t in enumerate(group):
+            if existing.get(i) == local[t.src]:
+                print(f"{t.src} is up to date on {host or 'localhost'}, skipping")
+            else:
+                todo.append(t)
+    return todo
+
+
+def transfer_cmd(t, cwd, compress_min=DEFAULT_COMPRESS_MIN):
+    if t.host is None:
+        return ["cp", t.src, t.path]
+    args = ["-q"]
+    if os.path.getsize(os.path.join(cwd, t.src)) >= compress_min:
+        args.append("-C")
+    return scp_cmd(*args, t.src, f"{t.host}:{t.path}")
+
+
+def upload(transfers, cwd, compress_min=None, force=False):
+    """Copy transfers whose destination differs, concurrently.
+
+    Returns the first non-zero exit code, else 0.
+    """
+    missing = [t.src for t in transfers if not os.path.isfile(os.path.join(cwd, t.src))]
+    if missing:
+        error(f"install: missing build outputs {', '.join(missing)} in {cwd}")
+        return 1
+    todo = pending(transfers, cwd, force)
+    if compress_min is None:
+        compress_min = DEFAULT_COMPRESS_MIN
+    cmds = [transfer_cmd(t, cwd, compress_min) for t in todo]
+    for ret, _ in run_cmds(cmds, cwd=cwd):
+        if ret:
+            return ret
+    return 0
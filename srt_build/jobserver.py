@@ -0,0 +1,76 @@
+"""GNU make jobserver shared by concurrent kernel builds.
+
+Every make started while a Jobserver is active takes its job slots from
+one pipe instead of running its own ``-jN``, so several flavors can be
+built at the same time without oversubscribing the host. The pipe is
+passed with ``--jobserver-auth=R,W`` (GNU make 4.2 or newer).
+"""
+
+import os
+import threading
+from logging import debug
+
+from . import parallelism
+
+_current = None
+_lock = threading.Lock()
+
+
+class Jobserver:
+    """Pipe holding the job slots of concurrently running makes.
+
+    Each make has one implicit slot, so with ``clients`` makes running
+    at once ``slots - clients`` tokens go into the pipe to keep the total
+    number of jobs at ``slots``.
+    """
+
+    def __init__(self, slots=None, clients=1):
+        self.slots = max(1, slots or parallelism.auto_jobs())
+        self.clients = max(1, clients)
+        self.rfd = self.wfd = None
+
+    def open(self):
+        self.rfd, self.wfd = os.pipe()
+        tokens = max(0, self.slots - self.clients)
+        os.write(self.wfd, b"+" * tokens)
+        debug(f"jobserver: {self.slots} slots, {self.clients} makes, {tokens} tokens")
+
+    def close(self):
+        for fd in (self.rfd, self.wfd):
+            if fd is not None:
+                os.close(fd)
+        self.rfd = self.wfd = None
+
+    @property
+    def fds(self):
+        return (self.rfd, self.wfd)
+
+    def makeflags(self):
+        return f"-j{self.slots} --jobserver-auth={self.rfd},{self.wfd}"
+
+    def env(self, base=None):
+        """Environment for a make that joins this jobserver."""
+        env = dict(os.environ if base is None else base)
+        flags = env.get("MAKEFLAGS", "")
+        env["MAKEFLAGS"] = f"{flags} {self.makeflags()}".strip()
+        return env
+
+    def __enter__(self):
+        global _current
+        with _lock:
+            if _current is not None:
+                raise RuntimeError("a jobserver is already active")
+            self.open()
+            _current = self
+        return self
+
+    def __exit__(self, *exc):
+        global _current
+        with _lock:
+            _current = None
+            self.close()
+
+
+def current():
+    """Return the active Jobserver or None."""
+    return _current
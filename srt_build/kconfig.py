@@ -0,0 +1,168 @@
+"""Kernel .config files: fragment merging and the resolved-config cache.
+
+Fragments are applied to the base config in memory and the result is
+written once, so kconfig (olddefconfig) runs a single time per config.
+The resolved config is cached by defconfig, fragment content, kernel
+version and toolchain; switching back to a flavor configured before
+restores the cached .config without running kconfig at all.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+from logging import debug, warning
+
+_SET_RE = re.compile(r"^(CONFIG_[A-Za-z0-9_]+)=(.*)$")
+_UNSET_RE = re.compile(r"^# (CONFIG_[A-Za-z0-9_]+) is not set$")
+
+
+def parse_config(path):
+    """Return {symbol: value} of a .config or fragment.
+
+    ``# CONFIG_FOO is not set`` is returned as value "n". Later lines
+    override earlier ones, like in merge_config.sh.
+    """
+    symbols = {}
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            m = _SET_RE.match(line) or _UNSET_RE.match(line)
+            if not m:
+                continue
+            symbols[m.group(1)] = m.group(2) if m.lastindex == 2 else "n"
+    return symbols
+
+
+def requested_mismatches(fragments, config):
+    """Compare the symbols requested by fragments with the final config.
+
+    Returns [(symbol, requested, actual, fragment), ...] for every symbol
+    whose last requested value did not make it into config, typically
+    because of unmet dependencies. actual is None if the symbol is not
+    in config at all.
+    """
+    requested = {}
+    for fragment in fragments:
+        for symbol, value in parse_config(fragment).items():
+            requested[symbol] = (value, fragment)
+
+    actual = parse_config(config)
+    mismatches = []
+    for symbol, (value, fragment) in requested.items():
+        got = actual.get(symbol)
+        if got == value or (got is None and value == "n"):
+            continue
+        mismatches.append((symbol, value, got, fragment))
+    return mismatches
+
+
+def format_symbol(symbol, value):
+    """Return the .config line of a symbol."""
+    if value == "n":
+        return f"# {symbol} is not set"
+    return f"{symbol}={value}"
+
+
+def merge(base, fragments):
+    """Apply fragments to the base config in memory, like merge_config.sh -m.
+
+    base is a {symbol: value} dict, fragments are paths applied in order.
+    Returns the merged dict; base is not modified.
+    """
+    merged = dict(base)
+    for fragment in fragments:
+        for symbol, value in parse_config(fragment).items():
+            old = merged.get(symbol)
+            if old is not None and old != value:
+                debug(f"{os.path.basename(fragment)}: {symbol} {old} -> {value}")
+            merged[symbol] = value
+    return merged
+
+
+def write_config(path, symbols):
+    """Write symbols as a .config, to be completed by olddefconfig."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        for symbol, value in symbols.items():
+            f.write(format_symbol(symbol, value) + "\n")
+    os.replace(tmp, path)
+
+
+_VERSION_RE = re.compile(r"^(VERSION|PATCHLEVEL|SUBLEVEL|EXTRAVERSION)\s*=\s*(.*)$")
+
+
+def kernel_version(makefile="Makefile"):
+    """Return the version of the kernel tree from its top Makefile, or None."""
+    fields = {}
+    try:
+        with open(makefile, "r") as f:
+            for line in f:
+                m = _VERSION_RE.match(line.strip())
+                if m:
+                    fields.setdefault(m.group(1), m.group(2).strip())
+                if len(fields) == 4:
+                    break
+    except OSError:
+        return None
+    if "VERSION" not in fields:
+        return None
+    version = f"{fields['VERSION']}.{fields.get('PATCHLEVEL', '0')}"
+    if fields.get("SUBLEVEL"):
+        version += f".{fields['SUBLEVEL']}"
+    return version + fields.get("EXTRAVERSION", "")
+
+
+def _sha256_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def cache_key(defconfig, config_file, fragments, version, toolchain=()):
+    """Key of a resolved config.
+
+    The base is either the defconfig target or, if given, config_file.
+    Files are hashed by content, so editing a fragment gives a new key.
+    """
+    data = {
+        "defconfig": None if config_file else defconfig,
+        "config": _sha256_file(config_file) if config_file else None,
+        "fragments": [_sha256_file(f) for f in fragments],
+        "version": version,
+        "toolchain": list(toolchain),
+    }
+    encoded = json.dumps(data, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ConfigCache:
+    """Directory of resolved (post olddefconfig) .config files by key."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".config")
+
+    def restore(self, key, dest):
+        """Copy the config cached under key to dest. Returns False on a miss."""
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(self._file(key), dest)
+        except FileNotFoundError:
+            return False
+        except OSError as exc:
+            warning(f"Unable to restore cached config {key}: {exc}")
+            return False
+        return True
+
+    def store(self, key, src):
+        """Cache the resolved config src under key."""
+        tmp = f"{self._file(key)}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, self._file(key))
+        except OSError as exc:
+            warning(f"Unable to cache config {key}: {exc}")
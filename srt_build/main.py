@@ -10,6 +10,9 @@ import asyncio
 from .config import load_config, bcolors
 from .core import setup, check_kernel_source_directory
 from .helpers import Context
+from .ssh import ConnectionManager
+from . import trace
+from .trace import span
 from .commands import (
     cmd_config,
     cmd_build,
@@ -30,6 +33,25 @@ def create_parser():
     )
     parser.add_argument("--append", default="")
     parser.add_argument("--builddir", default=None)
+    parser.add_argument(
+        "--flavor-builddirs",
+        action="store_true",
+        help="Build every flavor in its own tree <builddir>/<flavor>",
+    )
+    parser.add_argument(
+        "--parallel-builds",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Build up to N flavors at once, sharing one make jobserver "
+        "(implies --flavor-builddirs)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        default=None,
+        help="Write a Chrome trace-event JSON of the run to FILE",
+    )
 
     subparser = parser.add_subparsers(
         help="sub command help", dest="cmd", required=True
@@ -57,6 +79,13 @@ def main():
     parser = create_parser()
     args = parser.parse_args(sys.argv[1:])
 
+    if args.trace:
+        trace.start(args.trace)
+
+    # Concurrent flavor builds cannot share one O= tree
+    if args.parallel_builds > 1:
+        args.flavor_builddirs = True
+
     # Test hook: allow tests to inject a short sleep window to reliably send SIGINT
     # (Used by tests/test_ctrl_c.py). This keeps production behavior unchanged.
     import os  # local import to avoid polluting module namespace unnecessarily
@@ -96,6 +125,48 @@ def main():
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    with span(f"srt-build {args.cmd}", "command"):
+        run_command(
+            args, system_config, kernel_config, machine_config, rt_suites, suites
+        )
+
+
+def _dispatch(ctx, args, system_config, kernel_config, rt_suites, suites):
+    """Call the command with the configuration it needs."""
+    # Pass necessary config to commands that need it
+    if args.func in (cmd_config.cmd_config, cmd_build.cmd_build):
+        args.func(ctx, kernel_config)
+    elif args.func == cmd_lava.cmd_lava:
+        args.func(ctx, system_config, kernel_config)
+    elif args.func in (cmd_smoke.cmd_smoke, cmd_kexec.cmd_kexec):
+        args.func(ctx, system_config)
+    elif args.func == cmd_all.cmd_all:
+        args.func(ctx, kernel_config, system_config)
+    elif hasattr(args, "jobs_cmd"):
+        # Jobs subcommands
+        from .commands import (
+            cmd_jobs_list,
+            cmd_jobs_results,
+            cmd_jobs_compare,
+            cmd_jobs_cancel,
+        )
+
+        if args.func == cmd_jobs_list.cmd_jobs_list:
+            args.func(ctx, system_config)
+        elif args.func == cmd_jobs_results.cmd_jobs_results:
+            args.func(ctx, system_config, rt_suites, suites)
+        elif args.func == cmd_jobs_compare.cmd_jobs_compare:
+            args.func(ctx, system_config, rt_suites, suites)
+        elif args.func == cmd_jobs_cancel.cmd_jobs_cancel:
+            args.func(ctx, system_config)
+        else:
+            args.func(ctx)
+    else:
+        args.func(ctx)
+
+
+def run_command(args, system_config, kernel_config, machine_config, rt_suites, suites):
+    """Create the context and dispatch to the selected command."""
     # Special handling for lava --list-tests (doesn't require machine)
     if (
         args.func == cmd_lava.cmd_lava
@@ -139,36 +210,11 @@ def main():
     # Create context and run command
     if hasattr(args, "machine"):
         ctx = Context(args, machine_config, system_config)
-        # Pass necessary config to commands that need it
-        if args.func == cmd_config.cmd_config:
-            args.func(ctx, kernel_config)
-        elif args.func == cmd_lava.cmd_lava:
-            args.func(ctx, system_config, kernel_config)
-        elif args.func == cmd_smoke.cmd_smoke:
-            args.func(ctx, system_config)
-        elif args.func == cmd_all.cmd_all:
-            args.func(ctx, kernel_config)
-        elif hasattr(args, "jobs_cmd"):
-            # Jobs subcommands
-            from .commands import (
-                cmd_jobs_list,
-                cmd_jobs_results,
-                cmd_jobs_compare,
-                cmd_jobs_cancel,
-            )
-
-            if args.func == cmd_jobs_list.cmd_jobs_list:
-                args.func(ctx, system_config)
-            elif args.func == cmd_jobs_results.cmd_jobs_results:
-                args.func(ctx, system_config, rt_suites, suites)
-            elif args.func == cmd_jobs_compare.cmd_jobs_compare:
-                args.func(ctx, system_config, rt_suites, suites)
-            elif args.func == cmd_jobs_cancel.cmd_jobs_cancel:
-                args.func(ctx, system_config)
-            else:
-                args.func(ctx)
-        else:
-            args.func(ctx)
+        # one SSH connection per host for all installs and kexecs
+        with ConnectionManager(
+            ctx.ssh_control_path, system_config.get("ssh-control-persist", 60)
+        ):
+            _dispatch(ctx, args, system_config, kernel_config, rt_suites, suites)
     else:
         # Some commands might not need machine
         args.func(args)
@@ -0,0 +1,144 @@
+"""Manifest of a lava command run, kept in the jobs database.
+
+Every built flavor and every split job file with its submission state is
+recorded while the run progresses, so an interrupted run can be picked
+up again with --resume: flavors built from the same tree state are not
+rebuilt and jobs already submitted are not submitted again.
+"""
+
+import json
+import os
+from logging import debug
+
+from .database import (
+    complete_lava_run,
+    create_lava_run,
+    find_lava_run,
+    get_lava_run_flavor,
+    get_lava_run_jobs,
+    plan_lava_run_jobs,
+    set_lava_run_flavor,
+    update_lava_run_job,
+)
+
+
+def run_signature(flavors, args, duration):
+    """Identify a run by what it builds and submits."""
+    return json.dumps(
+        {
+            "flavors": list(flavors),
+            "testsuites": args.testsuites,
+            "tests": args.tests,
+            "duration": duration,
+            "config_base": args.config_base,
+        },
+        sort_keys=True,
+    )
+
+
+class RunManifest:
+    """Submission manifest of one lava command run."""
+
+    def __init__(self, run_id, system_config, resumed=False):
+        self.run_id = run_id
+        self.system_config = system_config
+        self.resumed = resumed
+        self.done = set()
+
+    @classmethod
+    def start(cls, machine, signature, system_config, resume=False):
+        """Resume the last unfinished matching run or start a new one."""
+        if resume:
+            run_id = find_lava_run(machine, signature, system_config)
+            if run_id is not None:
+                return cls(run_id, system_config, resumed=True)
+            print("No unfinished run to resume, starting a new one")
+        return cls(create_lava_run(machine, signature, system_config), system_config)
+
+    def flavor(self, flavor):
+        return FlavorManifest(self, flavor)
+
+    def finish(self, flavors):
+        """Mark the run completed if all flavors are done.
+
+        Otherwise it stays open so --resume builds the missing flavors
+        and retries the failed submissions. Returns True if completed.
+        """
+        missing = [fl for fl in flavors if fl not in self.done]
+        if missing:
+            print(
+                f"Flavors {', '.join(missing)} not done, " "use --resume to retry them"
+            )
+            return False
+        complete_lava_run(self.run_id, self.system_config)
+        return True
+
+
+class FlavorManifest:
+    """The part of a RunManifest recording one flavor."""
+
+    def __init__(self, run, flavor):
+        self.run = run
+        self.flavor = flavor
+        self._submitted = None
+
+    def is_built(self, postfix):
+        """True if the flavor was built and installed for postfix already."""
+        state = get_lava_run_flavor(
+            self.run.run_id, self.flavor, self.run.system_config
+        )
+        return state is not None and state == (postfix, True)
+
+    def mark_built(self, postfix):
+        set_lava_run_flavor(
+            self.run.run_id, self.flavor, postfix, True, self.run.system_config
+        )
+
+    def submitted(self):
+        """Return {(template, split file): job ids} of the submitted jobs.
+
+        Both are base names: templates of a suite may share test names.
+        """
+        if self._submitted is None:
+            jobs = get_lava_run_jobs(
+                self.run.run_id, self.flavor, self.run.system_config
+            )
+            self._submitted = {
+                key: job_ids
+                for key, (state, job_ids) in jobs.items()
+                if state == "submitted" and job_ids
+            }
+        return self._submitted
+
+    def finish(self):
+        """Mark the flavor done if every planned job was submitted."""
+        jobs = get_lava_run_jobs(self.run.run_id, self.flavor, self.run.system_config)
+        if all(state == "submitted" and ids for state, ids in jobs.values()):
+            self.run.done.add(self.flavor)
+
+    def plan(self, template, files):
+        """Record the split job files of a template."""
+        plan_lava_run_jobs(
+            self.run.run_id,
+            self.flavor,
+            os.path.basename(template),
+            [os.path.basename(f) for f in files],
+            self.run.system_config,
+        )
+
+    def record(self, template, result):
+        """Record the SubmitResult of a split job file of template."""
+        template = os.path.basename(template)
+        split = os.path.basename(result.path)
+        state = "failed" if result.error else "submitted"
+        debug(f"manifest: {self.flavor}/{template}/{split} {state} {result.job_ids}")
+        update_lava_run_job(
+            self.run.run_id,
+            self.flavor,
+            template,
+            split,
+            state,
+            result.job_ids,
+            self.run.system_config,
+            result.error,
+        )
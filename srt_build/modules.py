@@ -0,0 +1,88 @@
+"""Deployment of the installed modules as one compressed tar stream.
+
+modules_install puts thousands of small files into <build_path>/mods.
+Instead of copying them one by one, ``tar | zstd`` (or xz, gzip) is
+streamed over a single ssh connection. machine_config names the
+destination per install dest, formatted with the postfix::
+
+    modules:
+      # a path ending in .tar.<compression>: stored as tarball, e.g.
+      # for the LAVA artifact server
+      lava: "root@lava:/srv/www/htdocs/artifacts/bbb/bbb-modules{}.tar.xz"
+      # any other path: unpacked there, e.g. on the target
+      default: "bbb:/"
+
+A board's ``modules_url`` (formatted with the postfix as well) makes the
+generated LAVA jobs deploy the tarball as their ``modules`` artifact.
+"""
+
+import os
+import shlex
+import shutil
+from logging import error
+
+from .core import run_cmd
+from .install import parse_dest
+from .ssh import ssh_cmd
+
+# compression: (compress argv, decompress argv, file suffix)
+COMPRESSORS = {
+    "zstd": (["zstd", "-q", "-T0"], ["zstd", "-q", "-d"], ".zst"),
+    "xz": (["xz", "-T0"], ["xz", "-d"], ".xz"),
+    "gz": (["gzip"], ["gzip", "-d"], ".gz"),
+}
+
+
+def compression_of(path):
+    """Compression of a tarball path by its suffix, or None."""
+    for name, (_, _, suffix) in COMPRESSORS.items():
+        if path.endswith(".tar" + suffix):
+            return name
+    return None
+
+
+def choose_compression(preferred="zstd"):
+    """The preferred compression if installed, else the first available."""
+    for name in (preferred, *COMPRESSORS):
+        if name in COMPRESSORS and shutil.which(COMPRESSORS[name][0][0]):
+            return name
+    return "gz"
+
+
+def deploy_script(mods_dir, host, path, compression):
+    """Shell pipeline streaming mods_dir/lib to path (on host, if set)."""
+    compress, decompress, _ = COMPRESSORS[compression]
+    q = shlex.quote
+    if compression_of(path):
+        remote = f"cat > {q(path + '.tmp')} && mv {q(path + '.tmp')} {q(path)}"
+    else:
+        remote = f"{shlex.join(decompress)} | tar -C {q(path)} -xf -"
+    sink = shlex.join(ssh_cmd(host, remote)) if host else f"sh -c {q(remote)}"
+    return f"tar -C {q(mods_dir)} -cf - lib | {shlex.join(compress)} | {sink}"
+
+
+def deploy(ctx, dest, cwd):
+    """Stream the modules installed under cwd/mods to dest. Returns exit code."""
+    mods = os.path.join(cwd, "mods")
+    if not os.path.isdir(os.path.join(mods, "lib")):
+        error(f"No installed modules in {mods}, build with --mods")
+        return 1
+    host, path = parse_dest(dest)
+    compression = compression_of(path) or choose_compression(
+        ctx.modules_compression or "zstd"
+    )
+    script = deploy_script(mods, host, path, compression)
+    # a failing tar or compressor must fail the deploy, not only the sink
+    (ret, _) = run_cmd(["bash", "-o", "pipefail", "-c", script])
+    return ret
+
+
+def set_job_vars(job_ctx, postfix, enabled):
+    """Set modules_url and modules_compression of a job, or drop them."""
+    url = job_ctx.pop("modules_url", None)
+    job_ctx.pop("modules_compression", None)
+    if not enabled or not url:
+        return
+    url = url.format(postfix)
+    job_ctx["modules_url"] = url
+    job_ctx["modules_compression"] = compression_of(url) or "none"
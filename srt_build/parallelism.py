@@ -0,0 +1,144 @@
+"""Number of make jobs a kernel build may run on this host.
+
+multiprocessing.cpu_count() is the number of CPUs of the whole host. In
+a container or a restricted slice fewer are usable, so the job count is
+the minimum of
+
+- the CPUs in the affinity mask (os.sched_getaffinity),
+- the cgroup v2 CPU quota (cpu.max) of this process and its parents,
+- the available memory (MemAvailable, capped by cgroup memory.max)
+  divided by the memory one compiler job needs.
+
+Settings (machine_config overrides system_config)::
+
+    system_config:
+      build-jobs: 16            # fixed job count instead of the above
+      build-load-average: 12    # make -l, not used by default
+      build-mem-per-job: 1024   # MiB per job, default 512
+
+    machine_config:
+      c2d:
+        jobs: 8
+        load_average: 10
+"""
+
+import math
+import os
+from logging import debug
+
+DEFAULT_MEM_PER_JOB = 512  # MiB
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+PROC_CGROUP = "/proc/self/cgroup"
+MEMINFO = "/proc/meminfo"
+
+
+def affinity_cpus():
+    """CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_dirs(cgroup_root, proc_cgroup):
+    """cgroup v2 directories of this process, innermost first."""
+    content = _read(proc_cgroup)
+    if content is None:
+        return []
+    for line in content.splitlines():
+        # the unified hierarchy is "0::/path"
+        if line.startswith("0::"):
+            rel = line[3:].strip("/")
+            break
+    else:
+        return []
+    dirs = []
+    parts = rel.split("/") if rel else []
+    while True:
+        dirs.append(os.path.join(cgroup_root, *parts))
+        if not parts:
+            return dirs
+        parts.pop()
+
+
+def cgroup_cpu_quota(cgroup_root=CGROUP_ROOT, proc_cgroup=PROC_CGROUP):
+    """CPUs allowed by the tightest cgroup v2 cpu.max, or None if unlimited."""
+    quota = None
+    for d in _cgroup_dirs(cgroup_root, proc_cgroup):
+        value = _read(os.path.join(d, "cpu.max"))
+        if not value:
+            continue
+        fields = value.split()
+        if fields[0] == "max" or len(fields) != 2:
+            continue
+        try:
+            cpus = int(fields[0]) / int(fields[1])
+        except (ValueError, ZeroDivisionError):
+            continue
+        quota = cpus if quota is None else min(quota, cpus)
+    return quota
+
+
+def available_memory(meminfo=MEMINFO, cgroup_root=CGROUP_ROOT, proc_cgroup=PROC_CGROUP):
+    """Bytes of memory available to new processes, or None if unknown."""
+    available = None
+    content = _read(meminfo)
+    for line in (content or "").splitlines():
+        if line.startswith("MemAvailable:"):
+            available = int(line.split()[1]) * 1024
+            break
+    for d in _cgroup_dirs(cgroup_root, proc_cgroup):
+        limit = _read(os.path.join(d, "memory.max"))
+        current = _read(os.path.join(d, "memory.current"))
+        if not limit or limit == "max" or current is None:
+            continue
+        try:
+            free = max(0, int(limit) - int(current))
+        except ValueError:
+            continue
+        available = free if available is None else min(available, free)
+    return available
+
+
+def auto_jobs(mem_per_job=DEFAULT_MEM_PER_JOB):
+    """Job count from affinity, cgroup CPU quota and available memory."""
+    jobs = affinity_cpus()
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        jobs = min(jobs, max(1, math.ceil(quota)))
+    memory = available_memory()
+    if memory is not None and mem_per_job:
+        jobs = min(jobs, max(1, memory // (int(mem_per_job) * 1024 * 1024)))
+    debug(f"parallelism: {jobs} jobs (affinity {affinity_cpus()}, cpu.max {quota})")
+    return max(1, int(jobs))
+
+
+def build_jobs(machine, system_config):
+    """Job count for builds of a machine (its machine_config entry)."""
+    jobs = machine.get("jobs") or system_config.get("build-jobs")
+    if jobs:
+        return max(1, int(jobs))
+    return auto_jobs(system_config.get("build-mem-per-job", DEFAULT_MEM_PER_JOB))
+
+
+def load_average(machine, system_config):
+    """Load average limit for make -l, or None."""
+    return machine.get("load_average") or system_config.get("build-load-average")
+
+
+def make_args(ctx):
+    """The -j (and -l) arguments of a parallel make for ctx."""
+    args = [f"-j{getattr(ctx, 'jobs', None) or affinity_cpus()}"]
+    load = getattr(ctx, "load_average", None)
+    if load:
+        args.append(f"-l{load}")
+    return args
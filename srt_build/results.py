@@ -6,8 +6,8 @@ import yaml
 import urllib.request
 from logging import debug, error
 from pprint import pprint, pformat
-from .config import bcolors
-from .core import run_cmd
+from .config import bcolors, yaml_load
+from .lava import get_lava
 from .helpers import load_job_ctx
 
 
@@ -97,7 +97,7 @@ def job_result_print(
         return
 
     try:
-        res_ctx = yaml.safe_load(result)
+        res_ctx = yaml_load(result)
     except yaml.YAMLError as exc:
         pprint(exc)
         return
@@ -131,12 +131,11 @@ def job_result_print(
                     outfile.write(data)
 
 
-def get_job_context(id, ctx):
+def get_job_context(id, ctx, system_config):
     """Get job context including host and description."""
     data = {}
     try:
-        (_, res) = run_cmd(["lavacli", "jobs", "show", "--yaml", str(id)])
-        job = yaml.safe_load(res)
+        (_, job) = get_lava(system_config).show_one(id)
 
         # Check if job has a device assigned yet
         if job["device"] is None:
@@ -159,7 +158,7 @@ def get_job_context(id, ctx):
 def get_result(jobid, result, rt_suites, suites):
     """Parse job result into table format."""
     try:
-        job_ctx = yaml.safe_load(result)
+        job_ctx = yaml_load(result)
     except yaml.YAMLError as exc:
         error(f"YAML error in job result for job {jobid}: {exc}")
         return []
@@ -189,8 +188,9 @@ def get_results(machine, id, system_config, rt_suites, suites):
     from .helpers import get_jobs
 
     results = []
-    for j in get_jobs(machine, id, system_config, batch=False):
-        (_, res) = run_cmd(["lavacli", "results", "--yaml", str(j)])
+    jobs = get_jobs(machine, id, system_config, batch=False)
+    outputs = get_lava(system_config).results_all(jobs)
+    for j, (_, res) in zip(jobs, outputs):
         results.extend(get_result(j, res, rt_suites, suites))
     return results
 
@@ -0,0 +1,120 @@
+"""SSH connections shared by all ssh and scp calls of a command.
+
+While a ConnectionManager is active every ssh/scp started through this
+module (install uploads, kexec, the install shell commands) passes
+ControlMaster options: the first connection to a host becomes the
+master and later ones reuse it instead of doing their own handshake.
+When the manager exits, the masters of the hosts it knows of are
+closed; masters opened from shell commands end after ControlPersist
+seconds without clients.
+"""
+
+import os
+import shlex
+import threading
+
+from .core import run_cmd_async, run_until_complete
+
+_current = None
+_lock = threading.Lock()
+
+
+class ConnectionManager:
+    """ControlMaster sockets in control_dir for the lifetime of a command."""
+
+    def __init__(self, control_dir, persist=60):
+        self.control_dir = control_dir
+        self.persist = persist
+        self.hosts = set()
+
+    def options(self):
+        return [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={os.path.join(self.control_dir, '%C')}",
+            "-o",
+            f"ControlPersist={self.persist}",
+        ]
+
+    def ssh(self, host, *args):
+        """argv of ssh running args on host over the shared connection."""
+        with _lock:
+            self.hosts.add(host)
+        return ["ssh", *self.options(), host, *args]
+
+    def scp(self, *args):
+        """argv of scp over the shared connections."""
+        with _lock:
+            self.hosts.update(_scp_hosts(args))
+        return ["scp", *self.options(), *args]
+
+    def wrap_shell(self, cmd):
+        """Make ssh and scp in a shell command use the shared connections."""
+        opts = shlex.join(self.options())
+        return (
+            f'ssh() {{ command ssh {opts} "$@"; }}; '
+            f'scp() {{ command scp {opts} "$@"; }}; {cmd}'
+        )
+
+    def close(self):
+        """Stop the masters of the hosts connected to through ssh()/scp()."""
+        for host in sorted(self.hosts):
+            # fails harmlessly if there is no master (any more)
+            run_until_complete(
+                run_cmd_async(
+                    ["ssh", *self.options(), "-O", "exit", host], capture=True
+                )
+            )
+        self.hosts.clear()
+
+    def __enter__(self):
+        global _current
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        with _lock:
+            if _current is not None:
+                raise RuntimeError("an ssh connection manager is already active")
+            _current = self
+        return self
+
+    def __exit__(self, *exc):
+        global _current
+        with _lock:
+            _current = None
+        self.close()
+
+
+def _scp_hosts(args):
+    hosts = set()
+    for arg in args:
+        head, sep, _ = arg.partition(":")
+        if sep and head and "/" not in head and not arg.startswith("-"):
+            hosts.add(head)
+    return hosts
+
+
+def current():
+    """Return the active ConnectionManager or None."""
+    return _current
+
+
+def ssh_cmd(host, *args):
+    """argv of ssh to host, over the shared connection if one is active."""
+    manager = current()
+    if manager:
+        return manager.ssh(host, *args)
+    return ["ssh", host, *args]
+
+
+def scp_cmd(*args):
+    """argv of scp, over the shared connections if active."""
+    manager = current()
+    if manager:
+        return manager.scp(*args)
+    return ["scp", *args]
+
+
+def wrap_shell(cmd):
+    """cmd with ssh/scp going over the shared connections if active."""
+    manager = current()
+    return manager.wrap_shell(cmd) if manager else cmd
@@ -0,0 +1,133 @@
+"""Span recorder writing Chrome trace-event JSON (--trace FILE).
+
+Load the file in chrome://tracing or https://ui.perfetto.dev to see where
+the time of a run goes. Recording is off unless start() was called, in
+which case span() and traced() are no-ops apart from one None check.
+"""
+
+import atexit
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from logging import debug, error
+
+_events = None
+_path = None
+_lock = threading.Lock()
+_named_tids = set()
+
+# Concurrent commands run on "lanes" (see core.bounded_gather); each lane
+# gets its own row in the viewer as spans on one row must nest.
+_lane = contextvars.ContextVar("srt_build_trace_lane", default=None)
+LANE_TID_BASE = 1000
+
+
+def start(path):
+    """Enable recording; the trace is written to path at exit."""
+    global _events, _path
+    _events = []
+    _path = path
+    atexit.register(write)
+
+
+def enabled():
+    return _events is not None
+
+
+def set_lane(lane):
+    """Attribute spans of the current task to a concurrency lane."""
+    return _lane.set(lane)
+
+
+def reset_lane(token):
+    _lane.reset(token)
+
+
+def _now_us():
+    return time.perf_counter_ns() // 1000
+
+
+def _tid():
+    lane = _lane.get()
+    if lane is not None:
+        tid, name = LANE_TID_BASE + lane, f"lane {lane}"
+    else:
+        thread = threading.current_thread()
+        tid, name = thread.native_id, thread.name
+    if tid not in _named_tids:
+        _named_tids.add(tid)
+        _events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": name},
+            }
+        )
+    return tid
+
+
+@contextlib.contextmanager
+def span(name, cat="srt-build", **args):
+    """Record the enclosed block as a complete ("X") event.
+
+    Yields the args dict so the block can add results (exit codes etc.).
+    """
+    if _events is None:
+        yield args
+        return
+    begin = _now_us()
+    try:
+        yield args
+    finally:
+        end = _now_us()
+        with _lock:
+            _events.append(
+                {
+                    "name": name,
+                    "cat": cat,
+                    "ph": "X",
+                    "ts": begin,
+                    "dur": end - begin,
+                    "pid": os.getpid(),
+                    "tid": _tid(),
+                    "args": {k: str(v) for k, v in args.items()},
+                }
+            )
+
+
+def traced(name=None, cat="srt-build"):
+    """Decorator recording every call of a function as a span."""
+
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _events is None:
+                return func(*args, **kwargs)
+            with span(label, cat):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def write():
+    """Write the recorded events as Chrome trace JSON."""
+    if _events is None or not _path:
+        return
+    with _lock:
+        data = {"traceEvents": list(_events), "displayTimeUnit": "ms"}
+    try:
+        with open(_path, "w") as f:
+            json.dump(data, f)
+        debug(f"Trace with {len(data['traceEvents'])} events written to {_path}")
+    except OSError as exc:
+        error(f"Could not write trace file {_path}: {exc}")
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+
+import pytest
+
+from srt_build import helpers
+
+
+@pytest.fixture(autouse=True)
+def event_loop():
+    """Provide a fresh event loop like core.setup() does."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture
+def make_context(tmp_path):
+    """Return a factory for Contexts building in tmp_path/build.
+
+    Machine bbb installs to tmp_path/srv with 'lava', c2d has a remote
+    'lava' install. Keyword arguments override the command line args.
+    """
+    machine_config = {
+        "bbb": {
+            "hostname": "bbb",
+            "image": "arch/arm/boot/zImage",
+            "dtb": "arch/arm/boot/dts/bbb.dtb",
+            "install": {
+                "default": "cp arch/arm/boot/zImage {0}",
+                "lava": "cp arch/arm/boot/zImage arch/arm/boot/dts/bbb.dtb "
+                + str(tmp_path / "srv")
+                + "/",
+            },
+        },
+        "c2d": {
+            "hostname": "c2d",
+            "install": {"lava": "scp arch/x86_64/boot/bzImage lava:/srv/c2d-image{}"},
+        },
+    }
+    system_config = {
+        "base-build-path": str(tmp_path),
+        "base-tool-path": ".",
+        "cache-path": str(tmp_path / "cache"),
+    }
+
+    def make(machine, **args):
+        ns = argparse.Namespace(
+            machine=machine,
+            builddir=str(tmp_path / "build"),
+            skip_build=False,
+            dest=None,
+            mods=False,
+        )
+        vars(ns).update(args)
+        return helpers.Context(ns, machine_config, system_config)
+
+    return make
@@ -0,0 +1,102 @@
+import os
+
+from srt_build import artifacts
+from srt_build.commands import cmd_install
+
+
+def _build(tmp_path, image="zImage-1"):
+    boot = tmp_path / "build" / "arch" / "arm" / "boot"
+    (boot / "dts").mkdir(parents=True, exist_ok=True)
+    (boot / "zImage").write_text(image)
+    (boot / "dts" / "bbb.dtb").write_text("dtb")
+    release = tmp_path / "build" / "include" / "config" / "kernel.release"
+    release.parent.mkdir(parents=True, exist_ok=True)
+    release.write_text("6.12.0-rt1\n")
+    (tmp_path / "build" / ".config").write_text("CONFIG_PREEMPT_RT=y\n")
+
+
+def test_store_restores_build(tmp_path, make_context):
+    ctx = make_context("bbb", dest="lava", postfix="-rt", mods=True)
+    _build(tmp_path)
+    mod = tmp_path / "build" / "mods" / "lib" / "modules" / "6.12" / "a.ko"
+    mod.parent.mkdir(parents=True)
+    mod.write_text("ko")
+
+    store = artifacts.get_store(ctx)
+    assert not store.restore("k1", ctx)
+    store.put("k1", ctx)
+
+    (tmp_path / "build" / "arch").rename(tmp_path / "old-arch")
+    (tmp_path / "build" / "include").rename(tmp_path / "old-include")
+    mod.unlink()
+    config = tmp_path / "build" / ".config"
+    mtime = config.stat().st_mtime_ns
+    assert store.restore("k1", ctx)
+    assert (tmp_path / "build/arch/arm/boot/zImage").read_text() == "zImage-1"
+    assert (tmp_path / "build/arch/arm/boot/dts/bbb.dtb").read_text() == "dtb"
+    release = tmp_path / "build/include/config/kernel.release"
+    assert release.read_text() == "6.12.0-rt1\n"
+    # unchanged: make must not see a new .config
+    assert config.stat().st_mtime_ns == mtime
+    assert mod.read_text() == "ko"
+
+
+def test_store_needs_kernel_files(tmp_path, make_context):
+    ctx = make_context("bbb", dest="lava", postfix="-rt")
+    _build(tmp_path)
+    (tmp_path / "build" / "include" / "config" / "kernel.release").unlink()
+    store = artifacts.get_store(ctx)
+    store.put("k1", ctx)
+    assert not store.restore("k1", ctx)
+
+
+def test_store_dedups_and_prunes(tmp_path, make_context):
+    ctx = make_context("bbb", dest="lava", postfix="-rt")
+    store = artifacts.ArtifactStore(str(tmp_path / "store"), max_entries=1)
+    blobs = tmp_path / "store" / "blobs"
+
+    _build(tmp_path, "zImage-1")
+    store.put("k1", ctx)
+    # image, dtb, .config and kernel.release
+    assert len([p for p in blobs.rglob("*") if p.is_file()]) == 4
+
+    _build(tmp_path, "zImage-2")
+    store.put("k2", ctx)
+    # k1 dropped, its image blob too, the shared blobs are kept
+    assert not store.restore("k1", ctx)
+    assert store.restore("k2", ctx)
+    assert len([p for p in blobs.rglob("*") if p.is_file()]) == 4
+
+
+def test_install_skips_identical_upload(tmp_path, make_context):
+    ctx = make_context("bbb", dest="lava", postfix="-rt")
+    _build(tmp_path)
+    (tmp_path / "srv").mkdir()
+
+    assert cmd_install.cmd_install(ctx) == 0
+    assert (tmp_path / "srv" / "zImage").read_text() == "zImage-1"
+
+    # skipped while the destination has the files
+    (tmp_path / "srv" / "bbb.dtb").touch()
+    os.utime(tmp_path / "srv" / "bbb.dtb", (0, 0))
+    assert cmd_install.cmd_install(ctx) == 0
+    assert (tmp_path / "srv" / "bbb.dtb").stat().st_mtime == 0
+
+    # e.g. a reflashed board
+    (tmp_path / "srv" / "zImage").unlink()
+    assert cmd_install.cmd_install(ctx) == 0
+    assert (tmp_path / "srv" / "zImage").read_text() == "zImage-1"
+
+    (tmp_path / "srv" / "zImage").write_text("changed remotely")
+    assert cmd_install.cmd_install(ctx) == 0
+    assert (tmp_path / "srv" / "zImage").read_text() == "zImage-1"
+
+    ctx.args.force = True
+    os.utime(tmp_path / "srv" / "bbb.dtb", (0, 0))
+    assert cmd_install.cmd_install(ctx) == 0
+    assert (tmp_path / "srv" / "bbb.dtb").stat().st_mtime != 0
+
+    ctx.args.force = False
+    _build(tmp_path, "zImage-2")
+    assert cmd_install.cmd_install(ctx) == 0
+    assert (tmp_path / "srv" / "zImage").read_text() == "zImage-2"
@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from srt_build import buildplan
+
+
+def _ctx(**kw):
+    ctx = SimpleNamespace(
+        target="zImage",
+        loadaddr=None,
+        dtb="arch/arm/boot/dts/am335x-boneblack.dtb",
+        dtb_cmd="cat zImage am335x-boneblack.dtb > zImage.dtb",
+        build_path="/build",
+        jobs=8,
+        load_average=None,
+        args=SimpleNamespace(mods=True),
+    )
+    ctx.__dict__.update(kw)
+    return ctx
+
+
+def test_plan_combines_make_goals(monkeypatch):
+    calls = []
+
+    async def run_make(ctx, cmd):
+        calls.append(cmd)
+        return (0, "")
+
+    async def run_cmd(cmd, **kw):
+        calls.append(cmd)
+        return (0, "")
+
+    monkeypatch.setattr(buildplan, "run_make_async", run_make)
+    monkeypatch.setattr(buildplan, "run_cmd_checked_async", run_cmd)
+
+    tasks = buildplan.plan(_ctx())
+    assert [(t.name, t.deps) for t in tasks] == [
+        ("build", ()),
+        ("dtb_cmd", ("build",)),
+        ("modules_install", ("build",)),
+    ]
+    assert buildplan.execute(tasks) == 0
+    assert calls[0] == ["-j8", "zImage", "dtbs", "modules"]
+    assert sorted(calls[1:], key=str) == [
+        ["modules_install"],
+        "cat zImage am335x-boneblack.dtb > zImage.dtb",
+    ]
+
+    tasks = buildplan.plan(
+        _ctx(target="uImage", loadaddr="0x80008000", dtb=None, dtb_cmd=None)
+    )
+    assert [t.name for t in tasks] == ["build", "modules_install"]
+    calls.clear()
+    buildplan.execute(tasks[:1])
+    assert calls == [["-j8", "uImage", "modules", "LOADADDR=0x80008000"]]
+
+
+def test_execute_runs_independent_tasks_concurrently():
+    barrier = asyncio.Barrier(2)
+    order = []
+
+    def step(name, sync=False):
+        async def action():
+            if sync:
+                await asyncio.wait_for(barrier.wait(), 5)
+            order.append(name)
+            return 0
+
+        return action
+
+    tasks = [
+        buildplan.Task("build", step("build"), (), "build failed"),
+        buildplan.Task("a", step("a", sync=True), ("build",), "a failed"),
+        buildplan.Task("b", step("b", sync=True), ("build",), "b failed"),
+        buildplan.Task("c", step("c"), ("a", "b"), "c failed"),
+    ]
+    assert buildplan.execute(tasks) == 0
+    assert order[0] == "build" and order[-1] == "c"
+
+
+def test_execute_stops_after_failure():
+    ran = []
+
+    def step(name, ret=0):
+        async def action():
+            ran.append(name)
+            return ret
+
+        return action
+
+    tasks = [
+        buildplan.Task("build", step("build", 2), (), "build failed"),
+        buildplan.Task("install", step("install"), ("build",), "install failed"),
+    ]
+    assert buildplan.execute(tasks) == 2
+    assert ran == ["build"]
+
+
+def test_execute_runs_on_the_callers_loop(event_loop):
+    loops = []
+
+    async def action():
+        loops.append(asyncio.get_running_loop())
+        return 0
+
+    tasks = [
+        buildplan.Task("build", action, (), ""),
+        buildplan.Task("install", action, ("build",), ""),
+    ]
+    assert buildplan.execute(tasks) == 0
+    assert loops == [event_loop, event_loop]
+
+
+def test_execute_rejects_bad_graphs():
+    async def ok():
+        return 0
+
+    with pytest.raises(ValueError):
+        buildplan.execute([buildplan.Task("a", ok, ("x",), "")])
+    with pytest.raises(ValueError):
+        buildplan.execute(
+            [
+                buildplan.Task("a", ok, ("b",), ""),
+                buildplan.Task("b", ok, ("a",), ""),
+            ]
+        )
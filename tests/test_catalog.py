@@ -0,0 +1,70 @@
+import os
+
+from srt_build import catalog
+
+JOB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "jobs"))
+
+TEMPLATE = """{% extends 'job-base.jinja2' %}
+
+{% set job_name = 'NAME' %}
+
+{% block tests %}
+    definitions:
+    - repository: {{ test_definitions_url|default('x') }}
+      from: git
+      name: DEF
+      parameters:
+        DURATION: "{{ DEF.duration|default('1m') }}"
+        THREADS: "{{ DEF.threads|default('1') }}"
+{% endblock tests -%}
+"""
+
+
+def _write(path, name, definition="cyclictest"):
+    path.write_text(TEMPLATE.replace("NAME", name).replace("DEF", definition))
+
+
+def test_scan_template_without_rendering():
+    path = os.path.join(JOB_PATH, "rt", "smoke", "0005-cyclictest.jinja2")
+    entry = catalog.scan_template(path)
+    assert entry["job_name"] == "cyclictest"
+    assert entry["definitions"] == ["cyclictest"]
+    assert "DURATION" in entry["parameters"]["cyclictest"]
+
+
+def test_scan_template_falls_back_to_file_name(tmp_path):
+    path = tmp_path / "0001-foo.jinja2"
+    path.write_text("{% extends 'job-base.jinja2' %}\n")
+    assert catalog.scan_template(str(path))["job_name"] == "0001-foo"
+
+
+def test_catalog_cache_is_reused_and_invalidated(tmp_path, monkeypatch):
+    suite = tmp_path / "suite"
+    suite.mkdir()
+    _write(suite / "0001-a.jinja2", "a")
+    _write(suite / "0002-b.jinja2", "b", "pmqtest")
+    cache = str(tmp_path / "cache" / "catalog.json")
+
+    cat = catalog.Catalog(cache)
+    assert [e["job_name"] for e in cat.suite(str(suite))] == ["a", "b"]
+    cat.save()
+    assert os.path.exists(cache)
+
+    scanned = []
+    scan = catalog.scan_template
+    monkeypatch.setattr(
+        catalog, "scan_template", lambda p: scanned.append(p) or scan(p)
+    )
+
+    cat = catalog.Catalog(cache)
+    assert cat.find(str(suite), "b") == [str(suite / "0002-b.jinja2")]
+    assert cat.suite(str(suite))[1]["parameters"] == {
+        "pmqtest": ["DURATION", "THREADS"]
+    }
+    assert scanned == []
+
+    _write(suite / "0001-a.jinja2", "renamed")
+    st = os.stat(suite / "0001-a.jinja2")
+    os.utime(suite / "0001-a.jinja2", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cat.find(str(suite), "renamed") == [str(suite / "0001-a.jinja2")]
+    assert scanned == [str(suite / "0001-a.jinja2")]
@@ -0,0 +1,189 @@
+import threading
+import time
+
+import pytest
+
+from srt_build import helpers
+from srt_build.commands import cmd_build, cmd_lava
+
+
+class _Manifest:
+    def __init__(self):
+        self.built = []
+
+    def flavor(self, fl):
+        manifest = self
+
+        class _Flavor:
+            def is_built(self, postfix):
+                return False
+
+            def mark_built(self, postfix):
+                manifest.built.append(postfix)
+
+        return _Flavor()
+
+
+def test_stage_install_copies_install_files(tmp_path, make_context):
+    ctx = make_context("c2d")
+    image = tmp_path / "build" / "arch" / "x86_64" / "boot" / "bzImage"
+    image.parent.mkdir(parents=True)
+    image.write_text("rt")
+
+    stage_ctx = ctx.copy()
+    stage_ctx.args.dest = "lava"
+    stage_ctx.args.postfix = "-rt"
+    stage = helpers.stage_install(stage_ctx)
+
+    assert ctx.args.dest is None and ctx.install_path is None
+    assert stage_ctx.install_path == stage == str(tmp_path / "stage" / "c2d-rt")
+    image.write_text("nohz")
+    assert (tmp_path / "stage/c2d-rt/arch/x86_64/boot/bzImage").read_text() == "rt"
+
+
+def test_run_pipelined_overlaps_build_and_submit(tmp_path, monkeypatch, make_context):
+    ctx = make_context("c2d")
+    events = []
+    lock = threading.Lock()
+
+    def log(what):
+        with lock:
+            events.append(what)
+
+    def prepare(ctx, fl):
+        ctx.args.dest = "lava"
+        ctx.args.postfix = "-" + fl
+
+    def build(ctx, fl, kernel_config, install=True):
+        assert not install
+        log(f"build {fl}")
+        time.sleep(0.2)
+        log(f"built {fl}")
+
+    def install(ctx):
+        log(f"install {ctx.args.postfix}")
+
+    def submit(ctx, fl, system_config, duration, jobs, manifest):
+        time.sleep(0.1)
+        jobs.append(fl)
+        log(f"submitted {fl}")
+
+    monkeypatch.setattr(cmd_lava, "prepare_build_for_flavor", prepare)
+    monkeypatch.setattr(cmd_lava, "build_flavor", build)
+    monkeypatch.setattr(
+        cmd_lava,
+        "stage_install",
+        lambda c: setattr(c, "install_path", str(tmp_path / c.args.postfix)),
+    )
+    monkeypatch.setattr(cmd_lava, "cmd_install", install)
+    monkeypatch.setattr(cmd_lava, "submit_flavor", submit)
+
+    jobs = []
+    manifest = _Manifest()
+    cmd_lava.run_pipelined(ctx, ["rt", "nohz", "up"], {}, {}, None, jobs, manifest)
+
+    assert jobs == ["rt", "nohz", "up"]
+    assert manifest.built == ["-rt", "-nohz", "-up"]
+    # each flavor is installed with its own postfix ...
+    assert [e for e in events if e.startswith("install")] == [
+        "install -rt",
+        "install -nohz",
+        "install -up",
+    ]
+    # ... while the next one is being built
+    assert events.index("submitted rt") < events.index("built nohz")
+    assert events.index("build nohz") < events.index("submitted rt")
+
+
+def test_run_pipelined_skips_failed_flavor(tmp_path, monkeypatch, make_context):
+    ctx = make_context("c2d")
+    staged = []
+
+    def prepare(ctx, fl):
+        ctx.args.dest = "lava"
+        ctx.args.postfix = "-" + fl
+
+    def stage(c):
+        staged.append(c.args.postfix)
+        c.install_path = str(tmp_path / c.args.postfix)
+
+    def submit(ctx, fl, system_config, duration, jobs, manifest):
+        jobs.append(fl)
+
+    monkeypatch.setattr(cmd_lava, "prepare_build_for_flavor", prepare)
+    monkeypatch.setattr(
+        cmd_lava, "build_flavor", lambda ctx, fl, kc, install: 2 if fl == "nohz" else 0
+    )
+    monkeypatch.setattr(cmd_lava, "stage_install", stage)
+    monkeypatch.setattr(cmd_lava, "cmd_install", lambda ctx: 0)
+    monkeypatch.setattr(cmd_lava, "submit_flavor", submit)
+
+    jobs = []
+    manifest = _Manifest()
+    cmd_lava.run_pipelined(ctx, ["rt", "nohz", "up"], {}, {}, None, jobs, manifest)
+    assert staged == ["-rt", "-up"]
+    assert jobs == ["rt", "up"]
+    assert manifest.built == ["-rt", "-up"]
+
+
+def test_for_flavor_uses_own_build_tree(tmp_path, make_context):
+    ctx = make_context("c2d")
+    assert ctx.for_flavor("rt").build_path == str(tmp_path / "build")
+    ctx.args.flavor_builddirs = True
+    rt = ctx.for_flavor("rt")
+    assert rt.build_path == str(tmp_path / "build" / "rt")
+    assert rt.args.flavor == "rt"
+    assert ctx.build_path == str(tmp_path / "build")
+
+
+def test_build_flavors_configures_each_tree_first(tmp_path, monkeypatch, make_context):
+    ctx = make_context("c2d")
+    ctx.args.flavors = "rt,up"
+    ctx.args.parallel_builds = 2
+    ctx.args.flavor_builddirs = True
+    events = []
+    lock = threading.Lock()
+
+    def config(c, kernel_config):
+        assert kernel_config == {"rt": ["rt.config"]}
+        events.append(("config", c.build_path))
+        return 0
+
+    def build(c):
+        with lock:
+            events.append(("build", c.build_path))
+        return 0
+
+    monkeypatch.setattr(cmd_build, "cmd_config", config)
+    monkeypatch.setattr(cmd_build, "build_tree", build)
+    assert cmd_build.cmd_build(ctx, {"rt": ["rt.config"]}) == 0
+    rt, up = str(tmp_path / "build" / "rt"), str(tmp_path / "build" / "up")
+    assert events[:2] == [("config", rt), ("config", up)]
+    assert sorted(events[2:]) == [("build", rt), ("build", up)]
+
+
+def test_build_flavors_uses_own_trees(tmp_path, monkeypatch, make_context):
+    ctx = make_context("c2d")
+    ctx.args.flavors = "rt,nohz"
+    configs = {}
+
+    def config(c, kernel_config):
+        configs[c.args.flavor] = c.build_path
+        return 0
+
+    monkeypatch.setattr(cmd_build, "cmd_config", config)
+    monkeypatch.setattr(cmd_build, "build_tree", lambda c: 0)
+    assert cmd_build.cmd_build(ctx, {}) == 0
+    assert configs == {
+        "rt": str(tmp_path / "build" / "rt"),
+        "nohz": str(tmp_path / "build" / "nohz"),
+    }
+    assert not getattr(ctx.args, "flavor_builddirs", False)
+
+
+def test_build_flavors_stops_on_config_failure(tmp_path, monkeypatch, make_context):
+    ctx = make_context("c2d")
+    ctx.args.flavors = "rt,up"
+    monkeypatch.setattr(cmd_build, "cmd_config", lambda c, kc: 1)
+    monkeypatch.setattr(cmd_build, "build_tree", pytest.fail)
+    assert cmd_build.cmd_build(ctx, {}) == 1
@@ -0,0 +1,89 @@
+import argparse
+
+from srt_build import compiler_cache, helpers
+
+
+CCACHE_STATS = """stats_updated_timestamp\t1700000000
+direct_cache_hit\t120
+preprocessed_cache_hit\t30
+cache_miss\t50
+files_in_cache\t900
+"""
+
+SCCACHE_STATS = """{"stats": {"compile_requests": 10,
+ "cache_hits": {"counts": {"C/C++": 7}, "adv_counts": {}},
+ "cache_misses": {"counts": {"C/C++": 2, "Assembler": 1}, "adv_counts": {}}}}
+"""
+
+
+def test_parse_stats():
+    assert compiler_cache.parse_ccache_stats(CCACHE_STATS) == (150, 50)
+    assert compiler_cache.parse_sccache_stats(SCCACHE_STATS) == (7, 3)
+
+
+def test_from_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(compiler_cache.shutil, "which", lambda tool: "/usr/bin/" + tool)
+    assert compiler_cache.from_config(None, str(tmp_path)) is None
+    assert compiler_cache.from_config("distcc", str(tmp_path)) is None
+
+    cache = compiler_cache.from_config("ccache", str(tmp_path))
+    assert (cache.tool, cache.cache_dir) == ("ccache", str(tmp_path))
+
+    cache = compiler_cache.from_config(
+        {"tool": "sccache", "dir": "/srv/cache", "max-size": "20G"}, str(tmp_path)
+    )
+    env = cache.env({})
+    assert env == {"SCCACHE_DIR": "/srv/cache", "SCCACHE_CACHE_SIZE": "20G"}
+
+    monkeypatch.setattr(compiler_cache.shutil, "which", lambda tool: None)
+    assert compiler_cache.from_config("ccache", str(tmp_path)) is None
+
+
+def test_run_make_wraps_cc(tmp_path, monkeypatch):
+    monkeypatch.setattr(compiler_cache.shutil, "which", lambda tool: "/usr/bin/" + tool)
+    args = argparse.Namespace(machine="bbb", builddir=str(tmp_path / "build"))
+    machine_config = {
+        "bbb": {
+            "hostname": "bbb",
+            "CROSS_COMPILE": "arm-linux-gnu-",
+            "ARCH": "arm",
+            "compiler_cache": "ccache",
+        }
+    }
+    system_config = {
+        "base-build-path": str(tmp_path),
+        "base-tool-path": ".",
+        "cache-path": str(tmp_path / "cache"),
+    }
+    ctx = helpers.Context(args, machine_config, system_config)
+    assert ctx.compiler_cache.cache_dir == str(tmp_path / "cache/compiler/bbb")
+
+    calls = []
+
+    async def run(cmd, **kw):
+        calls.append((cmd, kw))
+        return (0, "")
+
+    monkeypatch.setattr(helpers, "run_cmd_checked_async", run)
+    helpers.run_make(ctx, ["-j4", "zImage"])
+    cmd, kw = calls[0]
+    assert "CC=ccache arm-linux-gnu-gcc" in cmd
+    assert "CROSS_COMPILE=arm-linux-gnu-" in cmd
+    assert kw["env"]["CCACHE_DIR"] == str(tmp_path / "cache/compiler/bbb")
+
+
+def test_report(capsys):
+    class _Cache:
+        tool = "ccache"
+        counts = iter([(100, 40), (180, 60)])
+
+        def stats(self):
+            return next(self.counts)
+
+    with compiler_cache.report(_Cache()):
+        pass
+    assert "ccache: 80 hits, 20 misses (80.0% hit rate)" in capsys.readouterr().out
+
+    with compiler_cache.report(None):
+        pass
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,123 @@
+import gzip
+import sys
+import time
+
+import pytest
+
+from srt_build import core
+
+
+SLEEP_ECHO = "import sys, time; time.sleep(float(sys.argv[1])); print(sys.argv[2])"
+
+
+@pytest.fixture
+def sleep_echo(tmp_path):
+    """Command factory that sleeps for a while and then prints a token."""
+    script = tmp_path / "sleep_echo.py"
+    script.write_text(SLEEP_ECHO)
+
+    def cmd(delay, token="done"):
+        return [sys.executable, str(script), str(delay), str(token)]
+
+    return cmd
+
+
+def test_run_cmd_returns_exit_code_and_output(sleep_echo):
+    ret, out = core.run_cmd(sleep_echo(0, "hello"), capture=True)
+    assert ret == 0
+    assert out == "hello\n"
+
+    ret, _ = core.run_cmd(["false"])
+    assert ret != 0
+
+
+def test_run_cmds_keeps_input_order(sleep_echo):
+    """Results come back in input order even if later commands finish first."""
+    cmds = [sleep_echo(d, i) for i, d in enumerate([0.3, 0.0, 0.1])]
+    results = core.run_cmds(cmds, limit=3, capture=True)
+    assert [out.strip() for _, out in results] == ["0", "1", "2"]
+    assert all(ret == 0 for ret, _ in results)
+
+
+def test_run_cmds_runs_concurrently(sleep_echo):
+    cmds = [sleep_echo(0.5)] * 4
+    start = time.monotonic()
+    results = core.run_cmds(cmds, limit=4)
+    elapsed = time.monotonic() - start
+    assert len(results) == 4
+    assert elapsed < 1.5, f"commands did not overlap ({elapsed:.2f}s)"
+
+
+def test_run_cmds_respects_limit(sleep_echo):
+    cmds = [sleep_echo(0.3)] * 4
+    start = time.monotonic()
+    core.run_cmds(cmds, limit=1)
+    assert time.monotonic() - start >= 1.2
+
+
+def test_run_cmds_reports_failure_per_command(sleep_echo):
+    results = core.run_cmds(
+        [["/nonexistent/srt-build-cmd"], sleep_echo(0, "ok")], capture=True
+    )
+    assert results[0][0] != 0
+    assert results[1] == (0, "ok\n")
+
+
+def test_run_cmds_empty():
+    assert core.run_cmds([]) == []
+
+
+COUNT = "import sys; [print(i) for i in range(int(sys.argv[1]))]"
+
+
+def test_run_cmd_keeps_only_tail_without_capture(tmp_path):
+    script = tmp_path / "count.py"
+    script.write_text(COUNT)
+    logfile = tmp_path / "logs" / "count.log.gz"
+
+    ret, out = core.run_cmd([sys.executable, str(script), "5000"], logfile=str(logfile))
+    assert ret == 0
+    lines = out.splitlines()
+    assert len(lines) == core.TAIL_LINES
+    assert lines[-1] == "4999"
+
+    with gzip.open(logfile, "rt") as f:
+        full = f.read().splitlines()
+    assert full == [str(i) for i in range(5000)]
+
+
+def test_run_cmd_passes_argv_without_shell(tmp_path):
+    """Arguments with spaces or shell characters reach the program as-is."""
+    script = tmp_path / "argv.py"
+    script.write_text("import sys; print(repr(sys.argv[1:]))")
+    args = ["two words", "$HOME", "a;b"]
+    ret, out = core.run_cmd([sys.executable, str(script), *args], capture=True)
+    assert ret == 0
+    assert out.strip() == repr(args)
+
+
+def test_run_cmd_shell_mode(tmp_path):
+    ret, out = core.run_cmd(
+        "echo one ; echo two", cwd=tmp_path, shell=True, capture=True
+    )
+    assert ret == 0
+    assert out.split() == ["one", "two"]
+
+
+def test_run_cmd_replaces_invalid_utf8(tmp_path):
+    script = tmp_path / "bad.py"
+    script.write_text(
+        "import sys; sys.stdout.buffer.write(b'ok\\n\\xff\\xfe bad\\nlast')"
+    )
+    ret, out = core.run_cmd([sys.executable, str(script)], capture=True)
+    assert ret == 0
+    assert out == "ok\n\ufffd\ufffd bad\nlast"
+
+
+def test_run_cmd_handles_very_long_lines(tmp_path):
+    """Lines longer than the StreamReader limit (64 KiB) are kept whole."""
+    script = tmp_path / "long.py"
+    script.write_text("print('x' * 300000); print('ü' * 100000)")
+    ret, out = core.run_cmd([sys.executable, str(script)], capture=True)
+    assert ret == 0
+    assert out == "x" * 300000 + "\n" + "ü" * 100000 + "\n"
@@ -0,0 +1,94 @@
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from srt_build import fingerprint
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    """A git "kernel tree", config fragments and a build dir with outputs."""
+    src = tmp_path / "linux"
+    src.mkdir()
+    (src / "Makefile").write_text("all:\n")
+    git = ["git", "-c", "user.name=t", "-c", "user.email=t@t"]
+    subprocess.run(git + ["init", "-q"], cwd=src, check=True)
+    subprocess.run(git + ["add", "."], cwd=src, check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "init"], cwd=src, check=True)
+    monkeypatch.chdir(src)
+
+    configs = tmp_path / "configs"
+    configs.mkdir()
+    (configs / "c2d.config").write_text("CONFIG_SMP=y\n")
+    (configs / "rt.config").write_text("CONFIG_PREEMPT_RT=y\n")
+
+    build = tmp_path / "build"
+    (build / "arch/x86/boot").mkdir(parents=True)
+    (build / "arch/x86/boot/bzImage").write_text("image")
+    (build / ".config").write_text("CONFIG_PREEMPT_RT=y\n")
+    (build / "include/config").mkdir(parents=True)
+    (build / "include/config/kernel.release").write_text("6.6.0-rt1\n")
+
+    ctx = SimpleNamespace(
+        args=SimpleNamespace(flavor="rt", config_base="", dest="lava", mods=False),
+        build_path=str(build),
+        config_path=str(configs),
+        config="c2d.config",
+        defconfig="x86_64_defconfig",
+        install={"lava": "scp arch/x86/boot/bzImage lava:/srv/c2d-image{}"},
+        CROSS_COMPILE=None,
+        ARCH=None,
+        CC=None,
+        target="bzImage",
+        loadaddr=None,
+        dtb=None,
+        dtb_cmd=None,
+    )
+    return SimpleNamespace(src=src, configs=configs, build=build, ctx=ctx)
+
+
+KERNEL_CONFIG = {"": [], "rt": ["rt.config"]}
+
+
+def test_fingerprint_tracks_inputs(tree):
+    fp = fingerprint.compute(tree.ctx, KERNEL_CONFIG)
+    assert fp and fp == fingerprint.compute(tree.ctx, KERNEL_CONFIG)
+
+    (tree.configs / "rt.config").write_text("CONFIG_PREEMPT_RT=n\n")
+    changed = fingerprint.compute(tree.ctx, KERNEL_CONFIG)
+    assert changed != fp
+
+    (tree.src / "Makefile").write_text("all:\n\ttrue\n")
+    assert fingerprint.compute(tree.ctx, KERNEL_CONFIG) not in (fp, changed)
+
+    tree.ctx.CROSS_COMPILE = "aarch64-linux-gnu-"
+    assert fingerprint.compute(tree.ctx, KERNEL_CONFIG) not in (fp, changed)
+
+
+def test_build_is_reused_until_something_changes(tree):
+    fp = fingerprint.compute(tree.ctx, KERNEL_CONFIG)
+    assert not fingerprint.is_current(tree.ctx, fp)
+    fingerprint.save(tree.ctx, fp)
+    assert fingerprint.is_current(tree.ctx, fp)
+    assert not fingerprint.is_current(tree.ctx, "other")
+
+    (tree.build / ".config").write_text("CONFIG_PREEMPT_RT=n\n")
+    assert not fingerprint.is_current(tree.ctx, fp)
+    fingerprint.save(tree.ctx, fp)
+
+    (tree.build / "include/config/kernel.release").unlink()
+    assert not fingerprint.is_current(tree.ctx, fp)
+
+    (tree.build / "arch/x86/boot/bzImage").unlink()
+    assert not fingerprint.is_current(tree.ctx, fp)
+
+    fingerprint.invalidate(tree.ctx)
+    assert not (tree.build / fingerprint.FINGERPRINT_FILE).exists()
+
+
+def test_no_fingerprint_outside_git(tree, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(tmp_path.parent))
+    assert fingerprint.compute(tree.ctx, KERNEL_CONFIG) is None
+    assert not fingerprint.is_current(tree.ctx, None)
@@ -0,0 +1,245 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from srt_build import config, database, helpers, lava, manifest
+
+JOB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "jobs"))
+TEMPLATE = os.path.join(JOB_PATH, "rt", "smoke", "0005-cyclictest.jinja2")
+
+
+def _job_ctx():
+    job_ctx = helpers.load_job_ctx(os.path.join(JOB_PATH, "boards", "c2d.yaml"))
+    job_ctx["tags"] = ["c2d"]
+    return job_ctx
+
+
+def test_generate_job_renders_template_with_base(tmp_path):
+    job = yaml.safe_load(helpers.generate_job(JOB_PATH, TEMPLATE, _job_ctx()))
+    assert job["job_name"] == "cyclictest"
+    assert job["device_type"] == "x86"
+    assert job["actions"][-1]["test"]["definitions"][0]["name"] == "cyclictest"
+
+
+def test_generate_job_shares_environment_and_caches_bytecode(tmp_path):
+    cache = str(tmp_path / "templates")
+    first = helpers.generate_job(JOB_PATH, TEMPLATE, _job_ctx(), cache)
+    env = helpers.get_job_env(JOB_PATH, cache)
+    second = helpers.generate_job(JOB_PATH, TEMPLATE, _job_ctx(), cache)
+    assert first == second
+    assert helpers.get_job_env(JOB_PATH, cache) is env
+    # the template and job-base.jinja2 it extends
+    assert len(os.listdir(cache)) == 2
+
+
+def test_generate_job_outside_job_path(tmp_path):
+    template = tmp_path / "custom.jinja2"
+    template.write_text(
+        "{% extends 'job-base.jinja2' %}\n" "{% set job_name = 'custom' %}\n"
+    )
+    job = yaml.safe_load(helpers.generate_job(JOB_PATH, str(template), _job_ctx()))
+    assert job["job_name"] == "custom"
+
+
+class _FakeLava:
+    limit = 2
+
+    def __init__(self, fail=()):
+        self.submitted = []
+        self.job_names = []
+        self.fail = fail
+
+    async def submit(self, path):
+        if os.path.basename(path) in self.fail:
+            return (1, "<Fault 400: 'invalid job'>")
+        with open(path) as f:
+            self.job_names.append(yaml.safe_load(f)["job_name"])
+        self.submitted.append(path)
+        return (0, f"{len(self.submitted)}\n")
+
+
+def _process(
+    tmp_path,
+    monkeypatch,
+    tests=None,
+    workers=2,
+    fake=None,
+    manifest=None,
+    sc=None,
+    suite="smoke",
+):
+    fake = fake or _FakeLava()
+    monkeypatch.setattr(
+        helpers, "get_submitter", lambda system_config: lava.Submitter(fake, rate=0)
+    )
+    ctx = SimpleNamespace(
+        job_path=JOB_PATH,
+        template_cache_path=str(tmp_path / "templates"),
+        catalog_path=str(tmp_path / "catalog.json"),
+        hostname="c2d",
+        args=SimpleNamespace(tests=tests, render_workers=workers, machine="c2d"),
+    )
+    td = tmp_path / "out"
+    td.mkdir(exist_ok=True)
+    jobs = []
+    testpath = os.path.join(JOB_PATH, "rt", suite)
+    helpers.process_test_files(
+        ctx, str(td), _job_ctx(), testpath, None, jobs, sc or {}, manifest
+    )
+    return fake, jobs, td
+
+
+def test_process_test_files_renders_in_pool_and_submits(tmp_path, monkeypatch):
+    fake, jobs, td = _process(tmp_path, monkeypatch)
+    assert sorted(fake.submitted) == sorted(str(p) for p in td.iterdir())
+    assert sorted(jobs, key=int) == [str(i) for i in range(1, len(jobs) + 1)]
+    assert len(jobs) == len(fake.submitted) > 1
+
+
+def test_process_test_files_filters_tests(tmp_path, monkeypatch):
+    fake, jobs, _ = _process(tmp_path, monkeypatch, tests="cyclictest", workers=1)
+    assert [os.path.basename(p) for p in fake.submitted] == [
+        "test-0005-cyclictest-cyclictest-c2d.yaml"
+    ]
+    assert jobs == ["1"]
+
+
+@pytest.mark.parametrize("suite", ["stress-ng", "stress-ng-class"])
+def test_process_test_files_shared_test_names(tmp_path, monkeypatch, suite):
+    # all templates of these suites run a test named cyclictest
+    fake, jobs, td = _process(tmp_path, monkeypatch, suite=suite)
+    templates = [
+        f
+        for f in os.listdir(os.path.join(JOB_PATH, "rt", suite))
+        if f.endswith(".jinja2")
+    ]
+    assert len(os.listdir(td)) == len(fake.submitted) == len(templates) > 1
+    assert len(set(fake.job_names)) == len(fake.job_names)
+
+
+class _SlowLava(_FakeLava):
+    limit = 8
+
+    async def submit(self, path):
+        # renders of later templates go on while this one is submitted
+        await asyncio.sleep(0.05)
+        return await super().submit(path)
+
+
+def test_process_test_files_renders_while_submitting(tmp_path, monkeypatch):
+    suite = os.path.join(JOB_PATH, "rt", "stress-ng-class")
+    expected = []
+    for name in sorted(os.listdir(suite)):
+        job = yaml.safe_load(
+            helpers.generate_job(JOB_PATH, os.path.join(suite, name), _job_ctx())
+        )
+        expected.append(job["job_name"])
+    fake, jobs, _ = _process(
+        tmp_path, monkeypatch, workers=4, fake=_SlowLava(), suite="stress-ng-class"
+    )
+    assert sorted(fake.job_names) == sorted(expected)
+    assert len(set(fake.submitted)) == len(fake.submitted) == len(jobs)
+
+
+def test_generate_split_files_takes_parsed_job(tmp_path):
+    job = yaml.safe_load(helpers.generate_job(JOB_PATH, TEMPLATE, _job_ctx()))
+    files = helpers.generate_split_files(str(tmp_path), job, "c2d", 600)
+    assert [os.path.basename(f) for f in files] == ["test-cyclictest-c2d.yaml"]
+    with open(files[0]) as f:
+        split = yaml.safe_load(f)
+    assert split["job_name"] == "cyclictest"
+    assert split["actions"][-1]["test"]["timeout"] == {"seconds": 720}
+
+
+def test_yaml_helpers_use_libyaml_if_available():
+    assert config.YamlLoader is getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    data = {"a": [1, "two", {"b": None}]}
+    assert config.yaml_load(config.yaml_dump(data)) == data
+
+
+def test_collect_submissions_records_failures(tmp_path, capsys):
+    system_config = {"database-path": str(tmp_path / "jobs.db")}
+    database.init_database(system_config)
+    bad = tmp_path / "test-bad-c2d.yaml"
+    bad.write_text("job_name: bad\n")
+    results = [
+        lava.SubmitResult("test-a-c2d.yaml", [101], None, 1),
+        lava.SubmitResult(str(bad), [], "HTTP 503", 4),
+        lava.SubmitResult("test-b-c2d.yaml", [102, 103], None, 2),
+    ]
+    ctx = SimpleNamespace(args=SimpleNamespace(machine="c2d"))
+    jobs = []
+    helpers.collect_submissions(ctx, results, jobs, system_config)
+    assert jobs == ["101", "102", "103"]
+    assert "test-bad-c2d.yaml: HTTP 503 (4 attempts)" in capsys.readouterr().out
+    assert database.get_failed_submissions_from_db("c2d", system_config) == [
+        ("test-bad-c2d.yaml", "HTTP 503", 4)
+    ]
+
+
+def test_process_test_files_resumes_from_manifest(tmp_path, monkeypatch):
+    sc = {"database-path": str(tmp_path / "jobs.db")}
+    database.init_database(sc)
+    run = manifest.RunManifest.start("c2d", "sig", sc)
+
+    bad = "test-0007-pmqtest-pmqtest-c2d.yaml"
+    first = _FakeLava(fail={bad})
+    _, jobs, _ = _process(
+        tmp_path, monkeypatch, fake=first, manifest=run.flavor("rt"), sc=sc
+    )
+    assert bad not in [os.path.basename(p) for p in first.submitted]
+    run.flavor("rt").finish()
+    assert not run.finish(["rt"])
+
+    # interrupted: the next --resume run only submits what is missing
+    run = manifest.RunManifest.start("c2d", "sig", sc, resume=True)
+    assert run.resumed
+    second = _FakeLava()
+    _, resumed_jobs, _ = _process(
+        tmp_path, monkeypatch, fake=second, manifest=run.flavor("rt"), sc=sc
+    )
+    assert [os.path.basename(p) for p in second.submitted] == [bad]
+    assert len(resumed_jobs) == len(jobs) + 1
+
+    run.flavor("rt").finish()
+    assert run.finish(["rt"])
+    assert not manifest.RunManifest.start("c2d", "sig", sc, resume=True).resumed
+
+
+def test_manifest_tracks_built_flavors(tmp_path):
+    sc = {"database-path": str(tmp_path / "jobs.db")}
+    database.init_database(sc)
+    fl = manifest.RunManifest.start("c2d", "sig", sc).flavor("rt")
+    assert not fl.is_built("-rt-v6.6")
+    fl.mark_built("-rt-v6.6")
+    assert fl.is_built("-rt-v6.6")
+    assert not fl.is_built("-rt-v6.7")
+
+
+def test_manifest_keys_splits_by_template(tmp_path):
+    sc = {"database-path": str(tmp_path / "jobs.db")}
+    database.init_database(sc)
+    fl = manifest.RunManifest.start("c2d", "sig", sc).flavor("rt")
+    split = str(tmp_path / "test-cyclictest-c2d.yaml")
+    for template in ("0001-stress-ng-access.jinja2", "0002-stress-ng-af-alg.jinja2"):
+        fl.plan(template, [split])
+    fl.record("0001-stress-ng-access.jinja2", lava.SubmitResult(split, [7], None, 1))
+
+    fl = manifest.RunManifest.start("c2d", "sig", sc, resume=True).flavor("rt")
+    assert fl.submitted() == {
+        ("0001-stress-ng-access.jinja2", "test-cyclictest-c2d.yaml"): [7]
+    }
+
+
+def test_manifest_finish_needs_every_flavor(tmp_path, capsys):
+    sc = {"database-path": str(tmp_path / "jobs.db")}
+    database.init_database(sc)
+    run = manifest.RunManifest.start("c2d", "sig", sc)
+    run.flavor("rt").finish()
+    # nohz failed to build, none of its jobs were submitted
+    assert not run.finish(["rt", "nohz"])
+    assert "Flavors nohz not done" in capsys.readouterr().out
+    assert manifest.RunManifest.start("c2d", "sig", sc, resume=True).resumed
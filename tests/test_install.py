@@ -0,0 +1,133 @@
+import hashlib
+import subprocess
+
+from srt_build import install, ssh
+
+
+def test_parse_scp_command():
+    cmd = (
+        "scp arch/arm/boot/zImage root@lava:/srv/bbb/bbb-image{}; "
+        "scp arch/arm/boot/dts/bbb.dtb root@lava:/srv/bbb/"
+    )
+    assert install.parse_spec(cmd, "-rt") == [
+        install.Transfer("arch/arm/boot/zImage", "root@lava", "/srv/bbb/bbb-image-rt"),
+        install.Transfer("arch/arm/boot/dts/bbb.dtb", "root@lava", "/srv/bbb/"),
+    ]
+    assert install.parse_spec("scp -P 2222 zImage lava:/srv") is None
+    assert install.parse_spec("cp zImage /srv/tftp") is None
+    assert install.parse_spec("scp lava:/srv/zImage .") is None
+
+
+def test_parse_spec_list():
+    spec = [
+        {"src": "arch/arm64/boot/Image", "dest": "lava:/srv/rpi-image{}"},
+        {"src": "arch/arm64/boot/dts/rpi.dtb", "dest": "/srv/tftp/"},
+    ]
+    assert install.parse_spec(spec, "-nohz") == [
+        install.Transfer("arch/arm64/boot/Image", "lava", "/srv/rpi-image-nohz"),
+        install.Transfer("arch/arm64/boot/dts/rpi.dtb", None, "/srv/tftp/"),
+    ]
+
+
+def test_command_transfers():
+    files = {"zImage": "h1", "bbb.dtb": "h2"}
+    assert install.command_transfers(
+        "cp zImage /srv/tftp/bbb-image && scp -q bbb.dtb lava:/srv/", files
+    ) == [
+        install.Transfer("zImage", None, "/srv/tftp/bbb-image"),
+        install.Transfer("bbb.dtb", "lava", "/srv/"),
+    ]
+    # the port is not known to the remote hash check
+    assert install.command_transfers("scp -P 2222 zImage bbb.dtb lava:/", files) is None
+    assert install.command_transfers("cp zImage /srv; ./flash bbb.dtb", files) is None
+    assert install.command_transfers("cp zImage /srv", files) is None
+
+
+def test_remote_hash_script(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "zImage").write_text("image")
+    (tmp_path / "bbb.dtb").write_text("dtb")
+    transfers = [
+        install.Transfer("arch/arm/boot/zImage", "lava", str(tmp_path / "dir")),
+        install.Transfer("bbb.dtb", "lava", str(tmp_path / "missing.dtb")),
+        install.Transfer("x.dtb", "lava", str(tmp_path / "bbb.dtb")),
+    ]
+    script = install._remote_hash_script(transfers)
+    out = subprocess.run(["sh", "-c", script], capture_output=True, text=True)
+    assert out.returncode == 0
+    assert out.stdout.splitlines() == [
+        "0 " + hashlib.sha256(b"image").hexdigest(),
+        "2 " + hashlib.sha256(b"dtb").hexdigest(),
+    ]
+
+
+def test_upload_skips_matching_remote_copies(tmp_path, monkeypatch):
+    (tmp_path / "zImage").write_bytes(b"z" * 64)
+    (tmp_path / "bbb.dtb").write_text("dtb")
+    transfers = install.parse_spec("scp zImage bbb.dtb root@lava:/srv/bbb/")
+    ssh_calls = []
+
+    def fake_run_cmd(cmd, **kw):
+        ssh_calls.append(cmd)
+        return (0, "0 " + hashlib.sha256(b"z" * 64).hexdigest() + "\n")
+
+    uploads = []
+    monkeypatch.setattr(install, "run_cmd", fake_run_cmd)
+    monkeypatch.setattr(
+        install, "run_cmds", lambda cmds, cwd: uploads.extend(cmds) or [(0, "")]
+    )
+
+    control = tmp_path / "ssh"
+    with ssh.ConnectionManager(str(control)) as manager:
+        assert install.upload(transfers, str(tmp_path), 32) == 0
+        # one ssh call for the checksums of both files
+        assert len(ssh_calls) == 1 and ssh_calls[0][-2] == "root@lava"
+        opts = manager.options()
+        assert ssh_calls[0][1:7] == opts
+        assert uploads == [["scp", *opts, "-q", "bbb.dtb", "root@lava:/srv/bbb/"]]
+
+        uploads.clear()
+        assert install.upload(transfers, str(tmp_path), 32, force=True) == 0
+        assert [c[-2] for c in uploads] == ["zImage", "bbb.dtb"]
+        assert "-C" in uploads[0] and "-C" not in uploads[1]
+        monkeypatch.setattr(manager, "close", lambda: None)
+
+
+def test_upload_local(tmp_path):
+    (tmp_path / "zImage").write_text("image")
+    (tmp_path / "srv").mkdir()
+    transfers = install.parse_spec([{"src": "zImage", "dest": "srv/"}])
+    assert install.upload(transfers, str(tmp_path)) == 0
+    assert (tmp_path / "srv" / "zImage").read_text() == "image"
+    assert install.pending(transfers, str(tmp_path), []) == []
+    assert install.upload([install.Transfer("nope", None, "srv/")], str(tmp_path)) == 1
+
+
+def test_connection_manager(tmp_path, monkeypatch):
+    closed = []
+
+    async def fake_run_cmd_async(cmd, **kw):
+        closed.append(cmd[-1])
+        return (0, "")
+
+    monkeypatch.setattr(ssh, "run_cmd_async", fake_run_cmd_async)
+    assert ssh.ssh_cmd("c2d", "uname", "-r") == ["ssh", "c2d", "uname", "-r"]
+    assert ssh.wrap_shell("scp a c2d:/tmp") == "scp a c2d:/tmp"
+
+    with ssh.ConnectionManager(str(tmp_path / "ssh"), persist=30) as manager:
+        assert ssh.current() is manager
+        opts = manager.options()
+        assert "ControlPersist=30" in opts
+        assert ssh.ssh_cmd("c2d", "kexec") == ["ssh", *opts, "c2d", "kexec"]
+        assert ssh.scp_cmd("bzImage", "root@lava:/srv/") == [
+            "scp",
+            *opts,
+            "bzImage",
+            "root@lava:/srv/",
+        ]
+        wrapped = ssh.wrap_shell("scp bzImage c2d:/tmp")
+        assert wrapped.endswith("; scp bzImage c2d:/tmp")
+        assert "command scp -o ControlMaster=auto" in wrapped
+
+    assert ssh.current() is None
+    assert closed == ["c2d", "root@lava"]
@@ -0,0 +1,62 @@
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+from srt_build import helpers, jobserver
+
+pytestmark = pytest.mark.skipif(shutil.which("make") is None, reason="needs make")
+
+MAKEFILE = """\
+all: t1 t2 t3 t4
+t%:
+\t@echo "start $$(date +%s.%N)" >> {log}; sleep 0.3; echo "end $$(date +%s.%N)" >> {log}
+"""
+
+
+def _max_overlap(log):
+    events = []
+    for line in log.read_text().splitlines():
+        kind, stamp = line.split()
+        events.append((float(stamp), 1 if kind == "start" else -1))
+    running = peak = 0
+    for _, delta in sorted(events, key=lambda e: (e[0], e[1])):
+        running += delta
+        peak = max(peak, running)
+    return peak
+
+
+def test_jobserver_env():
+    with jobserver.Jobserver(slots=4, clients=2) as js:
+        assert jobserver.current() is js
+        env = js.env({"MAKEFLAGS": "-s"})
+        assert env["MAKEFLAGS"] == f"-s -j4 --jobserver-auth={js.rfd},{js.wfd}"
+        # one implicit slot per make
+        os.set_blocking(js.rfd, False)
+        assert os.read(js.rfd, 16) == b"++"
+    assert jobserver.current() is None
+
+
+def test_parallel_makes_share_job_slots(tmp_path, monkeypatch):
+    log = tmp_path / "jobs.log"
+    (tmp_path / "Makefile").write_text(MAKEFILE.format(log=log))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(os, "cpu_count", lambda: 3)
+
+    def make(name):
+        ctx = SimpleNamespace(
+            build_path=str(tmp_path / name),
+            log_path=str(tmp_path / "logs"),
+            CROSS_COMPILE=None,
+            CC=None,
+            args=SimpleNamespace(flavor=name),
+        )
+        # -j8 is dropped in favour of the jobserver
+        return helpers.run_make(ctx, ["-j8", "all"])[0]
+
+    with helpers.build_pool(2) as pool:
+        assert list(pool.map(make, ["rt", "up"])) == [0, 0]
+
+    # two makes with -j8 each, but only 3 slots in total
+    assert 2 <= _max_overlap(log) <= 3
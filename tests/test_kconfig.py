@@ -0,0 +1,153 @@
+import os
+from types import SimpleNamespace
+
+from srt_build import kconfig
+from srt_build.commands import cmd_config
+
+
+def test_parse_config(tmp_path):
+    cfg = tmp_path / ".config"
+    cfg.write_text(
+        "# comment\n"
+        "CONFIG_A=y\n"
+        "# CONFIG_B is not set\n"
+        'CONFIG_C="foo bar"\n'
+        "CONFIG_A=m\n"
+    )
+    assert kconfig.parse_config(cfg) == {
+        "CONFIG_A": "m",
+        "CONFIG_B": "n",
+        "CONFIG_C": '"foo bar"',
+    }
+
+
+def test_requested_mismatches(tmp_path):
+    frag1 = tmp_path / "a.config"
+    frag1.write_text("CONFIG_A=y\nCONFIG_B=y\n# CONFIG_D is not set\n")
+    frag2 = tmp_path / "b.config"
+    frag2.write_text("CONFIG_B=m\nCONFIG_E=y\n")
+    cfg = tmp_path / ".config"
+    cfg.write_text("CONFIG_A=y\n# CONFIG_B is not set\n")
+
+    mismatches = kconfig.requested_mismatches([frag1, frag2], cfg)
+    assert mismatches == [
+        ("CONFIG_B", "m", "n", frag2),
+        ("CONFIG_E", "y", None, frag2),
+    ]
+
+
+def test_merge(tmp_path):
+    frag1 = tmp_path / "a.config"
+    frag1.write_text("CONFIG_A=y\n# CONFIG_B is not set\n")
+    frag2 = tmp_path / "b.config"
+    frag2.write_text("CONFIG_A=m\n")
+    base = {"CONFIG_B": "y", "CONFIG_C": "y"}
+
+    merged = kconfig.merge(base, [frag1, frag2])
+    assert merged == {"CONFIG_A": "m", "CONFIG_B": "n", "CONFIG_C": "y"}
+    assert base == {"CONFIG_B": "y", "CONFIG_C": "y"}
+
+    out = tmp_path / ".config"
+    kconfig.write_config(out, merged)
+    assert kconfig.parse_config(out) == merged
+    assert "# CONFIG_B is not set\n" in out.read_text()
+
+
+def test_kernel_version(tmp_path):
+    makefile = tmp_path / "Makefile"
+    makefile.write_text(
+        "# SPDX\nVERSION = 6\nPATCHLEVEL = 12\nSUBLEVEL = 0\n"
+        "EXTRAVERSION = -rc3\nNAME = Baby Opossum Posse\n"
+    )
+    assert kconfig.kernel_version(makefile) == "6.12.0-rc3"
+    assert kconfig.kernel_version(tmp_path / "missing") is None
+
+
+def test_cache_key(tmp_path):
+    frag = tmp_path / "a.config"
+    frag.write_text("CONFIG_A=y\n")
+    key = kconfig.cache_key("defconfig", None, [frag], "6.12")
+    assert key == kconfig.cache_key("defconfig", None, [frag], "6.12")
+    assert key != kconfig.cache_key("defconfig", None, [frag], "6.13")
+    assert key != kconfig.cache_key("tinyconfig", None, [frag], "6.12")
+    frag.write_text("CONFIG_A=m\n")
+    assert key != kconfig.cache_key("defconfig", None, [frag], "6.12")
+
+
+def test_config_cache(tmp_path):
+    cache = kconfig.ConfigCache(str(tmp_path / "cache"))
+    src = tmp_path / "src.config"
+    src.write_text("CONFIG_A=y\n")
+    dest = tmp_path / "build" / ".config"
+
+    assert not cache.restore("k", str(dest))
+    cache.store("k", str(src))
+    assert cache.restore("k", str(dest))
+    assert dest.read_text() == "CONFIG_A=y\n"
+
+
+def _config_ctx(tmp_path, frags, **args):
+    config_path = tmp_path / "configs"
+    config_path.mkdir()
+    for name, text in frags.items():
+        (config_path / name).write_text(text)
+    return SimpleNamespace(
+        args=SimpleNamespace(config_base="", flavor="rt", **args),
+        build_path=str(tmp_path / "build"),
+        config_path=str(config_path),
+        config="machine.config",
+        defconfig="defconfig",
+        kconfig_cache_path=str(tmp_path / "cache"),
+        ARCH="arm64",
+        CROSS_COMPILE="aarch64-linux-gnu-",
+        CC="gcc",
+    )
+
+
+def test_cmd_config_single_olddefconfig_and_cache(tmp_path, monkeypatch):
+    ctx = _config_ctx(
+        tmp_path,
+        {"machine.config": "CONFIG_A=y\n", "rt.config": "CONFIG_PREEMPT_RT=y\n"},
+    )
+    kernel_config = {"rt": ["rt.config"]}
+    calls = []
+
+    def fake_run_make(ctx, args):
+        calls.append(args)
+        if args == ["defconfig"]:
+            os.makedirs(ctx.build_path, exist_ok=True)
+            with open(ctx.build_path + "/.config", "w") as f:
+                f.write("CONFIG_A=m\nCONFIG_B=y\n")
+        return (0, "")
+
+    monkeypatch.setattr(cmd_config, "run_make", fake_run_make)
+
+    assert cmd_config.cmd_config(ctx, kernel_config) == 0
+    assert calls == [["defconfig"], ["olddefconfig"]]
+    resolved = kconfig.parse_config(ctx.build_path + "/.config")
+    assert resolved == {"CONFIG_A": "y", "CONFIG_B": "y", "CONFIG_PREEMPT_RT": "y"}
+
+    # Same inputs: the resolved config comes from the cache, no kconfig
+    os.unlink(ctx.build_path + "/.config")
+    calls.clear()
+    assert cmd_config.cmd_config(ctx, kernel_config) == 0
+    assert calls == []
+    assert kconfig.parse_config(ctx.build_path + "/.config") == resolved
+
+    # --no-config-cache always runs kconfig
+    ctx.args.no_config_cache = True
+    assert cmd_config.cmd_config(ctx, kernel_config) == 0
+    assert calls == [["defconfig"], ["olddefconfig"]]
+
+
+def test_cmd_config_failure_not_cached(tmp_path, monkeypatch):
+    ctx = _config_ctx(tmp_path, {"machine.config": "CONFIG_A=y\n"})
+
+    def fake_run_make(ctx, args):
+        os.makedirs(ctx.build_path, exist_ok=True)
+        open(ctx.build_path + "/.config", "a").close()
+        return (2, "") if args == ["olddefconfig"] else (0, "")
+
+    monkeypatch.setattr(cmd_config, "run_make", fake_run_make)
+    assert cmd_config.cmd_config(ctx, {}) == 2
+    assert not os.path.exists(ctx.kconfig_cache_path)
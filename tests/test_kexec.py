@@ -0,0 +1,165 @@
+from types import SimpleNamespace
+
+import pytest
+
+from srt_build import database
+from srt_build.commands import cmd_kexec
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(cmd_kexec.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(cmd_kexec.time, "sleep", sleep)
+    return sleeps
+
+
+def states(monkeypatch, *answers):
+    answers = list(answers)
+    calls = []
+
+    def boot_state(argv):
+        calls.append(argv)
+        return answers.pop(0) if len(answers) > 1 else answers[0]
+
+    monkeypatch.setattr(cmd_kexec, "_boot_state", boot_state)
+    return calls
+
+
+def test_wait_for_kernel_backoff(monkeypatch, clock):
+    calls = states(
+        monkeypatch, None, ("old", "6.1.0"), None, None, ("new", "6.6.0-rt1")
+    )
+    assert cmd_kexec.wait_for_kernel("bbb", "old", 60, delay=1, max_delay=4) == (
+        "6.6.0-rt1",
+        111.0,
+    )
+    assert clock == [1, 2, 4, 4]
+    assert "ControlPath=none" in calls[0]
+    assert calls[0][-2:] == ["bbb", cmd_kexec.BOOT_ID]
+
+
+def test_wait_for_kernel_polls_at_least_every_second(monkeypatch, clock):
+    states(monkeypatch, *[None] * 8, ("new", "6.6.0-rt1"))
+    assert cmd_kexec.wait_for_kernel("bbb", "old", 60) == ("6.6.0-rt1", 106.75)
+    assert clock == [0.25, 0.5] + [1.0] * 6
+
+
+def test_wait_for_kernel_timeout(monkeypatch, clock):
+    states(monkeypatch, ("old", "6.1.0"))
+    assert cmd_kexec.wait_for_kernel("bbb", "old", 10) is None
+    assert sum(clock) <= 10
+
+
+def test_built_release(tmp_path):
+    ctx = SimpleNamespace(build_path=str(tmp_path))
+    assert cmd_kexec.built_release(ctx) is None
+    (tmp_path / "include" / "config").mkdir(parents=True)
+    (tmp_path / "include" / "config" / "kernel.release").write_text("6.6.0-rt1\n")
+    assert cmd_kexec.built_release(ctx) == "6.6.0-rt1"
+
+
+def test_boot_times_db(tmp_path):
+    config = {"database-path": str(tmp_path / "jobs.db")}
+    database.init_database(config)
+    assert database.get_boot_times_from_db("bbb", "6.6.0", config) == []
+    for seconds in (12.0, 14.5, 13.0):
+        database.save_boot_time_to_db("bbb", "6.6.0", "rt", seconds, config)
+    database.save_boot_time_to_db("bbb", "6.1.0", None, 30.0, config)
+    rows = database.get_boot_times_from_db("bbb", "6.6.0", config, limit=2)
+    assert [r[2] for r in rows] == [13.0, 14.5]
+    assert rows[0][:2] == ("6.6.0", "rt")
+
+
+def kexec_ctx(tmp_path, **args):
+    ctx = SimpleNamespace(
+        hostname="bbb",
+        kexec=None,
+        rootfs="/dev/mmcblk0p2",
+        cmdline="root={rootfs} console=ttyO0",
+        dtb="arch/arm/boot/dts/bbb.dtb",
+        image="arch/arm/boot/zImage",
+        build_path=str(tmp_path),
+        args=SimpleNamespace(
+            machine="bbb", rootfs="", append="", wait=True, wait_timeout=60, **args
+        ),
+    )
+    ctx.copy = lambda: SimpleNamespace(args=SimpleNamespace())
+    (tmp_path / "include" / "config").mkdir(parents=True)
+    (tmp_path / "include" / "config" / "kernel.release").write_text("6.6.0-rt1\n")
+    return ctx
+
+
+def test_kexec_cmd(tmp_path):
+    ctx = kexec_ctx(tmp_path)
+    ctx.args.append = "quiet"
+    argv = cmd_kexec.kexec_cmd(ctx, wait=True)
+    assert argv[:2] == ["ssh", "-o"]
+    assert "ServerAliveInterval=2" in argv
+    assert argv[-3:] == [
+        "--append='root=/dev/mmcblk0p2 console=ttyO0 quiet'",
+        "--dtb=/tmp/bbb.dtb",
+        "/tmp/zImage",
+    ]
+
+
+def test_cmd_kexec_wait(tmp_path, monkeypatch, clock, capsys):
+    config = {"database-path": str(tmp_path / "jobs.db")}
+    database.init_database(config)
+    database.save_boot_time_to_db("bbb", "6.6.0-rt1", None, 20.0, config)
+    monkeypatch.setattr(cmd_kexec, "cmd_install", lambda ctx: 0)
+
+    async def kexec(argv, **kwargs):
+        assert argv[-1] == "/tmp/zImage"
+        return (255, "Connection to bbb closed by remote host.")
+
+    monkeypatch.setattr(cmd_kexec, "run_cmd_async", kexec)
+    states(monkeypatch, ("old", "6.1.0"), None, ("new", "6.6.0-rt1"))
+
+    assert cmd_kexec.cmd_kexec(kexec_ctx(tmp_path), config) == 0
+    assert "is up with 6.6.0-rt1 after 0.2s (median of last 1: 20.0s)" in (
+        capsys.readouterr().out
+    )
+    rows = database.get_boot_times_from_db("bbb", "6.6.0-rt1", config)
+    assert [r[2] for r in rows] == [0.25, 20.0]
+
+
+def test_cmd_kexec_wait_wrong_release(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(cmd_kexec, "cmd_install", lambda ctx: 0)
+
+    async def kexec(argv, **kwargs):
+        return (255, "")
+
+    monkeypatch.setattr(cmd_kexec, "run_cmd_async", kexec)
+    states(monkeypatch, ("old", "6.1.0"), ("new", "6.1.0"))
+    assert cmd_kexec.cmd_kexec(kexec_ctx(tmp_path)) == 1
+
+
+def test_cmd_kexec_wait_needs_boot_id(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(cmd_kexec, "cmd_install", lambda ctx: 0)
+    kexecs = []
+
+    async def kexec(argv, **kwargs):
+        kexecs.append(argv)
+        return (255, "")
+
+    monkeypatch.setattr(cmd_kexec, "run_cmd_async", kexec)
+    states(monkeypatch, None, ("old", "6.6.0-rt1"))
+    assert cmd_kexec.cmd_kexec(kexec_ctx(tmp_path)) == 1
+    assert kexecs == []
+
+
+def test_cmd_kexec_stops_after_failed_install(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmd_kexec, "cmd_install", lambda ctx: 2)
+    monkeypatch.setattr(cmd_kexec, "run_cmd", pytest.fail)
+    monkeypatch.setattr(cmd_kexec, "_boot_state", pytest.fail)
+    ctx = kexec_ctx(tmp_path)
+    assert cmd_kexec.cmd_kexec(ctx) == 2
+    ctx.args.wait = False
+    assert cmd_kexec.cmd_kexec(ctx) == 2
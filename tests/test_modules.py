@@ -0,0 +1,73 @@
+import os
+import tarfile
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from srt_build import helpers, modules
+
+JOB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "jobs"))
+TEMPLATE = os.path.join(JOB_PATH, "rt", "smoke", "0005-cyclictest.jinja2")
+
+
+@pytest.fixture
+def build(tmp_path):
+    ko = tmp_path / "build" / "mods" / "lib" / "modules" / "6.12.0-rt" / "a.ko"
+    ko.parent.mkdir(parents=True)
+    ko.write_text("module")
+    return tmp_path / "build"
+
+
+def test_compression_of():
+    assert modules.compression_of("/srv/bbb-modules-rt.tar.xz") == "xz"
+    assert modules.compression_of("bbb-modules.tar.zst") == "zstd"
+    assert modules.compression_of("/") is None
+
+
+def test_deploy_stores_tarball(tmp_path, build):
+    ctx = SimpleNamespace(modules_compression=None)
+    dest = tmp_path / "srv" / "bbb-modules-rt.tar.gz"
+    dest.parent.mkdir()
+    assert modules.deploy(ctx, str(dest), str(build)) == 0
+    with tarfile.open(dest) as t:
+        assert "lib/modules/6.12.0-rt/a.ko" in t.getnames()
+    assert not os.path.exists(str(dest) + ".tmp")
+
+
+def test_deploy_unpacks_into_directory(tmp_path, build, monkeypatch):
+    monkeypatch.setattr(modules.shutil, "which", lambda cmd: cmd == "gzip")
+    ctx = SimpleNamespace(modules_compression="zstd")
+    root = tmp_path / "target"
+    root.mkdir()
+    assert modules.deploy(ctx, str(root), str(build)) == 0
+    assert (root / "lib/modules/6.12.0-rt/a.ko").read_text() == "module"
+
+
+def test_deploy_fails_without_modules(tmp_path):
+    ctx = SimpleNamespace(modules_compression=None)
+    assert modules.deploy(ctx, str(tmp_path / "m.tar.xz"), str(tmp_path)) == 1
+
+
+def test_deploy_script_streams_over_ssh():
+    script = modules.deploy_script("/b/mods", "root@lava", "/srv/m-rt.tar.xz", "xz")
+    assert script.startswith("tar -C /b/mods -cf - lib | xz -T0 | ssh root@lava ")
+    assert "cat > /srv/m-rt.tar.xz.tmp && mv" in script
+
+
+def test_job_deploys_modules():
+    job_ctx = helpers.load_job_ctx(os.path.join(JOB_PATH, "boards", "c2d.yaml"))
+    job_ctx["tags"] = ["c2d"]
+    job_ctx["modules_url"] = "http://lava.lan:8080/artifacts/c2d/c2d-modules{}.tar.xz"
+
+    modules.set_job_vars(job_ctx, "-rt", True)
+    job = yaml.safe_load(helpers.generate_job(JOB_PATH, TEMPLATE, job_ctx))
+    deploy = job["actions"][0]["deploy"]
+    assert deploy["modules"] == {
+        "url": "http://lava.lan:8080/artifacts/c2d/c2d-modules-rt.tar.xz",
+        "compression": "xz",
+    }
+
+    modules.set_job_vars(job_ctx, "-rt", False)
+    job = yaml.safe_load(helpers.generate_job(JOB_PATH, TEMPLATE, job_ctx))
+    assert "modules" not in job["actions"][0]["deploy"]
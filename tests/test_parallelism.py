@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from srt_build import parallelism
+
+
+def _cgroup(tmp_path, files):
+    proc = tmp_path / "cgroup"
+    proc.write_text("0::/ci.slice/runner-1\n")
+    for rel, text in files.items():
+        path = tmp_path / "fs" / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+    return str(tmp_path / "fs"), str(proc)
+
+
+def test_cgroup_cpu_quota_takes_tightest_limit(tmp_path):
+    root, proc = _cgroup(
+        tmp_path,
+        {
+            "cpu.max": "max 100000\n",
+            "ci.slice/cpu.max": "1600000 100000\n",
+            "ci.slice/runner-1/cpu.max": "800000 100000\n",
+        },
+    )
+    assert parallelism.cgroup_cpu_quota(root, proc) == 8.0
+
+
+def test_cgroup_cpu_quota_unlimited(tmp_path):
+    root, proc = _cgroup(tmp_path, {"ci.slice/runner-1/cpu.max": "max 100000\n"})
+    assert parallelism.cgroup_cpu_quota(root, proc) is None
+    assert parallelism.cgroup_cpu_quota(root, str(tmp_path / "missing")) is None
+
+
+def test_available_memory(tmp_path):
+    root, proc = _cgroup(
+        tmp_path,
+        {
+            "ci.slice/runner-1/memory.max": str(4 << 30),
+            "ci.slice/runner-1/memory.current": str(1 << 30),
+        },
+    )
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal: 67108864 kB\nMemAvailable: 33554432 kB\n")
+    assert parallelism.available_memory(str(meminfo), root, proc) == 3 << 30
+
+
+def test_auto_jobs(monkeypatch):
+    monkeypatch.setattr(parallelism, "affinity_cpus", lambda: 128)
+    monkeypatch.setattr(parallelism, "cgroup_cpu_quota", lambda: 7.5)
+    monkeypatch.setattr(parallelism, "available_memory", lambda: 64 << 30)
+    assert parallelism.auto_jobs() == 8
+
+    monkeypatch.setattr(parallelism, "available_memory", lambda: 2 << 30)
+    assert parallelism.auto_jobs(mem_per_job=1024) == 2
+
+    monkeypatch.setattr(parallelism, "available_memory", lambda: 0)
+    assert parallelism.auto_jobs() == 1
+
+
+def test_machine_overrides(monkeypatch):
+    monkeypatch.setattr(parallelism, "auto_jobs", lambda mem: 4)
+    system_config = {"build-load-average": 12}
+    assert parallelism.build_jobs({}, system_config) == 4
+    assert parallelism.build_jobs({}, {"build-jobs": 16}) == 16
+    assert parallelism.build_jobs({"jobs": 8}, {"build-jobs": 16}) == 8
+    assert parallelism.load_average({}, system_config) == 12
+    assert parallelism.load_average({"load_average": 6}, system_config) == 6
+
+    ctx = SimpleNamespace(jobs=8, load_average=6)
+    assert parallelism.make_args(ctx) == ["-j8", "-l6"]
+    ctx = SimpleNamespace(jobs=8, load_average=None)
+    assert parallelism.make_args(ctx) == ["-j8"]
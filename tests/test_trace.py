@@ -0,0 +1,57 @@
+import json
+import sys
+
+import pytest
+
+from srt_build import core, trace
+
+
+@pytest.fixture
+def tracefile(tmp_path):
+    path = tmp_path / "trace.json"
+    trace.start(str(path))
+    yield path
+    trace._events = None
+    trace._named_tids.clear()
+
+
+def _spans(path):
+    with open(path) as f:
+        return [e for e in json.load(f)["traceEvents"] if e["ph"] == "X"]
+
+
+def test_spans_are_written_as_chrome_trace(tracefile):
+    @trace.traced(cat="test")
+    def work():
+        return 42
+
+    with trace.span("outer", "test", flavor="rt") as args:
+        assert work() == 42
+        args["result"] = "ok"
+    trace.write()
+
+    spans = {e["name"]: e for e in _spans(tracefile)}
+    assert spans["outer"]["args"] == {"flavor": "rt", "result": "ok"}
+    assert spans["work"]["cat"] == "test"
+    outer, inner = spans["outer"], spans["work"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+
+
+def test_concurrent_commands_get_their_own_lanes(tracefile, tmp_path):
+    script = tmp_path / "sleep.py"
+    script.write_text("import time; time.sleep(0.2)")
+    core.run_cmds([[sys.executable, str(script)]] * 3, limit=3)
+    trace.write()
+
+    cmds = [e for e in _spans(tracefile) if e["cat"] == "cmd"]
+    assert len(cmds) == 3
+    assert len({e["tid"] for e in cmds}) == 3
+    assert all(e["args"]["ret"] == "0" for e in cmds)
+
+
+def test_span_is_noop_when_disabled():
+    assert not trace.enabled()
+    with trace.span("nothing") as args:
+        args["x"] = 1
+    assert trace._events is None